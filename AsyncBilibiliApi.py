@@ -0,0 +1,323 @@
+import asyncio
+import os
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+import aiohttp
+
+from CookieStore import cookie_store
+from BilibiliApi import REVALIDATE_AFTER, WBI_REJECT_CODES, expected_size, playurl_cache
+import HttpClient as http
+from HttpClient import DEFAULT_HEADERS
+from wbiSigned import wbi_keys
+from MediaStore import media_store
+from MetadataCache import metadata_cache
+from RateLimiter import INTERACTIVE_MAX_WAIT, jittered_backoff, rate_limiter
+
+
+class AsyncBilibiliClient:
+    """基于 asyncio 的 Bilibili API 客户端
+
+    与 BilibiliApi 中的阻塞类并存：所有请求共用一个 aiohttp 会话，
+    并发数由 max_concurrency 限制，未完成的请求可以通过 cancel_all 取消。
+    api_base / passport_base 可以指向本地替身服务器。
+    """
+
+    def __init__(self, max_concurrency=8, timeout=30,
+                 api_base="https://api.bilibili.com",
+                 passport_base="https://passport.bilibili.com"):
+        self.max_concurrency = max_concurrency
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.api_base = api_base.rstrip("/")
+        self.passport_base = passport_base.rstrip("/")
+        self._session = None
+        self._semaphore = None
+        self._tasks = set()
+        self._inflight = {}
+        self._waiters = {}  # 共享任务 -> 正在等待它的调用方数
+
+    async def _get_session(self):
+        # aiohttp 会话和信号量必须在运行中的事件循环里创建
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=DEFAULT_HEADERS,
+                timeout=self.timeout,
+                cookie_jar=aiohttp.DummyCookieJar(),
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency * 2),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    def _request_headers(self):
+        cookie_header = cookie_store.header()
+        return {"Cookie": cookie_header} if cookie_header else {}
+
+    async def _tracked(self, coro):
+        """登记当前任务，便于 cancel_all 统一取消"""
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            return await coro
+        finally:
+            self._tasks.discard(task)
+
+    async def _coalesce(self, key, endpoint, factory):
+        """相同 key 的并发请求共享同一个任务，计数与阻塞接口共用
+
+        某个调用方被取消时不影响其他等待者；最后一个等待者被取消时取消共享任务，
+        底层请求随之中止。
+        """
+        task = self._inflight.get(key)
+        http.single_flight.record(endpoint, task is not None)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            self._waiters[task] = 0
+
+            def done(finished):
+                if self._inflight.get(key) is finished:
+                    del self._inflight[key]
+                self._waiters.pop(finished, None)
+
+            task.add_done_callback(done)
+        self._waiters[task] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters.get(task) == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            if task in self._waiters:
+                self._waiters[task] -= 1
+
+    async def _sign(self, params):
+        # 密钥过期时需要请求 nav，放到线程池里避免阻塞事件循环
+        if wbi_keys.is_fresh():
+            return wbi_keys.sign(params or {})
+        return await asyncio.get_running_loop().run_in_executor(None, wbi_keys.sign, params or {})
+
+    async def _get_json(self, url, params=None):
+        session = await self._get_session()
+        signed = "/wbi/" in url
+        for attempt in range(2):
+            request_params = await self._sign(params) if signed else params
+            # 界面请求：需要等待太久时 reserve 直接抛出 RateLimitedError，不占用事件循环
+            wait = rate_limiter.reserve(url, max_wait=INTERACTIVE_MAX_WAIT)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                async with self._semaphore:
+                    async with session.get(url, params=request_params, headers=self._request_headers()) as response:
+                        if not response.ok:
+                            rate_limiter.report(url, status=response.status)
+                        response.raise_for_status()
+                        info = await response.json(content_type=None)
+            except BaseException:
+                rate_limiter.report_error(url)
+                raise
+            rate_limiter.report(url, status=response.status, code=info.get("code"))
+            # 签名被拒绝时刷新密钥重试一次
+            if signed and attempt == 0 and info.get("code") in WBI_REJECT_CODES:
+                wbi_keys.invalidate()
+                continue
+            return info
+
+    async def get_json(self, url, params=None):
+        key = (url, tuple(sorted((params or {}).items())), cookie_store.header())
+        return await self._tracked(self._coalesce(key, urlparse(url).path, lambda: self._get_json(url, params)))
+
+    # 视频信息
+    async def _fetch_view(self, id):
+        if id[0:2] == "BV":
+            url = f"{self.api_base}/x/web-interface/view"
+            params = {"bvid": id}
+        else:
+            url = f"{self.api_base}/x/web-interface/wbi/view"
+            params = {"avid": id}
+        info = await self.get_json(url, params)
+        if info.get("code") != 0:
+            return None
+        data = info.get("data", {})
+        metadata_cache.put(data)
+        return data
+
+    async def view(self, id, use_cache=True, require_full=False):
+        if use_cache:
+            loop = asyncio.get_running_loop()
+            # 过期条目在事件循环中后台刷新
+            revalidate = lambda: asyncio.run_coroutine_threadsafe(self._fetch_view(id), loop).result()
+            data = metadata_cache.get(id, require_full=require_full, revalidate=revalidate)
+            if data is not None:
+                return data
+        return await self._fetch_view(id)
+
+    # 播放地址，fnval=1 为MP4，4048 为DASH
+    async def playurl(self, bvid, cid, qn=112, fnval=1, force=False):
+        # 与阻塞接口共用 playurl 缓存
+        if not force:
+            data = playurl_cache.peek(bvid, cid, qn, fnval)
+            if data is not None:
+                return data
+        url = f"{self.api_base}/x/player/wbi/playurl"
+        params = {"bvid": bvid, "cid": cid, "qn": qn, "fnval": fnval}
+        info = await self.get_json(url, params)
+        if info.get("code") != 0:
+            return None
+        data = info.get("data", {})
+        playurl_cache.put(bvid, cid, qn, fnval, data)
+        return data
+
+    # 首页推荐
+    async def feed_rcmd(self, page=1, pagesize=20):
+        url = f"{self.api_base}/x/web-interface/wbi/index/top/feed/rcmd"
+        info = await self.get_json(url, {"page": page, "pagesize": pagesize})
+        if info.get("code") != 0:
+            return None
+        items = info.get("data", {}).get("item", [])
+        metadata_cache.seed_from_feed(items)
+        return items
+
+    # 用户信息
+    async def nav(self):
+        info = await self.get_json(f"{self.api_base}/x/web-interface/nav")
+        if info.get("code", 0) != 0:
+            return None
+        return info.get("data", {})
+
+    # 二维码登录
+    async def qrcode_generate(self):
+        info = await self.get_json(f"{self.passport_base}/x/passport-login/web/qrcode/generate")
+        data = info.get("data", {})
+        return data.get("url", ""), data.get("qrcode_key", "")
+
+    async def _qrcode_poll(self, qrcode_key):
+        session = await self._get_session()
+        url = f"{self.passport_base}/x/passport-login/web/qrcode/poll"
+        async with self._semaphore:
+            async with session.get(url, params={"qrcode_key": qrcode_key}) as response:
+                response.raise_for_status()
+                info = await response.json(content_type=None)
+                cookies = [
+                    SimpleNamespace(
+                        name=morsel.key,
+                        value=morsel.value,
+                        secure=bool(morsel["secure"]),
+                        expires=None,
+                    )
+                    for morsel in response.cookies.values()
+                ]
+
+        code = info.get("data", {}).get("code", 0)
+        # 只有登录成功时服务器才会下发Cookie
+        if cookies:
+            cookie_store.save(cookies)
+        return code
+
+    async def qrcode_poll(self, qrcode_key):
+        """轮询扫码状态，返回状态码（0 为登录成功）"""
+        return await self._tracked(self._qrcode_poll(qrcode_key))
+
+    # 下载封面、头像等小文件
+    async def _fetch_to(self, url, tmp_path, max_retries=3, headers=None):
+        """下载到 tmp_path，返回 (状态码, 响应头)；长度与 Content-Length 不符视为失败，全部失败时返回 None
+
+        headers 为附加请求头（例如条件请求头），服务器返回 304 时不写 tmp_path。
+        """
+        session = await self._get_session()
+        request_headers = dict(self._request_headers(), **(headers or {}))
+        for attempt in range(max_retries):
+            try:
+                async with self._semaphore:
+                    async with session.get(url, headers=request_headers) as response:
+                        if response.status == 304:
+                            return 304, dict(response.headers)
+                        response.raise_for_status()
+                        written = 0
+                        with open(tmp_path, "wb") as f:
+                            async for chunk in response.content.iter_chunked(64 * 1024):
+                                f.write(chunk)
+                                written += len(chunk)
+                        expected = expected_size(response.headers)
+                        if expected is not None and expected != written:
+                            raise Exception(f"数据不完整 {written}/{expected}")
+                        return response.status, dict(response.headers)
+            except asyncio.CancelledError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            except Exception as e:
+                print(f"下载失败 ({attempt+1}/{max_retries}): {str(e)}")
+                if attempt + 1 < max_retries:
+                    await asyncio.sleep(jittered_backoff(attempt))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    async def _download(self, url, save_path, max_retries=3):
+        tmp_path = save_path + ".part"
+        if await self._fetch_to(url, tmp_path, max_retries) is None:
+            return False
+        os.replace(tmp_path, save_path)
+        return True
+
+    async def download(self, url, save_path, max_retries=3, endpoint="download"):
+        key = ("download", url, save_path)
+        return await self._tracked(self._coalesce(key, endpoint, lambda: self._download(url, save_path, max_retries)))
+
+    async def _download_to_store(self, url, kind, max_retries=3):
+        # 存储中已有且未到确认时间时不再请求，之后发条件请求
+        entry = media_store.lookup(kind, url)
+        if entry is not None and media_store.is_fresh(entry, REVALIDATE_AFTER):
+            return entry["path"]
+        loop = asyncio.get_running_loop()
+        tmp_path = await loop.run_in_executor(None, media_store.temp_path)
+        result = await self._fetch_to(url, tmp_path, max_retries, headers=media_store.conditional_headers(entry))
+        if result is None or result[0] == 304:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if result is None or entry is None:
+                # 全部失败时仍然使用旧文件；存储中没有时 304 没有可用的内容，视为未命中
+                return entry and entry["path"]
+            headers = result[1]
+            await loop.run_in_executor(None, lambda: media_store.touch(
+                kind, url, etag=headers.get("ETag"), last_modified=headers.get("Last-Modified"),
+            ))
+            return entry["path"]
+        headers = result[1]
+        return await loop.run_in_executor(None, lambda: media_store.put_file(
+            tmp_path, kind, url, url=url,
+            etag=headers.get("ETag"), last_modified=headers.get("Last-Modified"),
+        ))
+
+    async def download_to_store(self, url, kind, max_retries=3):
+        """下载到内容寻址存储，返回存储中的文件路径（失败时为 None）"""
+        key = ("store", kind, url)
+        return await self._tracked(self._coalesce(key, kind, lambda: self._download_to_store(url, kind, max_retries)))
+
+    async def download_cover(self, cover_url):
+        """返回封面在存储中的路径"""
+        return await self.download_to_store(cover_url, "cover")
+
+    async def download_user_face(self, save_path):
+        data = await self.nav()
+        if not data or not data.get("face"):
+            return False
+        if await self.download_to_store(data["face"], "face") is None:
+            return False
+        return media_store.materialize("face", data["face"], save_path) is not None
+
+    def cancel_all(self):
+        """取消所有进行中的请求（包括共享的底层请求）"""
+        for task in list(self._tasks) + list(self._inflight.values()):
+            task.cancel()
+
+    async def close(self):
+        self.cancel_all()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+# 模块级共享客户端（会话在首次使用它的事件循环中创建）
+async_client = AsyncBilibiliClient()
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class QtAsyncBridge(QObject):
+    """把 asyncio 事件循环桥接到 Qt
+
+    整个进程只有一个后台线程运行 asyncio 事件循环，GUI 通过 submit 提交协程，
+    结果回调总是在 Qt 主线程执行，不需要为每个请求单独开线程。
+    """
+
+    _deliver = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.loop = asyncio.new_event_loop()
+        self._deliver.connect(self._on_deliver)
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _on_deliver(self, callback):
+        callback()
+
+    def submit(self, coro, on_result=None, on_error=None):
+        """提交协程，返回可 cancel() 的 concurrent.futures.Future
+
+        on_result(result) / on_error(exception) 在 Qt 主线程调用；
+        被取消的请求不会触发任何回调。
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+        def done(fut):
+            if fut.cancelled():
+                return
+            error = fut.exception()
+            if error is not None:
+                if on_error:
+                    self._deliver.emit(lambda: on_error(error))
+            elif on_result:
+                result = fut.result()
+                self._deliver.emit(lambda: on_result(result))
+
+        future.add_done_callback(done)
+        return future
+
+    def call_in_main(self, callback):
+        """在 Qt 主线程执行 callback（可从任意线程调用）"""
+        self._deliver.emit(callback)
+
+    def run_sync(self, coro, timeout=None):
+        """在后台事件循环中执行协程并阻塞等待结果（用于非GUI代码）"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=1)
+
+
+_bridge = None
+
+
+def get_bridge():
+    """返回进程内共享的桥接器（需在 QApplication 创建后调用）"""
+    global _bridge
+    if _bridge is None:
+        _bridge = QtAsyncBridge()
+    return _bridge
@@ -0,0 +1,184 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from BilibiliApi import GetVideoInfo, resolve_playurl
+from DownloadManager import ACTIVE_STATES, download_manager
+from RateLimiter import RateLimitedError
+
+
+# 默认的输出文件名模板（相对于 output_dir）
+# 可用字段：bvid, cid, title, part, page, index, season, section, owner
+DEFAULT_TEMPLATE = "{title}/P{page:02d} {part}.mp4"
+SEASON_TEMPLATE = "{season}/{index:03d} {title} - P{page:02d} {part}.mp4"
+
+_INVALID_CHARS = re.compile(r'[\\/:*?"<>|\r\n\t]')
+
+
+def sanitize_filename(name, max_length=80):
+    """去掉文件名中不允许的字符"""
+    name = _INVALID_CHARS.sub("_", str(name)).strip(" .")
+    return name[:max_length] or "_"
+
+
+class BatchDownloader:
+    """分P和合集的批量下载
+
+    expand_parts 把一个视频展开为所有分P，expand_season 把视频所属合集展开为
+    所有剧集（每集再展开分P）。视频信息并发获取（经过元数据缓存和限流器），
+    前 prefetch_playurls 个分P的播放地址同时预先解析；其余的播放地址在任务
+    开始时再解析，避免签名地址在长时间排队中过期。
+    展开后的分P按顺序加入共享的 DownloadManager，每个分P按模板命名输出文件。
+    被限流器拒绝的视频等待 retry_after 秒后重试，最多 throttle_retries 次。
+    """
+
+    def __init__(self, manager=None, output_dir="./downloads", max_resolvers=4, prefetch_playurls=4,
+                 throttle_retries=3):
+        self.manager = manager or download_manager
+        self.output_dir = output_dir
+        self.max_resolvers = max_resolvers
+        self.prefetch_playurls = prefetch_playurls
+        self.throttle_retries = throttle_retries
+
+    @staticmethod
+    def _video_info(bvid):
+        info = GetVideoInfo(bvid, None, require_full=True)
+        if not info.is_success():
+            raise Exception(f"获取视频信息失败 {bvid}: {info.info.get('message', '')}")
+        return info
+
+    @staticmethod
+    def _items_for(info, **extra):
+        data = info.info.get("data", {})
+        return [
+            dict({
+                "bvid": data.get("bvid", ""),
+                "cid": str(page["cid"]),
+                "title": data.get("title", ""),
+                "part": page["part"],
+                "page": page["page"],
+                "owner": data.get("owner", {}).get("name", ""),
+            }, **extra)
+            for page in info.get_pages()
+        ]
+
+    def expand_parts(self, bvid):
+        """展开一个视频的所有分P"""
+        return self._items_for(self._video_info(bvid))
+
+    def expand_season(self, bvid):
+        """展开视频所属合集的所有剧集；视频不属于合集时只展开它自己的分P"""
+        info = self._video_info(bvid)
+        season = info.get_ugc_season()
+        if not season:
+            return self._items_for(info)
+
+        episodes = season["episodes"]
+        with ThreadPoolExecutor(max_workers=self.max_resolvers) as pool:
+            infos = list(pool.map(lambda episode: self._video_info(episode["bvid"]), episodes))
+
+        items = []
+        for index, (episode, episode_info) in enumerate(zip(episodes, infos), start=1):
+            items.extend(self._items_for(
+                episode_info, index=index, season=season["title"], section=episode["section"]
+            ))
+        return items
+
+    def expand_many(self, bvids, season=False, failures=None):
+        """并发展开多个视频，按输入顺序返回所有分P（重复的分P只保留一个）
+
+        展开失败的视频跳过；给出 failures 列表时把 (BV 号, 错误信息) 追加到其中。
+        被限流的视频先等待重试，重试次数用完后才算失败。
+        """
+        expand = self.expand_season if season else self.expand_parts
+        with ThreadPoolExecutor(max_workers=self.max_resolvers) as pool:
+            results = list(pool.map(lambda bvid: self._safe_expand(expand, bvid, failures), bvids))
+
+        items, seen = [], set()
+        for result in results:
+            for item in result:
+                key = (item["bvid"], item["cid"])
+                if key not in seen:
+                    seen.add(key)
+                    items.append(item)
+        return items
+
+    def _safe_expand(self, expand, bvid, failures=None):
+        attempt = 0
+        while True:
+            try:
+                return expand(bvid)
+            except RateLimitedError as e:
+                # 限流不是视频本身的问题：等到限流器放行后再试
+                if attempt < self.throttle_retries:
+                    attempt += 1
+                    print(f"展开 {bvid} 被限流，{e.retry_after:.1f} 秒后重试 ({attempt}/{self.throttle_retries})")
+                    time.sleep(e.retry_after)
+                    continue
+                error = e
+            except Exception as e:
+                error = e
+            print(f"展开 {bvid} 失败: {str(error)}")
+            if failures is not None:
+                failures.append((bvid, str(error)))
+            return []
+
+    def output_path(self, item, template=None):
+        """按模板生成输出路径，每个字段都会去掉文件名中不允许的字符"""
+        if template is None:
+            template = SEASON_TEMPLATE if "season" in item else DEFAULT_TEMPLATE
+        fields = dict(item)
+        fields.setdefault("index", 1)
+        fields.setdefault("season", "")
+        fields.setdefault("section", "")
+        fields = {
+            key: sanitize_filename(value) if isinstance(value, str) else value
+            for key, value in fields.items()
+        }
+        return os.path.join(self.output_dir, template.format(**fields))
+
+    def prefetch(self, items):
+        """并发预解析前几个分P的播放地址（写入 playurl 缓存）"""
+        head = items[:self.prefetch_playurls]
+        if not head:
+            return
+
+        def resolve(item):
+            try:
+                resolve_playurl(item["bvid"], item["cid"], qn=112, fnval=4048)
+            except Exception as e:
+                print(f"预解析播放地址失败 {item['bvid']} P{item['page']}: {str(e)}")
+
+        with ThreadPoolExecutor(max_workers=self.max_resolvers) as pool:
+            list(pool.map(resolve, head))
+
+    def enqueue(self, bvids, season=False, template=None, priority=0, quality=None, skip_queued=False,
+                failures=None):
+        """展开并加入下载队列，返回 [(分P, 任务 id)]
+
+        skip_queued=True 时跳过队列中已有的未完成分P（例如中断后用同一个列表重新运行）。
+        展开失败的视频记录到 failures（见 expand_many）。
+        """
+        if isinstance(bvids, str):
+            bvids = [bvids]
+        items = self.expand_many(bvids, season=season, failures=failures)
+        if skip_queued:
+            queued = {(job["bvid"], str(job["cid"])) for job in self.manager.jobs(ACTIVE_STATES)}
+            items = [item for item in items if (item["bvid"], item["cid"]) not in queued]
+        self.prefetch(items)
+        job_ids = self.manager.enqueue_many([
+            {
+                "bvid": item["bvid"],
+                "cid": item["cid"],
+                "save_path": self.output_path(item, template),
+                "priority": priority,
+                "quality": quality,
+            }
+            for item in items
+        ])
+        return list(zip(items, job_ids))
+
+
+# 模块级共享实例，使用共享的下载队列
+batch_downloader = BatchDownloader()
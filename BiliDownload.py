@@ -0,0 +1,187 @@
+"""命令行批量下载（不依赖 PyQt5，可在无界面的机器上运行）
+
+    python -m BiliDownload BV1xx411c7mD BV1yy411c7mE
+    python -m BiliDownload -i list.txt -q 1080P -j 4 --limit 5M -o ./archive
+    cat list.txt | python -m BiliDownload --season -t "{season}/{index:03d} {title}.mp4"
+
+列表每行一个 BV 号或视频链接，# 之后为注释。任务保存在 --db 指定的队列中，
+中断后再次运行会继续未完成的任务（已下载的部分续传）。
+"""
+import argparse
+import re
+import sys
+import threading
+import time
+
+from BatchDownloader import BatchDownloader
+from CookieStore import cookie_store
+from DownloadManager import ACTIVE_STATES, DONE, FAILED, QUEUED, RUNNING, DownloadManager
+from MirrorStats import mirror_stats
+from ProgressReporter import format_size
+from RateLimiter import rate_limiter
+from StreamSelector import QN_1080P_PLUS, QN_4K, QUALITY_BY_LABEL
+
+
+BVID_PATTERN = re.compile(r"BV[0-9A-Za-z]{10}")
+
+QUALITY_CHOICES = dict(QUALITY_BY_LABEL, **{"1080P+": QN_1080P_PLUS, "4K": QN_4K, "AUTO": None})
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+# 命令行没有界面在等待，被限流的视频多等几轮再算失败
+THROTTLE_RETRIES = 10
+
+
+def parse_quality(value):
+    """清晰度：360P/480P/720P/1080P/1080P+/4K/auto 或 qn 数字"""
+    if value.isdigit():
+        return int(value)
+    key = value.upper()
+    if key not in QUALITY_CHOICES:
+        raise argparse.ArgumentTypeError(f"未知的清晰度: {value}")
+    return QUALITY_CHOICES[key]
+
+
+def parse_rate(value):
+    """带宽：字节/秒，可带 K/M/G 后缀，例如 500K、2M"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([KMG]?)(?:i?B)?(?:/s)?", value.strip(), re.IGNORECASE)
+    if not match:
+        raise argparse.ArgumentTypeError(f"无法解析带宽: {value}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def read_bvids(lines):
+    """从文本行中提取 BV 号（保持顺序、去重）"""
+    bvids = []
+    for line in lines:
+        line = line.split("#", 1)[0]
+        for bvid in BVID_PATTERN.findall(line):
+            if bvid not in bvids:
+                bvids.append(bvid)
+    return bvids
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="BiliDownload", description="批量下载 B 站视频（所有分P或整个合集）")
+    parser.add_argument("bvids", nargs="*", help="BV 号或视频链接；不指定且没有 -i 时从标准输入读取")
+    parser.add_argument("-i", "--input", action="append", default=[], metavar="FILE",
+                        help="BV 号列表文件，- 表示标准输入（可多次指定）")
+    parser.add_argument("-o", "--output", default="./downloads", help="输出目录（默认 ./downloads）")
+    parser.add_argument("-t", "--template", default=None,
+                        help="输出文件名模板，可用字段 bvid cid title part page index season section owner")
+    parser.add_argument("-q", "--quality", type=parse_quality, default=None,
+                        help="清晰度 360P/480P/720P/1080P/1080P+/4K/auto 或 qn（默认使用设置中的清晰度）")
+    parser.add_argument("-j", "--jobs", type=int, default=2, help="同时下载的任务数（默认 2）")
+    parser.add_argument("--limit", type=parse_rate, default=None, metavar="RATE",
+                        help="总带宽上限，例如 500K、2M（默认不限）")
+    parser.add_argument("--season", action="store_true", help="下载视频所属的整个合集")
+    parser.add_argument("--cookie", default=cookie_store.path, help="Cookie 文件（默认与界面共用）")
+    parser.add_argument("--db", default="./cache/cli-downloads.db", help="下载队列数据库")
+    parser.add_argument("--quiet", action="store_true", help="只输出任务完成和失败")
+    return parser
+
+
+class ConsoleReporter:
+    """把下载队列的事件输出到控制台，每个任务的进度最多 interval 秒一行"""
+
+    def __init__(self, quiet=False, interval=2.0):
+        self.quiet = quiet
+        self.interval = interval
+        self._printed = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event, job):
+        with self._lock:
+            if event == "state":
+                self._on_state(job)
+            elif event == "progress" and not self.quiet:
+                self._on_progress(job)
+
+    @staticmethod
+    def _name(job):
+        return job.get("save_path") or job["bvid"]
+
+    def _on_state(self, job):
+        if job["state"] == DONE:
+            print(f"[完成] {self._name(job)}")
+        elif job["state"] == FAILED:
+            print(f"[失败] {self._name(job)}: {job['error']}")
+        elif not self.quiet and job["state"] in ACTIVE_STATES:
+            print(f"[{job['state']}] {self._name(job)}")
+
+    def _on_progress(self, summary):
+        now = time.monotonic()
+        if now - self._printed.get(summary["id"], 0) < self.interval:
+            return
+        self._printed[summary["id"]] = now
+        parts = [format_size(summary["downloaded"])]
+        if summary["total"]:
+            parts[0] += f"/{format_size(summary['total'])} ({summary['downloaded'] / summary['total']:.1%})"
+        parts.append(f"{format_size(summary['rate'])}/s")
+        if summary["eta"] is not None:
+            parts.append(f"剩余 {summary['eta']:.0f}s")
+        print(f"[任务 {summary['id']}] " + "  ".join(parts))
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    cookie_store.path = args.cookie
+
+    lines = list(args.bvids)
+    sources = args.input or ([] if args.bvids else ["-"])
+    for source in sources:
+        if source == "-":
+            lines.extend(sys.stdin)
+        else:
+            with open(source, "r", encoding="utf-8") as f:
+                lines.extend(f)
+    bvids = read_bvids(lines)
+
+    manager = DownloadManager(db_path=args.db, output_dir=args.output,
+                              max_workers=max(1, args.jobs), bandwidth_limit=args.limit)
+    manager.add_listener(ConsoleReporter(quiet=args.quiet))
+    # 并发解析数不超过 view 接口的突发量，否则多出的请求只会被限流
+    resolvers = min(max(4, args.jobs), rate_limiter.limits["view"][1])
+    batch = BatchDownloader(manager, output_dir=args.output, max_resolvers=resolvers,
+                            throttle_retries=THROTTLE_RETRIES)
+
+    job_ids = []
+    failures = []
+    if bvids:
+        print(f"正在解析 {len(bvids)} 个视频...")
+        job_ids = [job_id for _, job_id in batch.enqueue(
+            bvids, season=args.season, template=args.template, quality=args.quality, skip_queued=True,
+            failures=failures
+        )]
+        print(f"已加入 {len(job_ids)} 个分P")
+    leftover = len(manager.jobs((QUEUED, RUNNING))) - len(job_ids)
+    if leftover > 0:
+        print(f"继续上次未完成的 {leftover} 个任务")
+    if not job_ids and leftover <= 0:
+        print("没有要下载的视频", file=sys.stderr)
+        # 给出了视频但全部展开失败
+        return 1 if bvids else 2
+
+    manager.start()
+    try:
+        # 等待队列中所有排队和运行中的任务结束（暂停的任务不等待）
+        while manager.jobs((QUEUED, RUNNING)):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        print("\n已中断，再次运行时继续下载", file=sys.stderr)
+        return 130
+
+    failed = [job for job in (manager.get(job_id) for job_id in job_ids) if job and job["state"] == FAILED]
+    print(f"完成 {len(job_ids) - len(failed)}/{len(job_ids)}")
+    if failures:
+        print(f"{len(failures)} 个视频解析失败: " + " ".join(bvid for bvid, _ in failures), file=sys.stderr)
+    return 1 if failed or failures else 0
+
+
+if __name__ == "__main__":
+    try:
+        status = main()
+    finally:
+        # 退出前保存镜像测速结果
+        mirror_stats.flush()
+    sys.exit(status)
@@ -3,9 +3,20 @@ import time
 
 import ffmpeg
 import qrcode
-import requests as rq
 import threading
 
+import HttpClient as http
+from CookieStore import cookie_store
+from DownloadManifest import DownloadManifest
+from MediaStore import media_store
+from MetadataCache import metadata_cache
+from MirrorStats import mirror_stats
+from PlayurlCache import PlayurlCache
+from ProgressReporter import ProgressReporter, log_event
+from RateLimiter import INTERACTIVE_MAX_WAIT, jittered_backoff, rate_limiter
+from SegmentedDownloader import DownloadCancelled, DownloadError, SegmentedDownloader
+from StreamMuxer import StreamMuxer, fetch_head, needs_seeking
+from StreamSelector import DEFAULT_CODECS, StreamSelector, load_default_quality, throughput_estimator
 import wbiSigned as wbi
 
 
@@ -19,36 +30,129 @@ for proxy_var in proxy_env_vars:
     os.environ.pop(proxy_var, None)  # 移除环境变量
 
 
+# 签名校验失败/风控拒绝时返回的 code
+WBI_REJECT_CODES = (-352, -403)
+
+
+def api_get(url, params=None, **kwargs):
+    """请求 api.bilibili.com，/wbi/ 接口自动附加 wbi 签名
+
+    签名被拒绝时刷新 wbi 密钥并重试一次。并发的相同请求（按未签名参数和
+    Cookie 区分）只发一次，返回的响应已读完，可以共享。
+    """
+    kwargs.setdefault("cookies", cookie_store.get())
+    return http.coalesce(url, params, kwargs["cookies"], lambda: _api_get(url, params, **kwargs))
+
+
+def _api_get(url, params, **kwargs):
+    if "/wbi/" not in url:
+        return _limited_get(url, params, **kwargs)
+
+    response = _limited_get(url, wbi.wbi_keys.sign(params or {}), **kwargs)
+    if _json_code(response) in WBI_REJECT_CODES:
+        wbi.wbi_keys.invalidate()
+        response = _limited_get(url, wbi.wbi_keys.sign(params or {}), **kwargs)
+    return response
+
+
+def _limited_get(url, params, **kwargs):
+    """经过限流器的 GET：风控返回会触发退避
+
+    界面（主线程）中调用时最多等待 INTERACTIVE_MAX_WAIT 秒，超出时抛出 RateLimitedError；
+    下载、解析等后台线程等待限流器放行。
+    """
+    interactive = threading.current_thread() is threading.main_thread()
+    rate_limiter.acquire(url, max_wait=INTERACTIVE_MAX_WAIT if interactive else None)
+    try:
+        response = http.get(url, params=params, **kwargs)
+        response.content  # 读完响应体，之后可安全共享
+    except BaseException:
+        rate_limiter.report_error(url)
+        raise
+    rate_limiter.report(url, status=response.status_code, code=_json_code(response))
+    return response
+
+
+def _json_code(response):
+    if not response.ok:
+        return None
+    try:
+        return response.json().get("code")
+    except ValueError:
+        return None
+
+
+def _fetch_playurl(bvid, cid, qn, fnval):
+    """请求 playurl 接口，返回 data 字段"""
+    url = "https://api.bilibili.com/x/player/wbi/playurl"
+    response = api_get(url, params={"bvid": bvid, "cid": cid, "qn": qn, "fnval": fnval})
+    response.raise_for_status()
+    info = response.json()
+    if info.get("code") != 0:
+        raise Exception(f"获取播放地址失败: {info.get('message', '')}")
+    return info.get("data", {})
+
+
+# playurl 缓存，播放器、代理和下载共用
+playurl_cache = PlayurlCache(_fetch_playurl)
+
+
+def expected_size(headers):
+    """响应体应有的字节数；经过压缩传输时 Content-Length 不是解压后的大小，返回 None"""
+    length = headers.get("Content-Length")
+    if not length or not length.isdigit() or headers.get("Content-Encoding", "identity") != "identity":
+        return None
+    return int(length)
+
+
+# 未完成的下载（分段文件和进度清单）
+DOWNLOAD_DIR = "./cache/downloads"
+# 封面、头像在这段时间内不再向服务器确认（之后用 ETag/Last-Modified 发条件请求）
+REVALIDATE_AFTER = 7 * 24 * 3600
+
+# 未指定进度接收方时的默认进度事件，每秒最多输出一行日志
+download_progress = ProgressReporter(min_interval=1.0)
+download_progress.subscribe(log_event)
+
+
+def resolve_playurl(bvid, cid, qn=112, fnval=1, force=False):
+    """获取 playurl 数据，未过期的签名地址直接从缓存返回"""
+    return playurl_cache.get(bvid, cid, qn, fnval, force=force)
+
+
 class GetVideoInfo:
-    def __init__(self, id, cid):
+    def __init__(self, id, cid, use_cache=True, require_full=False):
         self.id = id
         self.cid = cid
         if id[0:2] == "BV":
-            self.url = f"https://api.bilibili.com/x/web-interface/view?bvid={id}"
+            self.url = "https://api.bilibili.com/x/web-interface/view"
+            self.params = {"bvid": id}
         else:
-            self.url =f"https://api.bilibili.com/x/web-interface/wbi/view?avid={id}"
-        
-        # 使用Cookie
-        cookies = {}
-        with open("Cookie", "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                # 解析Cookie文件中的每一行
-                parts = line.split('\t')
-                if len(parts) >= 7:
-                    cookies[parts[5]] = parts[6]  # 格式：域名、标志、路径等 -> 键值对
-
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Referer": "https://www.bilibili.com/"
-        }
-
+            self.url = "https://api.bilibili.com/x/web-interface/wbi/view"
+            self.params = {"avid": id}
         
-        response = rq.get(self.url, headers=headers, cookies=cookies)
+        # 优先使用元数据缓存，过期条目会在后台刷新
+        self.info = None
+        if use_cache:
+            data = metadata_cache.get(id, require_full=require_full, revalidate=self._fetch_data)
+            if data is not None:
+                self.info = {"code": 0, "data": data}
+
+        if self.info is None:
+            self.info = self._fetch()
+            if self.is_success():
+                metadata_cache.put(self.info.get("data", {}))
+
+    def _fetch(self):
+        response = api_get(self.url, params=self.params)
         response.raise_for_status()  # 检查HTTP状态码
-        self.info = response.json()
+        return response.json()
+
+    def _fetch_data(self):
+        info = self._fetch()
+        if info.get("code") != 0:
+            return None
+        return info.get("data", {})
     
     # 判断是否获取成功
     def is_success(self):
@@ -76,106 +180,105 @@ class GetVideoInfo:
             return 0
         return self.info.get("data", {}).get("duration", 0)
 
-
-    def get_video_streaming_info_dash(self):
-        cookies = {}
-        with open("Cookie", "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                # 解析Cookie文件中的每一行
-                parts = line.split('\t')
-                if len(parts) >= 7:
-                    cookies[parts[5]] = parts[6]
-        
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Referer": "https://www.bilibili.com/",
-        }
-
-        url = f"https://api.bilibili.com/x/player/wbi/playurl?bvid={self.id}&cid={self.cid}&qn=112&fnval=4048"
-        response = rq.get(url, headers=headers, cookies=cookies)
-        response.raise_for_status()
-        info = response.json()
+    def get_pages(self):
+        """分P列表（需要完整的视频信息，require_full=True）"""
+        if not self.is_success():
+            return []
+        data = self.info.get("data", {})
+        pages = data.get("pages") or []
+        if not pages and data.get("cid"):
+            # 只有一个分P时部分接口不返回 pages
+            pages = [{"cid": data["cid"], "page": 1, "part": data.get("title", ""), "duration": data.get("duration", 0)}]
+        return [
+            {
+                "cid": page.get("cid", 0),
+                "page": page.get("page", i + 1),
+                "part": page.get("part", ""),
+                "duration": page.get("duration", 0),
+            }
+            for i, page in enumerate(pages)
+        ]
+
+    def get_ugc_season(self):
+        """视频所属的合集，没有时返回 None
+
+        返回 {"id", "title", "episodes": [{"bvid", "aid", "cid", "title", "section"}]}，
+        episodes 按合集中的顺序排列。
+        """
+        if not self.is_success():
+            return None
+        season = self.info.get("data", {}).get("ugc_season")
+        if not season:
+            return None
+        episodes = []
+        for section in season.get("sections") or []:
+            for episode in section.get("episodes") or []:
+                episodes.append({
+                    "bvid": episode.get("bvid", ""),
+                    "aid": episode.get("aid", 0),
+                    "cid": episode.get("cid", 0),
+                    "title": episode.get("title", ""),
+                    "section": section.get("title", ""),
+                })
+        return {"id": season.get("id", 0), "title": season.get("title", ""), "episodes": episodes}
+
+    def get_dash_streams(self, force_refresh=False, target_qn=None, throughput=None, codecs=DEFAULT_CODECS):
+        """返回按优先级排序的 (视频候选列表, 音频候选列表)
+
+        target_qn 为 None 时使用设置中的默认清晰度。
+        """
+        data = resolve_playurl(self.id, self.cid, qn=112, fnval=4048, force=force_refresh)
         
         # 解析DASH格式数据
-        dash_data = info.get("data", {}).get("dash", {})
+        dash_data = data.get("dash", {})
         if not dash_data:
             raise Exception("无法获取DASH格式视频信息")
-        
-        video_url = dash_data.get("video", [{}])[0].get("baseUrl", "")
-        audio_url = dash_data.get("audio", [{}])[0].get("baseUrl", "")
-        if not video_url or not audio_url:
+
+        if target_qn is None:
+            target_qn = load_default_quality()
+        return StreamSelector(dash_data).select(target_qn, throughput, codecs)
+
+    def get_video_streaming_info_dash(self, force_refresh=False):
+        """返回视频和音频各自测得最快的镜像地址（完整的镜像列表见 get_dash_streams 中的 urls）"""
+        videos, audios = self.get_dash_streams(force_refresh)
+        if not videos or not audios:
             raise Exception("无法获取视频或音频URL")
 
-        return video_url, audio_url
-    
-    def get_video_streaming_info_mp4(self):
-        cookies = {}
-        with open("Cookie", "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                # 解析Cookie文件中的每一行
-                parts = line.split('\t')
-                if len(parts) >= 7:
-                    cookies[parts[5]] = parts[6]
-        
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Referer": "https://www.bilibili.com/",
-        }
+        return mirror_stats.order(videos[0].urls)[0], mirror_stats.order(audios[0].urls)[0]
 
-        url = f"https://api.bilibili.com/x/player/wbi/playurl?bvid={self.id}&cid={self.cid}&qn=112&fnval=1"
-        response = rq.get(url, headers=headers, cookies=cookies)
-        response.raise_for_status()
-        info = response.json()
+    def get_video_streaming_urls_mp4(self, force_refresh=False):
+        """返回 MP4 的镜像地址列表：主地址在前，之后是 backup_url"""
+        data = resolve_playurl(self.id, self.cid, qn=112, fnval=1, force=force_refresh)
         # 解析MP4格式数据
-        mp4_data = info.get("data", {}).get("durl", [{}])[0]
+        mp4_data = (data.get("durl") or [{}])[0]
         if not mp4_data:
             raise Exception("无法获取MP4格式视频信息")
-        
-        video_url = mp4_data.get("url", "")
-        if not video_url:
+
+        urls = [url for url in [mp4_data.get("url", "")] + list(mp4_data.get("backup_url") or []) if url]
+        if not urls:
             raise Exception("无法获取视频URL")
+        return urls
 
-        return video_url
+    def get_video_streaming_info_mp4(self, force_refresh=False):
+        """返回测得最快的 MP4 镜像地址"""
+        return mirror_stats.order(self.get_video_streaming_urls_mp4(force_refresh))[0]
 
 
 # 获取推荐
 class GetRecommendVideos:
     def __init__(self, page=1, pagesize=20):
 
-        cookies = {}
-        with open("Cookie", "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                # 解析Cookie文件中的每一行
-                parts = line.split('\t')
-                if len(parts) >= 7:
-                    cookies[parts[5]] = parts[6]  # 格式：域名、标志、路径等 -> 键值对
-
         self.page = page
         self.pagesize = pagesize
-        self.url = f"https://api.bilibili.com/x/web-interface/wbi/index/top/feed/rcmd?page={self.page}&pagesize={self.pagesize}"
+        self.url = "https://api.bilibili.com/x/web-interface/wbi/index/top/feed/rcmd"
         
-        # 使用Cookie
-        with open("Cookie","r") as f:
-            self.cookie = f.read()
-
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Referer": "https://www.bilibili.com",
-
-        }
-
-        response = rq.get(self.url, headers=headers, cookies=cookies)
+        response = api_get(self.url, params={"page": self.page, "pagesize": self.pagesize})
         response.raise_for_status()  # 检查HTTP状态码
         self.info = response.json()
+
+        # 推荐条目已包含大部分视频信息，预填元数据缓存
+        if self.info.get("code") == 0:
+            metadata_cache.seed_from_feed(self.info.get("data", {}).get("item", []))
         
 
     def get_recommend_videos(self):
@@ -186,60 +289,118 @@ class GetRecommendVideos:
 
 class Download:
     def download_cover(self, cover_url, save_path, max_retries=3):
-        """下载视频封面到指定路径"""
+        """下载视频封面到指定路径，同一封面的并发下载只进行一次，已存储的封面不再下载"""
+        stored = http.single_flight.do(
+            ("cover", cover_url),
+            lambda: self._download_to_store(cover_url, "cover", max_retries),
+            endpoint="cover"
+        )
+        return stored and media_store.materialize("cover", cover_url, save_path) is not None
+
+    def _download_to_store(self, url, kind, max_retries=3):
+        """下载到存储；已有且未到确认时间时不发请求，之后发条件请求，304 时不传输内容
+
+        响应边接收边写入存储目录中的临时文件，完整校验后才移入存储。
+        重试之间按指数退避加随机抖动等待；全部失败时已有的旧文件仍然可用。
+        """
+        entry = media_store.lookup(kind, url)
+        if entry is not None and media_store.is_fresh(entry, REVALIDATE_AFTER):
+            return True
         for attempt in range(max_retries):
+            tmp_path = None
             try:
-                response = rq.get(cover_url, timeout=10)
-                response.raise_for_status()
-                with open(save_path, "wb") as f:
-                    f.write(response.content)
+                with http.get(url, headers=media_store.conditional_headers(entry), timeout=10, stream=True) as response:
+                    if response.status_code == 304 and entry is not None:
+                        media_store.touch(
+                            kind, url,
+                            etag=response.headers.get("ETag"),
+                            last_modified=response.headers.get("Last-Modified"),
+                        )
+                        return True
+                    response.raise_for_status()
+                    tmp_path = media_store.temp_path()
+                    with open(tmp_path, "wb") as f:
+                        for chunk in response.iter_content(64 * 1024):
+                            f.write(chunk)
+                    media_store.put_file(
+                        tmp_path, kind, url, url=url,
+                        expected_size=expected_size(response.headers),
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                    )
                 return True
             except Exception as e:
                 print(f"下载失败 ({attempt+1}/{max_retries}): {str(e)}")
-        return False
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                if attempt + 1 < max_retries:
+                    time.sleep(jittered_backoff(attempt))
+        return entry is not None
     
-    def download_video(self, video_bvid, video_cid, save_path, callback=None):
-        cookies = {}
-        with open("Cookie", "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                parts = line.split('\t')
-                if len(parts) >= 7:
-                    cookies[parts[5]] = parts[6]
-
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Referer": "https://www.bilibili.com/"
+    def download_video(self, video_bvid, video_cid, save_path, callback=None, quality=None, codecs=DEFAULT_CODECS,
+                       stream_mux=True, cancel_event=None, throttle=None, progress=None, progress_key=None):
+        """下载视频并混流到 save_path
+
+        cancel_event: threading.Event，置位后停止下载并抛出 DownloadCancelled（已下载部分保留）
+        throttle(n): 每写入 n 字节前调用，用于全局限速
+        progress: ProgressReporter，事件的 key 为 (progress_key, "视频流"/"音频流")；
+                  未指定时使用 download_progress（输出到控制台）
+        """
+        cookies = cookie_store.get()
+        transfer = {
+            "cancel_event": cancel_event,
+            "throttle": throttle,
+            "progress": progress or download_progress,
+            "progress_key": progress_key if progress_key is not None else (video_bvid, str(video_cid)),
         }
 
-        # 获取视频流信息
-        url = f"https://api.bilibili.com/x/player/wbi/playurl?bvid={video_bvid}&cid={video_cid}&qn=112&fnval=4048"
-        response = rq.get(url, headers=headers, cookies=cookies)
-        response.raise_for_status()
-        info = response.json()
-        
-        # 解析DASH格式数据
-        dash_data = info.get("data", {}).get("dash", {})
-        if not dash_data:
-            raise Exception("无法获取DASH格式视频信息")
+        # 获取视频流信息（优先使用缓存中未过期的地址），按清晰度/吞吐量/编码选流
+        if quality is None:
+            quality = load_default_quality()
 
-        video_url = dash_data.get("video", [{}])[0].get("baseUrl", "")
-        audio_url = dash_data.get("audio", [{}])[0].get("baseUrl", "")
+        videos, audios = self._select_streams(video_bvid, video_cid, quality, codecs)
+        if not videos or not audios:
+            raise Exception("无法获取视频或音频URL")
 
-        # 临时文件路径
-        video_save_path = f"./temp/{video_bvid}-video.m4s"
-        audio_save_path = f"./temp/{video_bvid}-audio.m4s"
+        # 选中的视频流和音频流已经下载过时直接使用存储中的文件
+        media_key = self._media_key(video_bvid, video_cid, videos[0], audios[0])
+        if media_store.materialize("media", media_key, save_path):
+            print(f"视频已下载过，直接使用: {save_path}")
+            if callback:
+                callback()
+            return
+
+        # 未完成的下载保存在 cache 目录（temp 目录在启动时会被清空），中断后可以继续
+        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+        video_save_path = os.path.join(DOWNLOAD_DIR, f"{video_bvid}-{video_cid}-video.m4s")
+        audio_save_path = os.path.join(DOWNLOAD_DIR, f"{video_bvid}-{video_cid}-audio.m4s")
+
+        # 混流输出先写到 mux_path 再放到 save_path：save_path 可能是存储中文件的硬链接，
+        # 直接覆盖写会把存储里的那一份一起截断
+        mux_path = self._mux_path(save_path)
+
+        # 边下边混流；有未完成的续传文件、平台不支持或失败时走临时文件
+        resumable = os.path.exists(video_save_path) or os.path.exists(audio_save_path)
+        if stream_mux and not resumable and StreamMuxer.supported():
+            try:
+                if self._download_streaming(videos[0], audios[0], mux_path, cookies, transfer):
+                    self._finish_video(media_key, mux_path, save_path, callback)
+                    return
+            except Exception as e:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise DownloadCancelled("下载已取消")
+                print(f"边下边混流失败，改用临时文件: {str(e)}")
 
-        # 创建下载线程
+        # 创建下载线程；chosen 记录实际下载的那一路流（首选失败时为备选）
+        errors = []
+        chosen = {}
         video_thread = threading.Thread(
             target=self._download_task,
-            args=(video_url, video_save_path, "视频流", headers, cookies)
+            args=(video_bvid, video_cid, videos, video_save_path, "视频流", cookies, errors, transfer, chosen)
         )
         audio_thread = threading.Thread(
             target=self._download_task,
-            args=(audio_url, audio_save_path, "音频流", headers, cookies)
+            args=(video_bvid, video_cid, audios, audio_save_path, "音频流", cookies, errors, transfer, chosen)
         )
 
         # 启动线程
@@ -250,9 +411,11 @@ class Download:
         video_thread.join()
         audio_thread.join()
 
-        # 检查下载结果
-        if not all([os.path.exists(video_save_path), os.path.exists(audio_save_path)]):
-            raise Exception("视频或音频流下载失败")
+        # 检查下载结果（失败时保留已下载的部分和进度清单）
+        if cancel_event is not None and cancel_event.is_set():
+            raise DownloadCancelled("下载已取消")
+        if errors:
+            raise Exception("; ".join(errors))
 
         # 混流处理
         try:
@@ -261,94 +424,201 @@ class Download:
             ffmpeg.output(
                 video_input, 
                 audio_input, 
-                save_path, 
+                mux_path, 
                 vcodec='copy', 
                 acodec='copy', 
                 loglevel='error'
             ).run(overwrite_output=True)
         except ffmpeg.Error as e:
+            if os.path.exists(mux_path):
+                os.remove(mux_path)
             raise Exception(f"混流失败: {e.stderr.decode()}")
-        finally:
-            # 清理临时文件
-            os.remove(video_save_path)
-            os.remove(audio_save_path)
+
+        # 混流成功后再清理临时文件
+        os.remove(video_save_path)
+        os.remove(audio_save_path)
+
+        media_key = self._media_key(video_bvid, video_cid, chosen["视频流"], chosen["音频流"])
+        self._finish_video(media_key, mux_path, save_path, callback)
+
+    @staticmethod
+    def _media_key(video_bvid, video_cid, video, audio):
+        """存储中视频文件的键：按实际选中的视频流和音频流（清晰度、编码），而不是请求的清晰度"""
+        return f"{video_bvid}:{video_cid}:{video.kind}{video.id}-{video.codecid}:{audio.kind}{audio.id}"
+
+    @staticmethod
+    def _mux_path(save_path):
+        """save_path 旁边的混流临时文件，保留扩展名让 ffmpeg 识别容器格式"""
+        root, ext = os.path.splitext(save_path)
+        return f"{root}.part{ext}"
+
+    def _finish_video(self, media_key, mux_path, save_path, callback):
+        # 混流结果移入存储后再链接到 save_path（改名替换，不会写入旧文件），相同内容只占一份空间
+        try:
+            media_store.put_file(mux_path, "media", media_key)
+            media_store.materialize("media", media_key, save_path)
+        except OSError as e:
+            print(f"保存到媒体存储失败: {str(e)}")
+            if os.path.exists(mux_path):
+                os.replace(mux_path, save_path)
 
         print(f"视频合成完成: {save_path}")
 
         if callback:
             callback()
 
-    def _download_task(self, url, save_path, task_name, headers, cookies):
-        max_retries = 3
-        for attempt in range(max_retries):
+    @staticmethod
+    def _transfer_options(transfer, task_name):
+        """SegmentedDownloader 的取消、限速和进度参数"""
+        return {
+            "cancel_event": transfer["cancel_event"],
+            "throttle": transfer["throttle"],
+            "progress": transfer["progress"],
+            "progress_key": (transfer["progress_key"], task_name),
+        }
+
+    def _download_streaming(self, video, audio, save_path, cookies, transfer):
+        """视频和音频边下载边送入 ffmpeg；容器需要定位读取时返回 False"""
+        for rep in (video, audio):
+            if needs_seeking(fetch_head(rep.urls, cookies)):
+                print(f"{rep} 需要定位读取，使用临时文件混流")
+                return False
+
+        muxer = StreamMuxer(save_path)
+        errors = []
+        downloaders = []
+
+        def task(rep, sink, task_name):
+            options = self._transfer_options(transfer, task_name)
+            downloader = SegmentedDownloader(rep.urls, None, cookies=cookies, sink=sink, **options)
+            downloaders.append(downloader)
+            try:
+                downloader.run()
+                transfer["progress"].finish(options["progress_key"])
+            except Exception as e:
+                errors.append(f"[{task_name}] {str(e)}")
+                transfer["progress"].finish(options["progress_key"], error=e)
+            finally:
+                # 关闭管道，ffmpeg 读到结束
+                StreamMuxer.close_input(sink)
+
+        threads = [
+            threading.Thread(target=task, args=(video, muxer.video, "视频流")),
+            threading.Thread(target=task, args=(audio, muxer.audio, "音频流")),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            muxer.abort()
+            raise Exception("; ".join(errors))
+        muxer.finish()
+        for downloader in downloaders:
+            throughput_estimator.update(downloader.downloaded, downloader.elapsed)
+        return True
+
+    def _select_streams(self, video_bvid, video_cid, quality, codecs, force=False):
+        data = resolve_playurl(video_bvid, video_cid, qn=112, fnval=4048, force=force)
+
+        # 解析DASH格式数据
+        dash_data = data.get("dash", {})
+        if not dash_data:
+            raise Exception("无法获取DASH格式视频信息")
+        # 下载慢一点也要拿到所选清晰度，吞吐量只用于播放时选流
+        return StreamSelector(dash_data).select(quality, codecs=codecs, adaptive=False)
+
+    def _resolve_representation_urls(self, video_bvid, video_cid, source):
+        """签名地址过期时重新请求 playurl，返回同一路流（清晰度和编码相同）的新地址"""
+        data = resolve_playurl(video_bvid, video_cid, qn=112, fnval=4048, force=True)
+        selector = StreamSelector(data.get("dash", {}))
+        for rep in selector.videos + selector.audios + selector.dolby_audios + selector.flac_audios:
+            if rep.kind == source["kind"] and rep.id == source["id"] and rep.codecid == source["codecid"]:
+                return rep.urls
+        return []
+
+    def _download_task(self, video_bvid, video_cid, representations, save_path, task_name, cookies, errors, transfer,
+                       chosen=None):
+        # representations 为按优先级排序的候选流，同一路流的主地址和备用地址内容相同，
+        # 可以混合分段下载；换到另一路流时从头下载
+        options = self._transfer_options(transfer, task_name)
+        progress, progress_key = transfer["progress"], options["progress_key"]
+        manifest = DownloadManifest.load(save_path)
+        sources = [
+            {"bvid": video_bvid, "cid": str(video_cid), "qn": 112, "fnval": 4048,
+             "kind": rep.kind, "id": rep.id, "codecid": rep.codecid}
+            for rep in representations
+        ]
+        # 上次未完成的那一路流仍可用时优先继续下载
+        order = sorted(range(len(representations)), key=lambda i: not manifest.matches_source(**sources[i]))
+
+        last_error = None
+        for i in order:
+            rep, source = representations[i], sources[i]
+            if not manifest.matches_source(**source):
+                manifest = DownloadManifest(save_path)
+                manifest.source = source
+            downloader = SegmentedDownloader(
+                rep.urls, save_path, cookies=cookies, manifest=manifest,
+                url_resolver=lambda source=source: self._resolve_representation_urls(video_bvid, video_cid, source),
+                **options
+            )
             try:
-                with rq.get(url, headers=headers, cookies=cookies, stream=True, timeout=30) as r:
-                    r.raise_for_status()
-                    total_size = int(r.headers.get('content-length', 0))
-                    downloaded = 0
-                    
-                    with open(save_path, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=1024*1024):
-                            if chunk:
-                                f.write(chunk)
-                                downloaded += len(chunk)
-                                progress = downloaded / total_size * 100
-                                print(f"[{task_name}] 进度: {progress:.1f}%", end='\r')
-                    print(f"\n[{task_name}] 下载完成")
-                    return True
+                downloader.run()
+            except DownloadCancelled:
+                errors.append(f"[{task_name}] 下载已取消")
+                progress.finish(progress_key, error="下载已取消")
+                return False
+            except DownloadError as e:
+                last_error = e
+                print(f"[{task_name}] {rep} 下载失败: {str(e)}")
+                continue
             except Exception as e:
-                print(f"[{task_name}] 第 {attempt+1} 次尝试失败: {str(e)}")
-                time.sleep(2)
-        raise Exception(f"[{task_name}] 下载失败，已达最大重试次数")
+                # 磁盘空间不足、无法写入等错误换一路流也无法解决，直接报告
+                errors.append(f"[{task_name}] {str(e)}")
+                progress.finish(progress_key, error=e)
+                return False
+            throughput_estimator.update(downloader.downloaded, downloader.elapsed)
+            progress.finish(progress_key)
+            if chosen is not None:
+                chosen[task_name] = rep
+            return True
+        errors.append(f"[{task_name}] 下载失败，已达最大重试次数: {last_error}")
+        progress.finish(progress_key, error=last_error)
+        return False
     
-    def download_user_face(self, save_path):
-
-        cookies = {}
-        with open("Cookie", "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                parts = line.split('\t')
-                if len(parts) >= 7:
-                    cookies[parts[5]] = parts[6]
-        
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Referer": "https://www.bilibili.com/"
-        }
+    def download_user_face(self, save_path, face_url=None):
+        """下载用户头像；已有用户信息时传入 face_url，避免再请求一次 nav"""
+        cookies = cookie_store.get()
 
-        user_data = GetUserInfo().get_user_info()
-        url = user_data["face"]
+        if face_url is None:
+            face_url = GetUserInfo().get_user_info()["face"]
 
-        response = rq.get(url, headers=headers, cookies=cookies)
-        response.raise_for_status()
-        with open(save_path, "wb") as f:
-            f.write(response.content)
+        # 头像地址不变时直接使用存储中的文件
+        if media_store.lookup("face", face_url) is None:
+            response = http.get_shared(face_url, cookies=cookies, endpoint="face")
+            response.raise_for_status()
+            tmp_path = media_store.temp_path()
+            with open(tmp_path, "wb") as f:
+                f.write(response.content)
+            media_store.put_file(
+                tmp_path, "face", face_url, url=face_url,
+                expected_size=expected_size(response.headers),
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+        media_store.materialize("face", face_url, save_path)
         
 
 class QrLogin:
     def __init__(self):
         # 修复Cookie读取方式
-        cookies = {}
-        with open("Cookie", "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                parts = line.split('\t')
-                if len(parts) >= 7:
-                    cookies[parts[5]] = parts[6]
-
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Referer": "https://www.bilibili.com/"
-        }
+        cookies = cookie_store.get()
 
         # 使用cookies参数代替header中的Cookie
-        self.info = rq.get(
+        self.info = http.get(
             "https://passport.bilibili.com/x/passport-login/web/qrcode/generate",
-            headers=headers,
             cookies=cookies
         )
         self.url = self.info.json().get("data", {}).get("url", "")
@@ -363,26 +633,16 @@ class QrLogin:
     
     # 确认是否登录
     def check_login(self):
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Referer": "https://www.bilibili.com/"
-        }
-        
         try:
             # 使用requests发送请求
-            response = rq.get(
+            response = http.get(
                 "https://passport.bilibili.com/x/passport-login/web/qrcode/poll",
-                params={"qrcode_key": self.qrcode_key},
-                headers=headers
+                params={"qrcode_key": self.qrcode_key}
             )
             response.raise_for_status()
 
-            # 保存Cookie（使用Netscape格式）
-            with open("Cookie", "w") as f:
-                for cookie in response.cookies:
-                    # 生成符合Netscape格式的Cookie行
-                    cookie_line = f".bilibili.com\tTRUE\t/\t{'TRUE' if cookie.secure else 'FALSE'}\t{cookie.expires or '0'}\t{cookie.name}\t{cookie.value}\n"
-                    f.write(cookie_line)
+            # 保存Cookie（使用Netscape格式，原子写入）
+            cookie_store.save(response.cookies)
 
             # 返回登录状态码
             return response.json().get("data", {}).get("code", 0)
@@ -395,21 +655,7 @@ class GetUserInfo:
     def __init__(self):
         self.url = "https://api.bilibili.com/x/web-interface/nav"
 
-        cookies = {}
-        with open("Cookie", "r") as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                parts = line.split('\t')
-                if len(parts) >= 7:
-                    cookies[parts[5]] = parts[6]
-
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Referer": "https://www.bilibili.com/"
-        }
-        self.info = rq.get(self.url, headers=self.headers,cookies=cookies)
+        self.info = api_get(self.url)
         self.info = self.info.json()
     
     def get_user_info(self):
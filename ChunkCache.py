@@ -0,0 +1,196 @@
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+
+CHUNK_SIZE = 256 * 1024
+
+
+def url_identity(url):
+    """缓存中视频的标识：地址的路径部分
+
+    签名参数（过期时间、签名）和 CDN 主机在刷新地址后会变，路径不变，
+    刷新前后读到的是同一个文件。
+    """
+    return urlsplit(url).path
+
+
+class ChunkCache:
+    """按 (视频标识, 块序号) 缓存视频数据的块
+
+    最近使用的块保存在内存中（LRU，最多 memory_limit 字节），从内存淘汰的块
+    写入磁盘上的内存映射文件（分成 chunk_size 大小的槽，最多 disk_limit 字节），
+    磁盘也满时丢弃最久未用的块。每个视频最多占用 per_video_limit 字节，
+    超出时先淘汰该视频自己最久未用的块，长视频不会挤掉其他视频的缓存。
+    映射文件只在本次运行中有效，启动时重新创建。
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, memory_limit=64 * 1024 * 1024,
+                 disk_limit=512 * 1024 * 1024, per_video_limit=256 * 1024 * 1024,
+                 spill_path="./cache/proxy-chunks.bin"):
+        self.chunk_size = chunk_size
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.per_video_limit = per_video_limit
+        self.spill_path = spill_path
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # (视频, 块) -> bytes
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # (视频, 块) -> (槽, 长度)
+        self._free_slots = []
+        self._mmap = None
+        self._file = None
+        self._video_bytes = {}
+        self._lengths = {}  # 视频 -> 文件总长度
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    # 磁盘映射文件
+    def _slots(self):
+        """首次溢出时创建映射文件"""
+        if self._mmap is None:
+            directory = os.path.dirname(self.spill_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            count = self.disk_limit // self.chunk_size
+            self._file = open(self.spill_path, "w+b")
+            self._file.truncate(count * self.chunk_size)
+            self._mmap = mmap.mmap(self._file.fileno(), count * self.chunk_size)
+            self._free_slots = list(range(count - 1, -1, -1))
+        return self._free_slots
+
+    def _spill(self, key, data):
+        if self.disk_limit < self.chunk_size:
+            self._forget(key, len(data))
+            return
+        free = self._slots()
+        if not free:
+            self._drop_disk(next(iter(self._disk)))
+        slot = free.pop()
+        offset = slot * self.chunk_size
+        self._mmap[offset:offset + len(data)] = data
+        self._disk[key] = (slot, len(data))
+
+    def _drop_disk(self, key):
+        slot, length = self._disk.pop(key)
+        self._free_slots.append(slot)
+        self._forget(key, length)
+
+    def _drop_memory(self, key):
+        data = self._memory.pop(key)
+        self._memory_bytes -= len(data)
+        self._forget(key, len(data))
+
+    def _forget(self, key, length):
+        self._stats["evictions"] += 1
+        remaining = self._video_bytes[key[0]] - length
+        if remaining > 0:
+            self._video_bytes[key[0]] = remaining
+        else:
+            self._video_bytes.pop(key[0], None)
+
+    def _evict_from_video(self, video):
+        """淘汰某个视频最久未用的块（先看磁盘上的，再看内存中的）"""
+        for key in self._disk:
+            if key[0] == video:
+                self._drop_disk(key)
+                return True
+        for key in self._memory:
+            if key[0] == video:
+                self._drop_memory(key)
+                return True
+        return False
+
+    # 读写
+    def get(self, video, index):
+        """返回块的数据，不在缓存中时返回 None"""
+        key = (video, index)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return data
+            entry = self._disk.get(key)
+            if entry is not None:
+                self._disk.move_to_end(key)
+                self._stats["disk_hits"] += 1
+                offset = entry[0] * self.chunk_size
+                return self._mmap[offset:offset + entry[1]]
+            self._stats["misses"] += 1
+            return None
+
+    def contains(self, video, index):
+        key = (video, index)
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def put(self, video, index, data):
+        """保存一个完整的块（文件的最后一块可以较短）"""
+        key = (video, index)
+        data = bytes(data)
+        with self._lock:
+            if key in self._memory or key in self._disk:
+                return
+            if len(data) > self.per_video_limit:
+                return
+            while self._video_bytes.get(video, 0) + len(data) > self.per_video_limit:
+                if not self._evict_from_video(video):
+                    break
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            self._video_bytes[video] = self._video_bytes.get(video, 0) + len(data)
+            while self._memory_bytes > self.memory_limit and len(self._memory) > 1:
+                old_key, old_data = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old_data)
+                self._spill(old_key, old_data)
+
+    def length(self, video):
+        """视频文件的总长度，未知时返回 None"""
+        return self._lengths.get(video)
+
+    def set_length(self, video, length):
+        self._lengths[video] = length
+
+    def stats(self, video=None):
+        """命中统计与占用；指定 video 时附带该视频占用的字节数"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_bytes"] = self._memory_bytes
+            stats["disk_bytes"] = sum(length for _, length in self._disk.values())
+            if video is not None:
+                stats["video_bytes"] = self._video_bytes.get(video, 0)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def _reset(self):
+        self._memory.clear()
+        self._memory_bytes = 0
+        self._disk.clear()
+        self._video_bytes.clear()
+        self._lengths.clear()
+        self._stats = dict.fromkeys(self._stats, 0)
+
+    def clear(self):
+        """清空所有块和统计，保留映射文件"""
+        with self._lock:
+            self._reset()
+            if self._mmap is not None:
+                self._free_slots = list(range(len(self._mmap) // self.chunk_size - 1, -1, -1))
+
+    def close(self):
+        """清空缓存并删除映射文件，之后仍可继续使用（再次溢出时重新创建）"""
+        with self._lock:
+            self._reset()
+            self._free_slots = []
+            if self._mmap is not None:
+                self._mmap.close()
+                self._file.close()
+                self._mmap = self._file = None
+                os.remove(self.spill_path)
+
+
+# 模块级共享实例，同一视频重新打开播放器时仍可命中
+chunk_cache = ChunkCache()
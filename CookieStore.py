@@ -0,0 +1,93 @@
+import os
+import tempfile
+import threading
+
+
+class CookieStore:
+    """进程内共享的 Cookie 存储
+
+    只在 Cookie 文件（Netscape 格式）的 mtime 变化时重新解析，
+    并缓存渲染好的 "Cookie:" 请求头字符串。
+    """
+
+    def __init__(self, path="Cookie"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._cookies = {}
+        self._header = ""
+
+    def _parse(self, f):
+        cookies = {}
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            # 格式：域名、标志、路径、安全、过期时间、名称、值
+            parts = line.split('\t')
+            if len(parts) >= 7:
+                cookies[parts[5]] = parts[6]
+        return cookies
+
+    def _reload_if_changed(self):
+        try:
+            stat = os.stat(self.path)
+            mtime = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            mtime = None
+
+        if mtime == self._mtime:
+            return
+
+        cookies = {}
+        if mtime is not None:
+            try:
+                with open(self.path, "r") as f:
+                    cookies = self._parse(f)
+            except OSError:
+                mtime = None
+
+        self._mtime = mtime
+        self._cookies = cookies
+        self._header = "; ".join(f"{k}={v}" for k, v in cookies.items())
+
+    def get(self):
+        """返回 Cookie 字典（副本）"""
+        with self._lock:
+            self._reload_if_changed()
+            return dict(self._cookies)
+
+    def header(self):
+        """返回预先拼好的 Cookie 请求头，没有 Cookie 时为空字符串"""
+        with self._lock:
+            self._reload_if_changed()
+            return self._header
+
+    def save(self, cookies):
+        """原子地写入 Cookie 文件（Netscape 格式）
+
+        cookies: requests 的 CookieJar 或其他 http.cookiejar.Cookie 可迭代对象
+        """
+        lines = []
+        for cookie in cookies:
+            lines.append(
+                f".bilibili.com\tTRUE\t/\t{'TRUE' if cookie.secure else 'FALSE'}\t{cookie.expires or '0'}\t{cookie.name}\t{cookie.value}\n"
+            )
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(prefix=".cookie-", dir=directory)
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.writelines(lines)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            # 写入后强制下次读取时重新解析
+            self._mtime = None
+
+
+# 模块级共享实例
+cookie_store = CookieStore()
@@ -0,0 +1,382 @@
+import os
+import sqlite3
+import threading
+import time
+
+from BilibiliApi import DOWNLOAD_DIR, Download, GetVideoInfo
+from ProgressReporter import ProgressReporter
+from RateLimiter import RateLimitedError, TokenBucket
+from SegmentedDownloader import DownloadCancelled
+
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATES = (QUEUED, RUNNING, PAUSED)
+
+
+class DownloadManager:
+    """视频下载队列
+
+    任务保存在 SQLite 中，程序重启后未完成的任务继续排队（已下载的部分通过
+    进度清单续传）。最多 max_workers 个任务同时下载，按优先级从高到低、
+    同优先级按加入顺序执行。所有下载共用一个令牌桶限制总带宽。
+    播放视频期间（playback_started / playback_stopped）只运行一个下载任务，
+    并把下载带宽限制在 playback_limit 以内，避免影响播放。
+    被限流或熔断的任务重新排队，retry_after 秒内不会再被取出。
+
+    事件通过 add_listener 注册的回调通知：callback(event, job)，
+    event 为 "added" / "state" / "progress" / "removed"，job 为任务字典。
+    "progress" 事件每个任务最多每 progress_interval 秒一次，包含 id、
+    downloaded、total、rate、eta 以及各路流的进度事件 streams。
+    回调在下载线程或进度投递线程中调用，界面使用 DownloadSignals 转发到主线程。
+    """
+
+    def __init__(self, db_path="./cache/downloads.db", output_dir="./downloads",
+                 max_workers=2, bandwidth_limit=None, playback_limit=1024 * 1024, progress_interval=0.5):
+        self.db_path = db_path
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+        self.playback_limit = playback_limit
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        self._db = None
+        self._workers = []
+        self._running = {}  # 任务 id -> cancel_event
+        self._stop_reasons = {}  # 任务 id -> PAUSED / CANCELLED
+        self._progress = {}  # 任务 id -> {流名称: 最新的进度事件}
+        self._delayed = {}  # 任务 id -> 可以再次运行的时间（time.monotonic）
+        self.progress = ProgressReporter(min_interval=progress_interval)
+        self.progress.subscribe(self._on_progress_event)
+        self._listeners = []
+        self._playback_sessions = 0
+        self._bucket = None
+        self._playback_bucket = TokenBucket(playback_limit, playback_limit)
+        self.set_bandwidth_limit(bandwidth_limit)
+
+    # 数据库
+    def _conn(self):
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, bvid TEXT NOT NULL, cid TEXT, "
+                "save_path TEXT, quality INTEGER, priority INTEGER NOT NULL DEFAULT 0, "
+                "state TEXT NOT NULL, downloaded INTEGER NOT NULL DEFAULT 0, "
+                "total INTEGER NOT NULL DEFAULT 0, error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (state, priority DESC, id)")
+            # 上次运行中被中断的任务重新排队
+            self._db.execute("UPDATE jobs SET state = ? WHERE state = ?", (QUEUED, RUNNING))
+            self._db.commit()
+        return self._db
+
+    def _row(self, job_id):
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            db = self._conn()
+            db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            db.commit()
+            return self._row(job_id)
+
+    # 事件
+    def add_listener(self, callback):
+        """callback(event, job)"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, event, job):
+        for callback in list(self._listeners):
+            try:
+                callback(event, job)
+            except Exception as e:
+                print(f"下载事件回调失败: {str(e)}")
+
+    # 任务管理
+    def enqueue(self, bvid, cid=None, save_path=None, priority=0, quality=None):
+        """加入一个下载任务，返回任务 id"""
+        return self.enqueue_many([{
+            "bvid": bvid, "cid": cid, "save_path": save_path,
+            "priority": priority, "quality": quality,
+        }])[0]
+
+    def enqueue_many(self, items):
+        """批量加入任务（一次事务），items 为包含 bvid 及可选 cid/save_path/priority/quality 的字典"""
+        now = time.time()
+        ids = []
+        with self._lock:
+            db = self._conn()
+            for item in items:
+                cursor = db.execute(
+                    "INSERT INTO jobs (bvid, cid, save_path, quality, priority, state, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (item["bvid"], item.get("cid"), item.get("save_path"), item.get("quality"),
+                     item.get("priority", 0), QUEUED, now, now)
+                )
+                ids.append(cursor.lastrowid)
+            db.commit()
+            jobs = [self._row(job_id) for job_id in ids]
+            self._ensure_workers()
+            self._wakeup.notify_all()
+        for job in jobs:
+            self._notify("added", job)
+        return ids
+
+    def get(self, job_id):
+        with self._lock:
+            return self._row(job_id)
+
+    def jobs(self, states=None):
+        """按执行顺序列出任务，states 为要筛选的状态"""
+        with self._lock:
+            query = "SELECT * FROM jobs"
+            params = ()
+            if states:
+                query += f" WHERE state IN ({', '.join('?' * len(states))})"
+                params = tuple(states)
+            query += " ORDER BY priority DESC, id"
+            return [dict(row) for row in self._conn().execute(query, params)]
+
+    def set_priority(self, job_id, priority):
+        job = self._update(job_id, priority=priority)
+        with self._lock:
+            self._wakeup.notify_all()
+        return job
+
+    def pause(self, job_id):
+        """暂停任务，已下载的部分保留，resume 后继续"""
+        return self._stop(job_id, PAUSED)
+
+    def cancel(self, job_id):
+        """取消任务，删除未完成的下载文件"""
+        job = self._stop(job_id, CANCELLED)
+        if job and job["cid"] and job_id not in self._running:
+            self._remove_partial(job)
+        return job
+
+    def _stop(self, job_id, state):
+        with self._lock:
+            job = self._row(job_id)
+            if job is None or job["state"] not in ACTIVE_STATES:
+                return job
+            cancel_event = self._running.get(job_id)
+            if cancel_event is not None:
+                # 运行中的任务由下载线程在停止后更新状态
+                self._stop_reasons[job_id] = state
+                cancel_event.set()
+                return job
+            self._delayed.pop(job_id, None)
+            job = self._update(job_id, state=state)
+        self._notify("state", job)
+        return job
+
+    def resume(self, job_id):
+        with self._lock:
+            job = self._row(job_id)
+            if job is None or job["state"] not in (PAUSED, FAILED):
+                return job
+            self._delayed.pop(job_id, None)
+            job = self._update(job_id, state=QUEUED, error=None)
+            self._ensure_workers()
+            self._wakeup.notify_all()
+        self._notify("state", job)
+        return job
+
+    def remove(self, job_id):
+        """删除已结束的任务记录"""
+        with self._lock:
+            job = self._row(job_id)
+            if job is None or job["state"] == RUNNING:
+                return False
+            db = self._conn()
+            db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            db.commit()
+            self._delayed.pop(job_id, None)
+        self._notify("removed", job)
+        return True
+
+    @staticmethod
+    def _remove_partial(job):
+        for kind in ("video", "audio"):
+            path = os.path.join(DOWNLOAD_DIR, f"{job['bvid']}-{job['cid']}-{kind}.m4s")
+            for p in (path, path + ".manifest.json"):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    # 带宽
+    def set_bandwidth_limit(self, bytes_per_second):
+        """设置全局下载带宽（字节/秒），None 为不限"""
+        with self._lock:
+            if bytes_per_second:
+                self._bucket = TokenBucket(bytes_per_second, bytes_per_second)
+            else:
+                self._bucket = None
+            self.bandwidth_limit = bytes_per_second
+
+    def _throttle(self, num_bytes):
+        bucket = self._bucket
+        if bucket is not None:
+            bucket.consume(num_bytes)
+        if self._playback_sessions > 0:
+            self._playback_bucket.consume(num_bytes)
+
+    def playback_started(self):
+        """开始播放视频时调用，下载让出带宽"""
+        with self._lock:
+            self._playback_sessions += 1
+
+    def playback_stopped(self):
+        with self._lock:
+            self._playback_sessions = max(0, self._playback_sessions - 1)
+            self._wakeup.notify_all()
+
+    # 工作线程
+    def start(self):
+        """启动工作线程，继续执行数据库中排队的任务"""
+        with self._lock:
+            self._conn()
+            self._ensure_workers()
+            self._wakeup.notify_all()
+
+    def _ensure_workers(self):
+        self._workers = [t for t in self._workers if t.is_alive()]
+        while len(self._workers) < self.max_workers:
+            thread = threading.Thread(target=self._worker_loop, daemon=True)
+            self._workers.append(thread)
+            thread.start()
+
+    def _next_job(self):
+        """取出下一个排队的任务；播放期间只允许一个任务运行，延迟重试的任务到时间后才取出"""
+        with self._lock:
+            while True:
+                timeout = 5
+                limit = 1 if self._playback_sessions > 0 else self.max_workers
+                if len(self._running) < limit:
+                    now = time.monotonic()
+                    rows = self._conn().execute(
+                        "SELECT id FROM jobs WHERE state = ? ORDER BY priority DESC, id", (QUEUED,)
+                    ).fetchall()
+                    for row in rows:
+                        ready_at = self._delayed.get(row["id"], 0)
+                        if ready_at > now:
+                            timeout = min(timeout, ready_at - now)
+                            continue
+                        self._delayed.pop(row["id"], None)
+                        job = self._update(row["id"], state=RUNNING, error=None)
+                        self._running[job["id"]] = threading.Event()
+                        self._progress[job["id"]] = {}
+                        return job
+                self._wakeup.wait(timeout)
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            self._notify("state", job)
+            self._run_job(job)
+
+    def _run_job(self, job):
+        job_id = job["id"]
+        cancel_event = self._running[job_id]
+        retry_after = None
+        try:
+            if not job["cid"]:
+                info = GetVideoInfo(job["bvid"], None)
+                if not info.is_success():
+                    raise Exception(f"获取视频信息失败: {info.info.get('message', '')}")
+                job = self._update(job_id, cid=str(info.info["data"]["cid"]))
+            save_path = job["save_path"] or os.path.join(self.output_dir, f"{job['bvid']}.mp4")
+            directory = os.path.dirname(save_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if not job["save_path"]:
+                job = self._update(job_id, save_path=save_path)
+
+            Download().download_video(
+                job["bvid"], job["cid"], save_path, quality=job["quality"],
+                cancel_event=cancel_event, throttle=self._throttle,
+                progress=self.progress, progress_key=job_id
+            )
+            state, error = DONE, None
+        except DownloadCancelled:
+            state, error = self._stop_reasons.get(job_id, PAUSED), None
+        except RateLimitedError as e:
+            # 限流和熔断（CircuitOpenError）不是任务本身的问题：等 retry_after 秒后重新执行
+            if cancel_event.is_set():
+                state, error = self._stop_reasons.get(job_id, PAUSED), None
+            else:
+                state, error, retry_after = QUEUED, str(e), e.retry_after
+                print(f"下载任务 {job_id} ({job['bvid']}) 被限流，{retry_after:.1f} 秒后重试")
+        except Exception as e:
+            if cancel_event.is_set():
+                state, error = self._stop_reasons.get(job_id, PAUSED), None
+            else:
+                state, error = FAILED, str(e)
+                print(f"下载任务 {job_id} ({job['bvid']}) 失败: {error}")
+
+        with self._lock:
+            self._running.pop(job_id, None)
+            self._stop_reasons.pop(job_id, None)
+            summary = self._summarize(job_id, self._progress.pop(job_id, {}))
+            downloaded, total = summary["downloaded"], summary["total"] or 0
+            if state == DONE and total:
+                downloaded = total
+            if retry_after is not None:
+                self._delayed[job_id] = time.monotonic() + retry_after
+            job = self._update(job_id, state=state, error=error, downloaded=downloaded, total=total)
+            self._wakeup.notify_all()
+        if state == CANCELLED and job["cid"]:
+            self._remove_partial(job)
+        self._notify("state", job)
+
+    @staticmethod
+    def _summarize(job_id, streams):
+        """合并视频流和音频流的进度"""
+        events = list(streams.values())
+        downloaded = sum(event["downloaded"] for event in events)
+        total = None
+        if events and all(event["total"] for event in events):
+            total = sum(event["total"] for event in events)
+        rate = sum(event["rate"] for event in events if not event["finished"])
+        eta = None
+        if total and rate > 0:
+            eta = (total - downloaded) / rate
+        return {
+            "id": job_id,
+            "downloaded": downloaded,
+            "total": total,
+            "rate": rate,
+            "eta": eta,
+            "streams": dict(streams),
+        }
+
+    def _on_progress_event(self, event):
+        job_id, name = event["key"]
+        with self._lock:
+            streams = self._progress.get(job_id)
+            if streams is None:
+                return
+            streams[name] = event
+            summary = self._summarize(job_id, streams)
+        self._notify("progress", summary)
+
+
+# 模块级共享实例（工作线程在加入第一个任务时启动）
+download_manager = DownloadManager()
@@ -0,0 +1,147 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+
+MANIFEST_VERSION = 1
+
+
+def url_deadline(url):
+    """签名地址中的 deadline（Unix 时间戳），没有时返回 None"""
+    value = parse_qs(urlparse(url).query).get("deadline", [None])[0]
+    return int(value) if value and value.isdigit() else None
+
+
+def merge_ranges(ranges):
+    """合并重叠或相邻的闭区间"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class DownloadManifest:
+    """下载进度清单，与下载文件放在一起（<文件名>.manifest.json）
+
+    记录文件大小、ETag/Last-Modified、已完成的字节区间，以及来源信息
+    （bvid、cid、所选流和 playurl 地址），中断后据此只下载缺失的部分。
+    """
+
+    def __init__(self, save_path):
+        self.save_path = save_path
+        self.path = save_path + ".manifest.json"
+        self.size = None
+        self.etag = None
+        self.last_modified = None
+        self.source = {}
+        self.urls = []
+        self.completed = []
+        self.updated_at = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, save_path):
+        """读取已有清单；清单不存在、损坏或数据文件缺失时返回空清单"""
+        manifest = cls(save_path)
+        try:
+            with open(manifest.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+        if data.get("version") != MANIFEST_VERSION or not os.path.exists(save_path):
+            return manifest
+        if os.path.getsize(save_path) != data.get("size"):
+            return manifest
+
+        manifest.size = data.get("size")
+        manifest.etag = data.get("etag")
+        manifest.last_modified = data.get("last_modified")
+        manifest.source = data.get("source", {})
+        manifest.urls = data.get("urls", [])
+        manifest.completed = merge_ranges(data.get("completed", []))
+        manifest.updated_at = data.get("updated_at", 0)
+        return manifest
+
+    @property
+    def exists(self):
+        return self.size is not None
+
+    def matches_source(self, **source):
+        """清单来源与给定字段一致"""
+        return self.exists and all(self.source.get(k) == v for k, v in source.items())
+
+    def urls_expired(self, margin=60):
+        """记录的签名地址是否已过期"""
+        deadlines = [d for d in (url_deadline(url) for url in self.urls) if d is not None]
+        return bool(deadlines) and min(deadlines) - margin <= time.time()
+
+    def validate(self, size, etag=None, last_modified=None):
+        """与服务器返回的信息比对，不一致时清空已完成区间，返回清单是否仍然有效"""
+        valid = self.exists and self.size == size
+        if valid and self.etag and etag and self.etag != etag:
+            valid = False
+        if valid and self.last_modified and last_modified and self.last_modified != last_modified:
+            valid = False
+        if not valid:
+            self.completed = []
+        self.size = size
+        self.etag = etag or self.etag
+        self.last_modified = last_modified or self.last_modified
+        return valid
+
+    def completed_bytes(self):
+        with self._lock:
+            return sum(end - start + 1 for start, end in self.completed)
+
+    def missing_ranges(self):
+        """尚未下载的区间"""
+        with self._lock:
+            missing = []
+            position = 0
+            for start, end in self.completed:
+                if start > position:
+                    missing.append((position, start - 1))
+                position = end + 1
+            if self.size and position < self.size:
+                missing.append((position, self.size - 1))
+            return missing
+
+    def add_range(self, start, end):
+        if end < start:
+            return
+        with self._lock:
+            self.completed = merge_ranges(self.completed + [[start, end]])
+
+    def save(self):
+        """原子写入清单"""
+        with self._lock:
+            data = {
+                "version": MANIFEST_VERSION,
+                "size": self.size,
+                "etag": self.etag,
+                "last_modified": self.last_modified,
+                "source": self.source,
+                "urls": self.urls,
+                "completed": self.completed,
+                "updated_at": time.time(),
+            }
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
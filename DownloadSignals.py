@@ -0,0 +1,33 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from DownloadManager import download_manager
+
+
+class DownloadSignals(QObject):
+    """把 DownloadManager 的事件转发为 Qt 信号
+
+    下载线程中发射的信号会自动排队到接收者所在线程，槽函数可以直接更新界面。
+    """
+
+    job_added = pyqtSignal(object)          # 任务字典
+    job_state_changed = pyqtSignal(object)  # 任务字典
+    job_progress = pyqtSignal(object)       # 进度字典：id, downloaded, total, rate, eta, streams
+    job_removed = pyqtSignal(int)
+
+    def __init__(self, manager=None, parent=None):
+        super().__init__(parent)
+        self.manager = manager or download_manager
+        self.manager.add_listener(self._on_event)
+
+    def _on_event(self, event, job):
+        if event == "added":
+            self.job_added.emit(job)
+        elif event == "state":
+            self.job_state_changed.emit(job)
+        elif event == "progress":
+            self.job_progress.emit(job)
+        elif event == "removed":
+            self.job_removed.emit(job["id"])
+
+    def detach(self):
+        self.manager.remove_listener(self._on_event)
@@ -0,0 +1,257 @@
+import threading
+from urllib.parse import urlparse
+
+import requests as rq
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Referer": "https://www.bilibili.com/"
+}
+
+
+class ConnectionStats:
+    """按主机统计连接的新建与复用次数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _entry(self, host):
+        if host not in self._hosts:
+            self._hosts[host] = {"requests": 0, "new": 0}
+        return self._hosts[host]
+
+    def record_request(self, host):
+        with self._lock:
+            self._entry(host)["requests"] += 1
+
+    def record_new(self, host):
+        with self._lock:
+            self._entry(host)["new"] += 1
+
+    def snapshot(self):
+        """返回 {host: {"requests", "new", "reused"}} 以及汇总"""
+        with self._lock:
+            hosts = {
+                host: {
+                    "requests": entry["requests"],
+                    "new": entry["new"],
+                    "reused": max(0, entry["requests"] - entry["new"]),
+                }
+                for host, entry in self._hosts.items()
+            }
+        total = {
+            "requests": sum(h["requests"] for h in hosts.values()),
+            "new": sum(h["new"] for h in hosts.values()),
+            "reused": sum(h["reused"] for h in hosts.values()),
+        }
+        return {"hosts": hosts, "total": total}
+
+    def reset(self):
+        with self._lock:
+            self._hosts.clear()
+
+
+def _counting_pool(base, stats):
+    """生成会记录取连接/建连接次数的连接池类"""
+
+    class CountingPool(base):
+        def _get_conn(self, timeout=None):
+            stats.record_request(self.host)
+            return super()._get_conn(timeout=timeout)
+
+        def _new_conn(self):
+            stats.record_new(self.host)
+            return super()._new_conn()
+
+    return CountingPool
+
+
+class CountingAdapter(HTTPAdapter):
+    """带连接复用统计的 HTTPAdapter，每个主机一个连接池"""
+
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self.stats),
+            "https": _counting_pool(HTTPSConnectionPool, self.stats),
+        }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """合并并发的相同请求：同一个键同时只有一个请求在途，其余调用方共享结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {}
+
+    def record(self, endpoint, deduplicated):
+        with self._lock:
+            entry = self._stats.setdefault(endpoint, {"requests": 0, "deduplicated": 0})
+            entry["requests"] += 1
+            if deduplicated:
+                entry["deduplicated"] += 1
+
+    def do(self, key, fn, endpoint="default"):
+        """执行 fn()，若相同 key 的调用正在进行则等待并共享其结果（或异常）"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        self.record(endpoint, not leader)
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        """每个端点的 {"requests", "deduplicated"} 计数"""
+        with self._lock:
+            return {endpoint: dict(entry) for endpoint, entry in self._stats.items()}
+
+
+class HttpClient:
+    """进程内共享的 keep-alive HTTP 客户端
+
+    pool_connections: 缓存的主机连接池数量
+    pool_maxsize: 每个主机最多保持的空闲连接数
+    timeout: 默认超时（连接超时, 读取超时）
+    """
+
+    def __init__(self, pool_connections=16, pool_maxsize=16, timeout=(5, 30), headers=None):
+        self.stats = ConnectionStats()
+        self.timeout = timeout
+        self.headers = dict(DEFAULT_HEADERS)
+        if headers:
+            self.headers.update(headers)
+        self.session = None
+        self.configure(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+
+    def configure(self, pool_connections=None, pool_maxsize=None, timeout=None, headers=None):
+        """调整连接池大小、默认超时和默认头部，调整池大小会重建会话"""
+        if timeout is not None:
+            self.timeout = timeout
+        if headers:
+            self.headers.update(headers)
+        if self.session is not None:
+            self.session.headers.update(self.headers)
+        if pool_connections is None and pool_maxsize is None:
+            return
+
+        self.pool_connections = pool_connections or self.pool_connections
+        self.pool_maxsize = pool_maxsize or self.pool_maxsize
+
+        session = rq.Session()
+        # 不走系统代理，与 BilibiliApi 中清空代理环境变量的做法一致
+        session.trust_env = False
+        session.headers.update(self.headers)
+        adapter = CountingAdapter(
+            self.stats,
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        old_session, self.session = self.session, session
+        if old_session is not None:
+            old_session.close()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def connection_stats(self):
+        """连接复用统计：{"hosts": {...}, "total": {"requests", "new", "reused"}}"""
+        return self.stats.snapshot()
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+# 模块级共享客户端，所有 API 调用都走这里
+client = HttpClient()
+single_flight = SingleFlight()
+
+
+def cookie_identity(cookies):
+    """Cookie 的身份标识，用作请求合并键的一部分"""
+    if not cookies:
+        return None
+    if isinstance(cookies, dict):
+        return hash(frozenset(cookies.items()))
+    return hash(str(cookies))
+
+
+def coalesce(url, params, cookies, fn, endpoint=None):
+    """以 URL + 参数 + Cookie 为键合并并发请求，fn() 执行实际请求"""
+    key = (url, tuple(sorted((params or {}).items())), cookie_identity(cookies))
+    return single_flight.do(key, fn, endpoint=endpoint or urlparse(url).path)
+
+
+def get_shared(url, params=None, endpoint=None, **kwargs):
+    """GET 请求，并发的相同请求（URL + 参数 + Cookie）只发一次
+
+    返回的响应已读取完毕，可被多个调用方同时使用；不适用于 stream=True。
+    """
+    def load():
+        response = client.get(url, params=params, **kwargs)
+        response.content  # 读完响应体，之后可安全共享
+        return response
+
+    return coalesce(url, params, kwargs.get("cookies"), load, endpoint=endpoint)
+
+
+def dedup_stats():
+    return single_flight.stats()
+
+
+def get(url, **kwargs):
+    return client.get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    return client.head(url, **kwargs)
+
+
+def configure(**kwargs):
+    client.configure(**kwargs)
+
+
+def connection_stats():
+    return client.connection_stats()
@@ -1,5 +1,6 @@
 import os
 import sys
+import threading
 
 from PyQt5.QtCore import (Qt,
                           QRect,
@@ -21,11 +22,18 @@ from PyQt5.QtWidgets import (QApplication,
                              QLineEdit)
 
 from AcrylicEffect import AcrylicEffect
+from AsyncBilibiliApi import async_client
+from AsyncBridge import get_bridge
 from LiquidGlassWidget import LiquidGlassWidget
 from VideoController import VideoController
 from SettingWidget import SettingWidget  # 新增导入
 from BilibiliApi import *
+from DownloadManager import ACTIVE_STATES, QUEUED, RUNNING, download_manager
+from DownloadSignals import DownloadSignals
+from MediaStore import media_store
+from MirrorStats import mirror_stats
 from CircularLabel import CircularLabel
+from ProgressReporter import format_size
 
 
 class MainWindow(QMainWindow):
@@ -40,6 +48,9 @@ class MainWindow(QMainWindow):
         if not os.path.exists("temp"):
             os.makedirs("temp")
 
+        # 后台回收长时间未使用的封面和头像（它们保存在媒体存储中，不随 temp 目录清理）
+        threading.Thread(target=media_store.collect, daemon=True).start()
+
         # 判断cookie文件是否存在
         if not os.path.exists("Cookie"):
             with open("Cookie", "w") as f:
@@ -50,6 +61,9 @@ class MainWindow(QMainWindow):
         self.drag_position = None
         
         self.initUI()
+
+        # 继续上次未完成的下载任务（顶栏已经可以显示下载状态）
+        download_manager.start()
     
     def initUI(self):
         self.setWindowTitle('液态玻璃bilibili')
@@ -87,6 +101,7 @@ class MainWindow(QMainWindow):
 
         # 初始化UI组件
         self.init_window_bar()
+        self.init_download_status()
         self.init_sidebar()
         self.init_video_controller()
         self.init_setting_widget()  # 新增：初始化设置界面
@@ -215,6 +230,57 @@ class MainWindow(QMainWindow):
         self.search_icon_label.setParent(self.windowbar)
         self.search_icon_label.setStyleSheet("background-color: transparent;")
 
+    def init_download_status(self):
+        """顶栏右侧显示后台下载状态，事件经 DownloadSignals 转发到主线程"""
+        self.download_status = QLabel()
+        self.download_status.setGeometry(QRect(self.width() - 330, 0, 240, 40))
+        self.download_status.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
+        self.download_status.setParent(self.windowbar)
+        self.download_status.setStyleSheet("background-color: transparent; color: #333; font-size: 12px;")
+
+        self.download_states = {job["id"]: job["state"] for job in download_manager.jobs(ACTIVE_STATES)}
+        self.download_rates = {}
+        self.download_signals = DownloadSignals(parent=self)
+        self.download_signals.job_added.connect(self.on_download_state)
+        self.download_signals.job_state_changed.connect(self.on_download_state)
+        self.download_signals.job_progress.connect(self.on_download_progress)
+        self.download_signals.job_removed.connect(self.on_download_removed)
+        self.update_download_status()
+
+    def on_download_state(self, job):
+        if job["state"] in ACTIVE_STATES:
+            self.download_states[job["id"]] = job["state"]
+        else:
+            self.on_download_removed(job["id"])
+            if job.get("error"):
+                self.download_status.setToolTip(f"下载失败: {job.get('save_path') or job['bvid']}\n{job['error']}")
+        if job["state"] != RUNNING:
+            self.download_rates.pop(job["id"], None)
+        self.update_download_status()
+
+    def on_download_progress(self, summary):
+        self.download_rates[summary["id"]] = summary["rate"]
+        self.update_download_status()
+
+    def on_download_removed(self, job_id):
+        self.download_states.pop(job_id, None)
+        self.download_rates.pop(job_id, None)
+        self.update_download_status()
+
+    def update_download_status(self):
+        """更新顶栏的下载状态：进行中和排队的任务数、总速度"""
+        states = list(self.download_states.values())
+        running, queued = states.count(RUNNING), states.count(QUEUED)
+        if not running and not queued:
+            self.download_status.setText("")
+            return
+        text = f"下载中 {running} 个"
+        if queued:
+            text += f"，排队 {queued} 个"
+        if running:
+            text += f"  {format_size(sum(self.download_rates.values()))}/s"
+        self.download_status.setText(text)
+
     def init_sidebar(self):
         """初始化侧边栏"""
         # 侧栏 - 使用半透明背景
@@ -290,7 +356,8 @@ class MainWindow(QMainWindow):
         self.headshot.setParent(self.sidebar)
 
         # 加载头像
-        if GetUserInfo().get_user_info() == None:
+        user_info = GetUserInfo().get_user_info()
+        if user_info == None:
             # 使用默认头像
             default_pixmap = QPixmap("./img/none.png")
             self.headshot.setPixmap(default_pixmap)
@@ -299,7 +366,7 @@ class MainWindow(QMainWindow):
             self.login_window.show()
         else:
             # 下载并设置用户头像
-            Download().download_user_face("./temp/face.jpg")
+            Download().download_user_face("./temp/face.jpg", face_url=user_info["face"])
             user_pixmap = QPixmap("./temp/face.jpg")
             self.headshot.setPixmap(user_pixmap)
             
@@ -506,6 +573,7 @@ class MainWindow(QMainWindow):
         # 更新按钮位置
         self.closebtn.setGeometry(QRect(self.windowbar.width()-40, 0, 40, 40))
         self.minbtn.setGeometry(QRect(self.windowbar.width()-80, 0, 40, 40))
+        self.download_status.setGeometry(QRect(self.windowbar.width()-330, 0, 240, 40))
         
         # 更新搜索框及图标
         self.searchbar.setGeometry(QRect(
@@ -544,10 +612,17 @@ class MainWindow(QMainWindow):
     
     def closeEvent(self, a0):
         """关闭事件处理"""
-        # 关闭所有线程
-        self.video_controller._is_alive = False
-        for thread in self.video_controller.download_threads:
-            thread.join()
+        # 取消进行中的异步请求，关闭会话后停止事件循环
+        self.video_controller.cancel_requests()
+        bridge = get_bridge()
+        try:
+            bridge.run_sync(async_client.close(), timeout=2)
+        except Exception as e:
+            print(f"关闭异步会话失败: {str(e)}")
+        bridge.stop()
+        self.download_signals.detach()
+        # 保存镜像测速结果
+        mirror_stats.flush()
 
         return super().closeEvent(a0)
 
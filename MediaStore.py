@@ -0,0 +1,328 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class StoreIntegrityError(Exception):
+    """写入的文件与预期的大小或哈希不一致"""
+
+
+class MediaStore:
+    """按内容寻址的媒体存储（封面、头像、视频）
+
+    文件以 SHA-256 命名保存在 root/objects 下，内容相同的文件只存一份。
+    索引（SQLite）把 (类别, 键) 映射到文件哈希，例如 ("cover", 封面地址)、
+    ("media", "bvid:cid:清晰度")，并记录来源地址和 ETag/Last-Modified。
+    每个文件按引用它的键计数，release/expire 之后由 gc 删除不再被引用的文件。
+    materialize 无法硬链接而复制出去的文件记录在 copies 表中。
+    文件写入后不会再修改，读取方不会看到写了一半的内容。
+    """
+
+    def __init__(self, root="./cache/store"):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.tmp_dir = os.path.join(root, "tmp")
+        self._lock = threading.RLock()
+        self._db = None
+
+    def _conn(self):
+        if self._db is None:
+            os.makedirs(self.objects_dir, exist_ok=True)
+            os.makedirs(self.tmp_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(self.root, "index.db"), check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "hash TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                "refcount INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS refs ("
+                "kind TEXT NOT NULL, key TEXT NOT NULL, hash TEXT NOT NULL, "
+                "url TEXT, etag TEXT, last_modified TEXT, used_at REAL NOT NULL, "
+                "validated_at REAL, PRIMARY KEY (kind, key))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS copies ("
+                "kind TEXT NOT NULL, key TEXT NOT NULL, dest TEXT NOT NULL, "
+                "PRIMARY KEY (kind, key, dest))"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(refs)")}
+            if "validated_at" not in columns:
+                self._db.execute("ALTER TABLE refs ADD COLUMN validated_at REAL")
+            self._db.commit()
+        return self._db
+
+    def blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def temp_path(self, suffix=".part"):
+        """返回存储目录内的临时文件路径（与 objects 在同一分区，写完后可直接改名）"""
+        self._conn()
+        fd, path = tempfile.mkstemp(dir=self.tmp_dir, suffix=suffix)
+        os.close(fd)
+        return path
+
+    @staticmethod
+    def hash_file(path):
+        """返回 (sha256, 字节数)"""
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+                size += len(chunk)
+        return digest.hexdigest(), size
+
+    def put_file(self, path, kind, key, url=None, etag=None, last_modified=None,
+                 expected_size=None, expected_hash=None):
+        """把 path 移入存储并让 (kind, key) 指向它，返回存储中的文件路径
+
+        大小或哈希与预期不符时删除 path 并抛出 StoreIntegrityError；
+        存储中已有相同内容时直接丢弃 path。
+        """
+        digest, size = self.hash_file(path)
+        if expected_size is not None and size != int(expected_size):
+            os.remove(path)
+            raise StoreIntegrityError(f"{key}: 大小不一致 {size}/{expected_size}")
+        if expected_hash is not None and digest != expected_hash:
+            os.remove(path)
+            raise StoreIntegrityError(f"{key}: 哈希不一致")
+
+        blob = self.blob_path(digest)
+        with self._lock:
+            db = self._conn()
+            row = db.execute("SELECT size FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            if row is not None and os.path.exists(blob):
+                os.remove(path)
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                try:
+                    os.replace(path, blob)
+                except OSError:
+                    # 不在同一分区时复制
+                    shutil.move(path, blob)
+                db.execute(
+                    "INSERT OR IGNORE INTO blobs (hash, size, refcount, created_at) VALUES (?, ?, 0, ?)",
+                    (digest, size, time.time())
+                )
+            self._set_ref(db, kind, key, digest, url, etag, last_modified)
+            db.commit()
+        return blob
+
+    def _set_ref(self, db, kind, key, digest, url, etag, last_modified):
+        row = db.execute("SELECT hash FROM refs WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+        if row is None or row["hash"] != digest:
+            if row is not None:
+                db.execute("UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?", (row["hash"],))
+            db.execute("UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?", (digest,))
+        now = time.time()
+        db.execute(
+            "INSERT OR REPLACE INTO refs (kind, key, hash, url, etag, last_modified, used_at, validated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (kind, key, digest, url, etag, last_modified, now, now)
+        )
+
+    def lookup(self, kind, key, verify=False):
+        """查找 (kind, key)，返回 {"path", "hash", "size", "url", "etag", "last_modified", "validated_at"}
+
+        文件缺失、大小不符（或 verify=True 时哈希不符）视为损坏，移除该引用并返回 None。
+        """
+        with self._lock:
+            db = self._conn()
+            row = db.execute(
+                "SELECT refs.*, blobs.size FROM refs JOIN blobs ON refs.hash = blobs.hash "
+                "WHERE refs.kind = ? AND refs.key = ?", (kind, key)
+            ).fetchone()
+            if row is None:
+                return None
+            path = self.blob_path(row["hash"])
+            intact = os.path.exists(path) and os.path.getsize(path) == row["size"]
+            if intact and verify:
+                intact = self.hash_file(path)[0] == row["hash"]
+            if not intact:
+                print(f"存储文件损坏，已移除: {kind} {key}")
+                self._drop_blob(db, row["hash"])
+                db.commit()
+                return None
+            db.execute("UPDATE refs SET used_at = ? WHERE kind = ? AND key = ?", (time.time(), kind, key))
+            db.commit()
+        return {
+            "path": path,
+            "hash": row["hash"],
+            "size": row["size"],
+            "url": row["url"],
+            "etag": row["etag"],
+            "last_modified": row["last_modified"],
+            "validated_at": row["validated_at"] or 0,
+        }
+
+    @staticmethod
+    def is_fresh(entry, max_age):
+        """距离上次与服务器确认不超过 max_age 秒"""
+        return time.time() - entry["validated_at"] < max_age
+
+    @staticmethod
+    def conditional_headers(entry):
+        """按存储的 ETag/Last-Modified 生成条件请求头"""
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def touch(self, kind, key, etag=None, last_modified=None):
+        """内容未变化（服务器返回 304）时更新使用时间、确认时间和校验信息"""
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            db.execute(
+                "UPDATE refs SET used_at = ?, validated_at = ?, etag = COALESCE(?, etag), "
+                "last_modified = COALESCE(?, last_modified) WHERE kind = ? AND key = ?",
+                (now, now, etag, last_modified, kind, key)
+            )
+            db.commit()
+
+    def _drop_blob(self, db, digest):
+        db.execute("DELETE FROM copies WHERE (kind, key) IN (SELECT kind, key FROM refs WHERE hash = ?)", (digest,))
+        db.execute("DELETE FROM refs WHERE hash = ?", (digest,))
+        db.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def materialize(self, kind, key, dest):
+        """把存储中的文件放到 dest（优先硬链接，失败时复制），返回 dest；不存在时返回 None
+
+        先在 dest 旁边生成临时文件再改名，读取 dest 的一方只会看到旧文件或完整的新文件。
+        复制出去的 dest 记录下来，release_unlinked 据此判断文件是否还在使用。
+        """
+        entry = self.lookup(kind, key)
+        if entry is None:
+            return None
+        directory = os.path.dirname(dest)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(dest) and os.path.samefile(dest, entry["path"]):
+            return dest
+        tmp_path = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        copied = False
+        try:
+            try:
+                os.link(entry["path"], tmp_path)
+            except OSError:
+                shutil.copyfile(entry["path"], tmp_path)
+                copied = True
+            os.replace(tmp_path, dest)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        dest_key = os.path.abspath(dest)
+        with self._lock:
+            db = self._conn()
+            # dest 被替换后，之前记录在它上面的复制不再有效
+            db.execute("DELETE FROM copies WHERE dest = ?", (dest_key,))
+            if copied:
+                db.execute("INSERT OR IGNORE INTO copies (kind, key, dest) VALUES (?, ?, ?)", (kind, key, dest_key))
+            db.commit()
+        return dest
+
+    def release(self, kind, key):
+        """删除一个引用，文件在 gc 时回收"""
+        with self._lock:
+            db = self._conn()
+            row = db.execute("SELECT hash FROM refs WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+            if row is None:
+                return
+            db.execute("DELETE FROM refs WHERE kind = ? AND key = ?", (kind, key))
+            db.execute("DELETE FROM copies WHERE kind = ? AND key = ?", (kind, key))
+            db.execute("UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?", (row["hash"],))
+            db.commit()
+
+    def expire(self, kind, max_age):
+        """释放 max_age 秒内没有用过的某类引用"""
+        cutoff = time.time() - max_age
+        with self._lock:
+            keys = [row["key"] for row in self._conn().execute(
+                "SELECT key FROM refs WHERE kind = ? AND used_at < ?", (kind, cutoff)
+            )]
+        for key in keys:
+            self.release(kind, key)
+        return len(keys)
+
+    def release_unlinked(self, kind):
+        """释放用户已删除输出文件的引用，返回释放的数量
+
+        materialize 用硬链接把文件放到用户目录，用户删除那个文件后链接数回到 1；
+        复制出去的文件不影响链接数，按 copies 表检查它们是否还在。
+        """
+        with self._lock:
+            db = self._conn()
+            rows = db.execute("SELECT key, hash FROM refs WHERE kind = ?", (kind,)).fetchall()
+            copies = {}
+            for row in db.execute("SELECT key, dest FROM copies WHERE kind = ?", (kind,)):
+                copies.setdefault(row["key"], []).append(row["dest"])
+        released = 0
+        for row in rows:
+            try:
+                links = os.stat(self.blob_path(row["hash"])).st_nlink
+            except OSError:
+                links = 1
+            if links > 1 or any(os.path.exists(dest) for dest in copies.get(row["key"], [])):
+                continue
+            self.release(kind, row["key"])
+            released += 1
+        return released
+
+    def gc(self):
+        """删除引用计数为 0 的文件、索引之外的残留文件和临时文件，返回 (文件数, 字节数)"""
+        removed, freed = 0, 0
+        with self._lock:
+            db = self._conn()
+            for row in db.execute("SELECT hash, size FROM blobs WHERE refcount <= 0").fetchall():
+                path = self.blob_path(row["hash"])
+                if os.path.exists(path):
+                    os.remove(path)
+                    removed += 1
+                    freed += row["size"]
+                db.execute("DELETE FROM blobs WHERE hash = ?", (row["hash"],))
+            db.commit()
+            known = {row["hash"] for row in db.execute("SELECT hash FROM blobs")}
+
+            # 进程中断时留下的文件
+            for directory, _, files in os.walk(self.objects_dir):
+                for name in files:
+                    if name not in known:
+                        path = os.path.join(directory, name)
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+                        removed += 1
+            for name in os.listdir(self.tmp_dir):
+                path = os.path.join(self.tmp_dir, name)
+                if time.time() - os.path.getmtime(path) > 24 * 3600:
+                    os.remove(path)
+        return removed, freed
+
+    def collect(self, max_age=None):
+        """释放长时间未使用的封面和头像、用户已删除的视频，并回收空间"""
+        max_age = max_age or {"cover": 30 * 24 * 3600, "face": 30 * 24 * 3600}
+        for kind, age in max_age.items():
+            self.expire(kind, age)
+        self.release_unlinked("media")
+        return self.gc()
+
+    def stats(self):
+        with self._lock:
+            db = self._conn()
+            blobs, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            refs = {row[0]: row[1] for row in db.execute("SELECT kind, COUNT(*) FROM refs GROUP BY kind")}
+        return {"blobs": blobs, "bytes": size, "refs": refs}
+
+
+# 模块级共享实例
+media_store = MediaStore()
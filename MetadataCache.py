@@ -0,0 +1,176 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MetadataCache:
+    """视频元数据缓存（/x/web-interface/view 的 data 字段）
+
+    以 bvid 和 avid 为键，内存中保留最近使用的条目，全部条目写入 SQLite 持久化。
+    ttl 内的条目直接返回；超过 ttl 但未超过 stale_ttl 的条目先返回旧值，
+    同时在后台重新获取（stale-while-revalidate）。
+    从推荐流预填的条目只包含部分字段（partial），需要完整数据时视为未命中。
+    """
+
+    def __init__(self, db_path="./cache/metadata.db", ttl=3600, stale_ttl=7 * 24 * 3600, max_memory_entries=512):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_memory_entries = max_memory_entries
+        self._lock = threading.RLock()
+        self._memory = OrderedDict()  # key -> (data, fetched_at, partial)
+        self._db = None
+        self._revalidating = set()
+
+    def _conn(self):
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                "key TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL, partial INTEGER NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+
+    @staticmethod
+    def keys_for(data):
+        """一条元数据对应的所有缓存键"""
+        keys = []
+        if data.get("bvid"):
+            keys.append(str(data["bvid"]))
+        if data.get("aid"):
+            keys.append(str(data["aid"]))
+        return keys
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, key):
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry
+
+        row = self._conn().execute(
+            "SELECT data, fetched_at, partial FROM metadata WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        entry = (json.loads(row[0]), row[1], bool(row[2]))
+        self._remember(key, entry)
+        return entry
+
+    def put(self, data, partial=False, fetched_at=None):
+        """写入一条元数据；不会用部分数据覆盖仍然新鲜的完整数据"""
+        keys = self.keys_for(data)
+        if not keys:
+            return
+        fetched_at = fetched_at or time.time()
+        with self._lock:
+            if partial:
+                existing = self._lookup(keys[0])
+                if existing and not existing[2] and fetched_at - existing[1] < self.ttl:
+                    return
+
+            entry = (data, fetched_at, partial)
+            payload = json.dumps(data, ensure_ascii=False)
+            db = self._conn()
+            for key in keys:
+                self._remember(key, entry)
+                db.execute(
+                    "INSERT OR REPLACE INTO metadata (key, data, fetched_at, partial) VALUES (?, ?, ?, ?)",
+                    (key, payload, fetched_at, int(partial))
+                )
+            db.commit()
+
+    def get(self, key, require_full=False, revalidate=None):
+        """读取缓存
+
+        revalidate: 无参函数，返回最新的 data（失败返回 None）；
+        命中过期但仍可用的条目时在后台调用它刷新缓存。
+        """
+        key = str(key)
+        with self._lock:
+            entry = self._lookup(key)
+        if entry is None:
+            return None
+
+        data, fetched_at, partial = entry
+        if require_full and partial:
+            return None
+
+        age = time.time() - fetched_at
+        if age < self.ttl:
+            return data
+        if age < self.stale_ttl:
+            if revalidate is not None:
+                self._revalidate_in_background(key, revalidate)
+            return data
+        return None
+
+    def _revalidate_in_background(self, key, revalidate):
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def run():
+            try:
+                data = revalidate()
+                if data:
+                    self.put(data)
+            except Exception as e:
+                print(f"元数据刷新失败 ({key}): {str(e)}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def seed_from_feed(self, items):
+        """用推荐流条目预填缓存（部分字段）"""
+        for item in items or []:
+            if not item.get("bvid"):
+                continue
+            self.put({
+                "bvid": item.get("bvid", ""),
+                "aid": item.get("id", 0),
+                "cid": item.get("cid", 0),
+                "title": item.get("title", ""),
+                "duration": item.get("duration", 0),
+                "pic": item.get("pic", ""),
+                "pubdate": item.get("pubdate", 0),
+                "owner": item.get("owner", {}),
+            }, partial=True)
+
+    def invalidate(self, key):
+        key = str(key)
+        with self._lock:
+            entry = self._lookup(key)
+            keys = self.keys_for(entry[0]) if entry else [key]
+            db = self._conn()
+            for k in keys:
+                self._memory.pop(k, None)
+                db.execute("DELETE FROM metadata WHERE key = ?", (k,))
+            db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            db = self._conn()
+            db.execute("DELETE FROM metadata")
+            db.commit()
+
+
+# 模块级共享实例
+metadata_cache = MetadataCache()
@@ -0,0 +1,269 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import HttpClient as http
+
+
+# 首字节超过这个时间（秒）仍没有到达时，向下一个镜像发同样的请求
+HEDGE_AFTER = 1.0
+
+# 同时等待响应头的请求数上限（与 HttpClient 每个主机的连接池大小一致）
+HEDGE_WORKERS = 16
+
+# 请求还在线程池中排队时，每隔这么多秒检查一次它是否已经开始
+HEDGE_POLL = 0.05
+
+# 排序时按下载 REFERENCE_BYTES 字节所需的时间比较镜像（首字节延迟 + 传输时间）
+REFERENCE_BYTES = 4 * 1024 * 1024
+
+# 超过这个时间没有更新的测量值不再使用
+STALE_AFTER = 30 * 24 * 3600
+
+# 吞吐量样本至少包含这么多字节，太短的传输主要反映延迟
+MIN_SAMPLE_BYTES = 256 * 1024
+
+# 测量值先保存在内存中，更新后最多过这么多秒写入数据库
+FLUSH_INTERVAL = 5.0
+
+
+def mirror_host(url):
+    """镜像的标识：地址的主机部分（含端口）"""
+    return urlsplit(url).netloc
+
+
+class MirrorStats:
+    """各 CDN 镜像（主机）的首字节延迟和吞吐量
+
+    延迟和吞吐量为指数滑动平均，连续失败的次数使镜像排名靠后，成功一次即清零。
+    测量值保存在 SQLite 中，下次启动时直接从最快的镜像开始。记录只更新内存，
+    更新过的镜像在 flush_interval 秒后统一写入数据库，退出前调用 flush() 保存剩余的部分。
+    """
+
+    def __init__(self, db_path="./cache/mirrors.db", alpha=0.3, flush_interval=FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.alpha = alpha
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        self._hosts = None  # 主机 -> {"latency", "throughput", "failures", "updated_at"}
+        self._dirty = set()  # 还没有写入数据库的主机
+        self._timer = None
+
+    def _conn(self):
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS mirrors ("
+                "host TEXT PRIMARY KEY, latency REAL, throughput REAL, "
+                "failures INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+
+    def _entries(self):
+        if self._hosts is None:
+            with self._db_lock:
+                self._hosts = {
+                    row["host"]: {key: row[key] for key in ("latency", "throughput", "failures", "updated_at")}
+                    for row in self._conn().execute("SELECT * FROM mirrors")
+                }
+        return self._hosts
+
+    def _average(self, old, sample):
+        return sample if old is None else self.alpha * sample + (1 - self.alpha) * old
+
+    def _update(self, url, change):
+        host = mirror_host(url)
+        with self._lock:
+            entries = self._entries()
+            entry = entries.setdefault(host, {"latency": None, "throughput": None, "failures": 0, "updated_at": 0})
+            change(entry)
+            entry["updated_at"] = time.time()
+            self._dirty.add(host)
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """把更新过的测量值写入数据库"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            rows = []
+            for host in self._dirty:
+                entry = self._hosts[host]
+                rows.append((host, entry["latency"], entry["throughput"], entry["failures"], entry["updated_at"]))
+            self._dirty.clear()
+        if not rows:
+            return
+        with self._db_lock:
+            try:
+                db = self._conn()
+                db.executemany(
+                    "INSERT OR REPLACE INTO mirrors (host, latency, throughput, failures, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"保存镜像测速失败: {str(e)}")
+
+    def record(self, url, latency=None, num_bytes=0, seconds=0):
+        """记录一次成功的请求：首字节延迟（秒），或传输的字节数和用时"""
+        def change(entry):
+            entry["failures"] = 0
+            if latency is not None:
+                entry["latency"] = self._average(entry["latency"], latency)
+            if num_bytes >= MIN_SAMPLE_BYTES and seconds > 0:
+                entry["throughput"] = self._average(entry["throughput"], num_bytes / seconds)
+        self._update(url, change)
+
+    def record_failure(self, url):
+        def change(entry):
+            entry["failures"] += 1
+        self._update(url, change)
+
+    def get(self, url):
+        """镜像的测量值，没有时返回 None"""
+        with self._lock:
+            entry = self._entries().get(mirror_host(url))
+            return dict(entry) if entry else None
+
+    def score(self, url):
+        """下载 REFERENCE_BYTES 字节的预计用时（秒），越小越好；没有测量值时返回 None"""
+        entry = self.get(url)
+        if entry is None or time.time() - entry["updated_at"] > STALE_AFTER:
+            return None
+        if entry["latency"] is None and entry["throughput"] is None:
+            # 只有失败记录
+            return float("inf") if entry["failures"] else None
+        seconds = entry["latency"] or 0
+        if entry["throughput"]:
+            seconds += REFERENCE_BYTES / entry["throughput"]
+        return seconds * 2 ** min(entry["failures"], 8)
+
+    def order(self, urls):
+        """按预计用时排序地址，最快的在前
+
+        没有测量值的镜像按已测镜像的中位数参与排序（排在只有失败记录的镜像之前），
+        同分时保持原来的顺序（主地址在前）。
+        """
+        urls = [url for url in urls if url]
+        scores = [self.score(url) for url in urls]
+        known = sorted(score for score in scores if score is not None and score != float("inf"))
+        default = known[len(known) // 2] if known else 0
+        ranked = sorted(range(len(urls)), key=lambda i: (default if scores[i] is None else scores[i], i))
+        return [urls[i] for i in ranked]
+
+
+# 模块级共享实例
+mirror_stats = MirrorStats()
+
+# 对冲请求共用的线程池：每个线程只等待响应头，响应体由调用方读取
+_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedged-get")
+
+
+def hedged_get(urls, hedge_after=HEDGE_AFTER, stats=None, **kwargs):
+    """向镜像列表发同一个请求（stream=True），返回 (地址, 响应)
+
+    先请求第一个地址；开始执行后 hedge_after 秒内没有收到响应头（在共享线程池中排队的时间不算），
+    或者请求出错（连接失败、HTTP 4xx/5xx）时，再向下一个地址发同样的请求，
+    先返回成功响应的镜像胜出，其余请求的响应一到达就关闭。
+    hedge_after 为 None 时只在出错时换下一个地址。每个镜像的首字节延迟和失败记录到 stats。
+    全部失败时返回最后一个错误响应（调用方可据此刷新签名地址），都没有响应时抛出最后的异常。
+    """
+    stats = stats or mirror_stats
+    urls = [url for url in urls if url]
+    if not urls:
+        raise ValueError("没有可用的地址")
+    kwargs["stream"] = True
+    results = queue.Queue()
+    lock = threading.Lock()
+    decided = threading.Event()
+    began = {}  # 地址序号 -> 请求开始执行的时间
+
+    def attempt(index):
+        url = urls[index]
+        if decided.is_set():
+            # 已经有镜像胜出，排队中的请求不再发出
+            return
+        started = began[index] = time.perf_counter()
+        try:
+            response = http.get(url, **kwargs)
+        except Exception as e:
+            stats.record_failure(url)
+            results.put((url, None, e))
+            return
+        if response.status_code >= 400:
+            stats.record_failure(url)
+        else:
+            stats.record(url, latency=time.perf_counter() - started)
+        with lock:
+            if not decided.is_set():
+                results.put((url, response, None))
+                return
+        # 落选的请求
+        response.close()
+
+    launched = finished = 0
+    failed = None
+    error = None
+    while True:
+        if finished == launched and launched < len(urls):
+            _executor.submit(attempt, launched)
+            launched += 1
+        if finished == launched:
+            break
+        wait = None
+        if hedge_after is not None and launched < len(urls):
+            # 从最近发出的请求真正开始执行时计时
+            latest = began.get(launched - 1)
+            wait = HEDGE_POLL if latest is None else max(0.0, latest + hedge_after - time.perf_counter())
+        try:
+            url, response, e = results.get(timeout=wait)
+        except queue.Empty:
+            latest = began.get(launched - 1)
+            if latest is None or time.perf_counter() - latest < hedge_after:
+                continue
+            # 首字节太慢，同时请求下一个镜像
+            _executor.submit(attempt, launched)
+            launched += 1
+            continue
+        finished += 1
+        failover = launched < len(urls) and finished < launched
+        if response is not None and response.status_code < 400:
+            with lock:
+                decided.set()
+            # 已经到达但还没有处理的落选响应
+            while not results.empty():
+                loser = results.get()[1]
+                if loser is not None:
+                    loser.close()
+            if failed is not None:
+                failed[1].close()
+            return url, response
+        if response is not None:
+            if failed is not None:
+                failed[1].close()
+            failed = (url, response)
+        else:
+            error = e
+        if failover:
+            # 其他请求还在等待时，出错的请求也立即由下一个镜像替补
+            _executor.submit(attempt, launched)
+            launched += 1
+    if failed is not None:
+        return failed
+    raise error
@@ -3,19 +3,16 @@ from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkRequest
 class CustomNetworkAccessManager(QNetworkAccessManager):
     """自定义网络访问管理器，添加必要的HTTP头部"""
     
-    def __init__(self, cookies, headers, parent=None):
+    def __init__(self, cookie_header, headers, parent=None):
         super().__init__(parent)
-        self.cookies = cookies
-        self.headers = headers
+        # 头部在构造时一次性编码好，createRequest 中直接复用
+        self.raw_headers = [(key.encode(), value.encode()) for key, value in headers.items()]
+        if cookie_header:
+            self.raw_headers.append((b"Cookie", cookie_header.encode()))
     
     def createRequest(self, op, request, outgoingData=None):
-        # 添加自定义头部
-        for key, value in self.headers.items():
-            request.setRawHeader(key.encode(), value.encode())
-        
-        # 添加Cookie
-        cookie_str = "; ".join([f"{k}={v}" for k, v in self.cookies.items()])
-        if cookie_str:
-            request.setRawHeader(b"Cookie", cookie_str.encode())
+        # 添加自定义头部和Cookie
+        for key, value in self.raw_headers:
+            request.setRawHeader(key, value)
         
         return super().createRequest(op, request, outgoingData)
\ No newline at end of file
@@ -0,0 +1,146 @@
+import heapq
+import threading
+import time
+from urllib.parse import urlparse, parse_qs
+
+
+class PlayurlCache:
+    """playurl 解析结果缓存，键为 (bvid, cid, qn, fnval)
+
+    upos 地址带有 deadline 参数（Unix 时间戳），缓存的地址会一直使用到
+    deadline 前 safety_margin 秒；最近用过的条目会在过期前 refresh_ahead 秒
+    由后台线程提前刷新，重复播放时不必再请求 playurl。
+    """
+
+    def __init__(self, resolver, safety_margin=60, refresh_ahead=300, default_lifetime=1800, keep_warm=1800):
+        # resolver(bvid, cid, qn, fnval) -> playurl 的 data 字段
+        self.resolver = resolver
+        self.safety_margin = safety_margin
+        self.refresh_ahead = refresh_ahead
+        self.default_lifetime = default_lifetime
+        self.keep_warm = keep_warm
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> {"data", "expires_at", "refresh_at", "last_used"}
+        self._key_locks = {}
+        self._schedule = []  # (refresh_at, key)
+        self._wakeup = threading.Condition(self._lock)
+        self._worker = None
+
+    @staticmethod
+    def _iter_urls(data):
+        for item in data.get("durl", []) or []:
+            yield item.get("url", "")
+            yield from item.get("backup_url", []) or []
+        dash = data.get("dash") or {}
+        for stream in (dash.get("video", []) or []) + (dash.get("audio", []) or []):
+            yield stream.get("baseUrl") or stream.get("base_url", "")
+            yield from stream.get("backupUrl") or stream.get("backup_url") or []
+
+    def expires_at(self, data):
+        """取所有地址中最早的 deadline，没有 deadline 时按默认有效期计算"""
+        deadlines = []
+        for url in self._iter_urls(data):
+            if not url:
+                continue
+            value = parse_qs(urlparse(url).query).get("deadline", [None])[0]
+            if value and value.isdigit():
+                deadlines.append(int(value))
+        if deadlines:
+            return min(deadlines)
+        return time.time() + self.default_lifetime
+
+    def _is_valid(self, entry, now):
+        return entry is not None and now < entry["expires_at"] - self.safety_margin
+
+    def peek(self, bvid, cid, qn=112, fnval=1):
+        """只读缓存，不发请求；没有有效条目时返回 None"""
+        key = (str(bvid), str(cid), int(qn), int(fnval))
+        with self._lock:
+            entry = self._entries.get(key)
+            if self._is_valid(entry, time.time()):
+                entry["last_used"] = time.time()
+                return entry["data"]
+        return None
+
+    def put(self, bvid, cid, qn, fnval, data):
+        key = (str(bvid), str(cid), int(qn), int(fnval))
+        self._store(key, data)
+
+    def get(self, bvid, cid, qn=112, fnval=1, force=False):
+        """获取 playurl 数据，缓存失效或 force=True 时重新解析"""
+        key = (str(bvid), str(cid), int(qn), int(fnval))
+        if not force:
+            data = self.peek(*key)
+            if data is not None:
+                return data
+
+        # 同一个键同时只解析一次
+        with self._key_lock(key):
+            if not force:
+                data = self.peek(*key)
+                if data is not None:
+                    return data
+            data = self.resolver(*key)
+            self._store(key, data)
+            return data
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _refresh(self, key):
+        """后台刷新：重新解析但不算作一次使用，没人用的条目过了 keep_warm 就不再刷新"""
+        with self._key_lock(key):
+            self._store(key, self.resolver(*key), refresh=True)
+
+    def _store(self, key, data, refresh=False):
+        now = time.time()
+        expires_at = self.expires_at(data)
+        # 刷新间隔至少 30 秒，避免有效期很短的地址导致频繁刷新
+        refresh_at = max(now + 30, expires_at - self.refresh_ahead)
+        with self._lock:
+            previous = self._entries.get(key)
+            self._entries[key] = {
+                "data": data,
+                "expires_at": expires_at,
+                "refresh_at": refresh_at,
+                "last_used": previous["last_used"] if refresh and previous else now,
+            }
+            heapq.heappush(self._schedule, (refresh_at, key))
+            self._ensure_worker()
+            self._wakeup.notify()
+
+    def invalidate(self, bvid, cid, qn=112, fnval=1):
+        key = (str(bvid), str(cid), int(qn), int(fnval))
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._worker.start()
+
+    def _refresh_loop(self):
+        """后台提前刷新最近用过、即将过期的条目"""
+        while True:
+            with self._lock:
+                while not self._schedule or self._schedule[0][0] > time.time():
+                    timeout = self._schedule[0][0] - time.time() if self._schedule else None
+                    self._wakeup.wait(timeout)
+                refresh_at, key = heapq.heappop(self._schedule)
+                entry = self._entries.get(key)
+                # 条目已被替换或移除，或者长时间没人用，就不再刷新
+                if entry is None or entry["refresh_at"] != refresh_at:
+                    continue
+                if time.time() - entry["last_used"] > self.keep_warm:
+                    continue
+
+            try:
+                self._refresh(key)
+            except Exception as e:
+                print(f"playurl 刷新失败 {key}: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._schedule.clear()
@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import deque
+
+
+class _StreamState:
+    def __init__(self):
+        self.downloaded = 0
+        self.total = None
+        self.segments = None
+        self.samples = deque()  # (时间, 已下载字节)，用于计算最近的速度
+        self.started_at = time.monotonic()
+        self.finished = False
+        self.error = None
+        self.dirty = False
+
+
+class ProgressReporter:
+    """下载进度事件
+
+    下载线程调用 update 只记录最新状态（加锁赋值，不做 I/O），由一个后台线程
+    每隔 min_interval 秒把有变化的流合并成一个事件交给订阅者，订阅者再慢也
+    不会拖慢下载。finish 的事件立即投递；没有正在跟踪的流时后台线程退出。
+
+    事件为字典：
+        key       流的标识（调用方决定，例如 (任务 id, "视频流")）
+        downloaded/total  已下载字节 / 总字节（未知时为 None）
+        percent   百分比（总大小未知时为 None）
+        rate      最近 window 秒的平均速度（字节/秒）
+        eta       预计剩余秒数（未知时为 None）
+        elapsed   已用时间（秒）
+        segments  分段状态列表 [{"start", "end", "written", "state"}]，没有时为 None
+        finished / error  是否结束，失败原因
+    """
+
+    def __init__(self, min_interval=0.5, window=5.0):
+        self.min_interval = min_interval
+        self.window = window
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._streams = {}
+        self._subscribers = []
+        self._worker = None
+        self._urgent = False
+
+    def subscribe(self, callback):
+        """callback(event) 在投递线程中调用"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def update(self, key, downloaded, total=None, segments=None):
+        """记录进度；segments 可以是返回分段状态列表的函数，投递时才调用"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._streams.get(key)
+            if state is None:
+                state = self._streams[key] = _StreamState()
+            state.downloaded = downloaded
+            state.total = total or None
+            if segments is not None:
+                state.segments = segments
+            state.samples.append((now, downloaded))
+            while len(state.samples) > 2 and now - state.samples[0][0] > self.window:
+                state.samples.popleft()
+            state.dirty = True
+            self._ensure_worker()
+
+    def finish(self, key, error=None):
+        """流结束（成功或失败），立即投递最后一个事件并停止跟踪"""
+        with self._lock:
+            state = self._streams.get(key)
+            if state is None:
+                state = self._streams[key] = _StreamState()
+            state.finished = True
+            state.error = str(error) if error else None
+            state.dirty = True
+            self._urgent = True
+            self._ensure_worker()
+            self._wakeup.notify()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._deliver_loop, daemon=True)
+            self._worker.start()
+
+    def _event(self, key, state, now):
+        rate = 0.0
+        if len(state.samples) >= 2:
+            (t0, b0), (t1, b1) = state.samples[0], state.samples[-1]
+            if t1 > t0:
+                rate = (b1 - b0) / (t1 - t0)
+        total = state.total
+        eta = None
+        if total and rate > 0:
+            eta = max(0.0, (total - state.downloaded) / rate)
+        segments = state.segments
+        return {
+            "key": key,
+            "downloaded": state.downloaded,
+            "total": total,
+            "percent": state.downloaded / total * 100 if total else None,
+            "rate": rate,
+            "eta": 0.0 if state.finished and not state.error else eta,
+            "elapsed": now - state.started_at,
+            "segments": segments,
+            "finished": state.finished,
+            "error": state.error,
+        }
+
+    def _collect(self):
+        now = time.monotonic()
+        events = []
+        for key, state in list(self._streams.items()):
+            if not state.dirty:
+                continue
+            state.dirty = False
+            events.append(self._event(key, state, now))
+            if state.finished:
+                del self._streams[key]
+        return events
+
+    def _deliver_loop(self):
+        while True:
+            with self._lock:
+                if not self._urgent:
+                    self._wakeup.wait(self.min_interval)
+                self._urgent = False
+                events = self._collect()
+                idle = not self._streams
+                if idle:
+                    self._worker = None
+            for event in events:
+                # 分段状态在投递线程中生成快照
+                if callable(event["segments"]):
+                    try:
+                        event["segments"] = event["segments"]()
+                    except Exception:
+                        event["segments"] = None
+                for callback in list(self._subscribers):
+                    try:
+                        callback(event)
+                    except Exception as e:
+                        print(f"进度回调失败: {str(e)}")
+            if idle:
+                return
+
+
+def format_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.1f}{unit}" if unit != "B" else f"{int(num_bytes)}B"
+        num_bytes /= 1024
+
+
+def log_event(event):
+    """控制台日志订阅者：每个事件打印一行"""
+    name = event["key"][-1] if isinstance(event["key"], tuple) else event["key"]
+    if event["error"]:
+        print(f"[{name}] 失败: {event['error']}")
+        return
+    if event["finished"]:
+        print(f"[{name}] 下载完成 {format_size(event['downloaded'])}，用时 {event['elapsed']:.1f}s")
+        return
+    parts = [format_size(event["downloaded"])]
+    if event["total"]:
+        parts[0] += f"/{format_size(event['total'])} ({event['percent']:.1f}%)"
+    parts.append(f"{format_size(event['rate'])}/s")
+    if event["eta"] is not None:
+        parts.append(f"剩余 {event['eta']:.0f}s")
+    print(f"[{name}] " + "  ".join(parts))
@@ -1,24 +1,264 @@
 import threading
+import selectors
 import socket
-import requests as rq
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import time
+import HttpClient as http
+from ChunkCache import chunk_cache, url_identity
+from MirrorStats import hedged_get, mirror_stats
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import logging
 
 logger = logging.getLogger("BilibiliPlayer")
 
+# 每次从上游读取并转发的字节数
+CHUNK_SIZE = 64 * 1024
+
+# 每个上游请求最多覆盖的缓存块数，拖动或暂停后不必等一个很长的请求结束
+MAX_RUN_CHUNKS = 16
+
+# 预读窗口：默认保持播放位置之后 30 秒的数据；不知道时长（码率）时按字节数
+READ_AHEAD_SECONDS = 30
+READ_AHEAD_BYTES = 32 * 1024 * 1024
+
+# 需要的块正由其他请求下载时，最多等待的秒数（之后自己请求）
+PENDING_WAIT = 15
+
+
+def abort_upstream(response):
+    """中止上游传输：关闭底层套接字的读端，阻塞在读取中的转发线程立即返回"""
+    try:
+        response.raw.shutdown()
+    except (AttributeError, ValueError, RuntimeError, OSError):
+        # urllib3 2.3 之前没有 shutdown，或者连接已经关闭
+        response.close()
+
+
+class DisconnectMonitor(threading.Thread):
+    """监视正在转发数据的播放器连接
+
+    转发线程大部分时间阻塞在读取上游数据上，只有写入时才会发现播放器已断开；
+    上游慢或卡住时可能要等很久。这里用一个线程 select 所有正在转发的连接，
+    连接可读且读到 EOF（播放器关闭了连接）时立即调用对应的 on_disconnect。
+    """
+
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._watched = {}  # 套接字 -> on_disconnect
+        self._stopped = threading.Event()
+
+    def watch(self, sock, on_disconnect):
+        with self._lock:
+            self._watched[sock] = on_disconnect
+            self._selector.register(sock, selectors.EVENT_READ, on_disconnect)
+
+    def unwatch(self, sock):
+        with self._lock:
+            if self._watched.pop(sock, None) is not None:
+                try:
+                    self._selector.unregister(sock)
+                except (KeyError, ValueError, OSError):
+                    pass
+
+    @staticmethod
+    def _disconnected(sock):
+        try:
+            return sock.recv(1, socket.MSG_PEEK) == b""
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+
+    def run(self):
+        while not self._stopped.is_set():
+            if not self._watched:
+                # Windows 上 select 不接受空集合
+                self._stopped.wait(self.interval)
+                continue
+            try:
+                events = self._selector.select(self.interval)
+            except (OSError, ValueError):
+                # 套接字在 select 期间被注销或关闭
+                continue
+            for key, _ in events:
+                sock = key.fileobj
+                disconnected = self._disconnected(sock)
+                # 播放器在同一连接上发来了新数据时也不再监视，避免空转
+                self.unwatch(sock)
+                if disconnected:
+                    key.data()
+
+    def stop(self):
+        self._stopped.set()
+        for sock in list(self._watched):
+            self.unwatch(sock)
+
+
+class ReadAhead(threading.Thread):
+    """播放位置之后的预读
+
+    记录播放器最近读取到的位置，在后台用范围请求把其后 window 字节
+    （window_seconds 秒，按文件长度和时长换算码率；或直接指定 window_bytes）
+    提前读入代理的块缓存，网络短暂卡顿时播放器仍可从缓存读取。
+    暂停时不再发起新的预读；新的请求落在窗口之外（拖动进度）时中止当前预读，
+    从新位置重新开始。
+    """
+
+    def __init__(self, proxy, window_seconds=READ_AHEAD_SECONDS, window_bytes=None, duration=None):
+        super().__init__(daemon=True)
+        self.proxy = proxy
+        self.window_seconds = window_seconds
+        self.window_bytes = window_bytes
+        self.duration = duration
+        self.position = None
+        self.paused = False
+        self.fetched_bytes = 0
+        self._wakeup = threading.Condition()
+        self._current = None
+        self._seeked = False
+        self._stopped = False
+
+    def window(self):
+        """预读窗口的字节数"""
+        if self.window_bytes is not None:
+            return self.window_bytes
+        length = self.proxy.content_length
+        if self.duration and length:
+            return int(self.window_seconds * length / self.duration)
+        return READ_AHEAD_BYTES
+
+    def note_request(self, start):
+        """播放器发起新的请求；位置不在当前窗口内视为拖动，转到新位置预读"""
+        with self._wakeup:
+            position = self.position
+            self.position = start
+            seek = position is not None and not (
+                position - self.proxy.cache.chunk_size <= start <= position + self.window()
+            )
+            current = self._current if seek else None
+            self._seeked = self._seeked or current is not None
+            self._wakeup.notify()
+        if current is not None:
+            logger.info(f"播放位置跳转到 {start}，重新开始预读")
+            abort_upstream(current)
+
+    def note_position(self, position):
+        """播放器已读取到 position（每发送一段数据调用）"""
+        chunk_size = self.proxy.cache.chunk_size
+        with self._wakeup:
+            moved = self.position is None or position // chunk_size != self.position // chunk_size
+            self.position = position
+            if moved:
+                self._wakeup.notify()
+
+    def set_paused(self, paused):
+        with self._wakeup:
+            self.paused = paused
+            self._wakeup.notify()
+
+    def _next_run(self):
+        """窗口内第一段既未缓存、也没有正在下载的块，返回 (first, last)"""
+        length = self.proxy.content_length
+        if self.paused or self.position is None or not length:
+            return None
+        chunk_size = self.proxy.cache.chunk_size
+        first = self.position // chunk_size
+        last_index = (min(length, self.position + self.window()) - 1) // chunk_size
+        for index in range(first, last_index + 1):
+            if not self.proxy.is_available(index):
+                return index, self.proxy._missing_run(index, last_index)
+        return None
+
+    def run(self):
+        while True:
+            with self._wakeup:
+                target = None
+                while not self._stopped:
+                    target = self._next_run()
+                    if target is not None:
+                        break
+                    self._wakeup.wait(1.0)
+                if self._stopped:
+                    return
+            try:
+                response, offset = self.proxy._open_run(*target)
+                if response is None:
+                    continue
+                with self._wakeup:
+                    self._current = response
+                    self._seeked = False
+                try:
+                    end = min((target[1] + 1) * self.proxy.cache.chunk_size, self.proxy.content_length) - 1
+                    before = self.proxy.served["upstream_bytes"]
+                    self.proxy._relay(response, offset, end + 1, end, None)
+                    self.fetched_bytes += self.proxy.served["upstream_bytes"] - before
+                finally:
+                    with self._wakeup:
+                        self._current = None
+                    self.proxy._close_run(response)
+            except Exception as e:
+                # 被拖动中止时立即转到新位置，其他错误稍后再试
+                with self._wakeup:
+                    if not self._stopped and not self._seeked:
+                        logger.info(f"预读中断: {str(e)}")
+                        self._wakeup.wait(1.0)
+                    self._seeked = False
+
+    def stop(self):
+        with self._wakeup:
+            self._stopped = True
+            current = self._current
+            self._wakeup.notify()
+        if current is not None:
+            abort_upstream(current)
+
+
 class MP4ProxyServer(threading.Thread):
     """MP4代理服务器，直接提供MP4格式视频"""
     
-    def __init__(self, mp4_url, cookies, headers):
+    def __init__(self, mp4_url, cookie_header, headers, url_resolver=None, cache=None,
+                 duration=None, read_ahead=True, read_ahead_seconds=READ_AHEAD_SECONDS, read_ahead_bytes=None):
         super().__init__()
-        self.mp4_url = mp4_url
-        self.cookies = cookies
+        # mp4_url 为源地址或镜像地址列表（主地址和备用地址），请求时按测得的速度排序，
+        # 首字节慢或出错时同时请求下一个镜像
+        self.mp4_urls = [mp4_url] if isinstance(mp4_url, str) else list(mp4_url)
+        self.video_key = url_identity(self.mp4_urls[0])
+        # url_resolver(force=False) 返回当前有效的源地址或镜像列表（走 playurl 缓存），
+        # force=True 时强制重新解析
+        self.url_resolver = url_resolver
+        self.cookie_header = cookie_header
         self.headers = headers
         self.port = 0
         self.server = None
         self.ready = threading.Event()
         self.output_url = ""
         self.daemon = True  # 添加守护线程
+        self.monitor = DisconnectMonitor()
+        self._transfers_lock = threading.Lock()
+        self._transfers = set()  # 正在转发的上游响应
+
+        # 按块缓存已经转发过的数据，拖回已播放的位置时不再请求上游
+        self.cache = cache or chunk_cache
+        self.content_type = "video/mp4"
+        self.served = {"cache_bytes": 0, "upstream_bytes": 0, "upstream_requests": 0}
+        self._pending_lock = threading.Lock()
+        self._pending = {}  # 正在下载的块序号 -> threading.Event（下载结束时置位）
+        self._run_chunks = {}  # 上游响应 -> 该请求登记下载的块
+
+        # 预读：duration 为视频时长（秒），用于把预读秒数换算为字节数
+        self.read_ahead = None
+        if read_ahead:
+            self.read_ahead = ReadAhead(self, read_ahead_seconds, read_ahead_bytes, duration)
+
+        # 基础请求头只构建一次，每个请求只需补上Range；按原始字节缓存，不接受压缩
+        self._base_headers = dict(http.DEFAULT_HEADERS, **{"Accept-Encoding": "identity"})
+        if self.cookie_header:
+            self._base_headers["Cookie"] = self.cookie_header
+        for key, value in self.headers.items():
+            if key.lower() not in ['user-agent', 'referer', 'cookie']:
+                self._base_headers[key] = value
         
     def run(self):
         try:
@@ -26,11 +266,15 @@ class MP4ProxyServer(threading.Thread):
             self.port = self._find_available_port()
             self.output_url = f"http://127.0.0.1:{self.port}/video.mp4"
             
-            # 启动HTTP服务器
-            self.server = HTTPServer(('127.0.0.1', self.port), self._make_handler())
+            # 启动HTTP服务器：每个请求一个线程，拖动进度时新的范围请求不必等待正在进行的传输
+            self.server = ThreadingHTTPServer(('127.0.0.1', self.port), self._make_handler())
+            self.server.daemon_threads = True
+            self.monitor.start()
+            if self.read_ahead:
+                self.read_ahead.start()
             self.ready.set()
             logger.info(f"MP4代理服务器启动: {self.output_url}")
-            logger.info(f"源URL: {self.mp4_url}")
+            logger.info(f"源URL: {self.mp4_urls[0]}（共 {len(self.mp4_urls)} 个镜像）")
             
             # 运行服务器
             self.server.serve_forever()
@@ -39,6 +283,29 @@ class MP4ProxyServer(threading.Thread):
             logger.error(f"MP4代理服务器错误: {str(e)}")
             self.ready.set()  # 确保不会死锁
     
+    @property
+    def active_transfers(self):
+        """正在转发数据的请求数"""
+        return len(self._transfers)
+
+    def current_urls(self, force=False):
+        """获取当前的镜像地址（测得最快的在前），缓存中的地址过期前会被后台刷新"""
+        if self.url_resolver:
+            urls = self.url_resolver(force=force)
+            self.mp4_urls = [urls] if isinstance(urls, str) else list(urls)
+            # 换成另一个文件时，长度和缓存的块也随之切换
+            self.video_key = url_identity(self.mp4_urls[0])
+        return mirror_stats.order(self.mp4_urls)
+
+    @property
+    def content_length(self):
+        """文件总长度（记录在缓存中，同一视频的其他代理实例也可使用），未知时为 None"""
+        return self.cache.length(self.video_key)
+
+    @content_length.setter
+    def content_length(self, value):
+        self.cache.set_length(self.video_key, value)
+    
     def _find_available_port(self):
         """查找可用端口"""
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -47,73 +314,324 @@ class MP4ProxyServer(threading.Thread):
         s.close()
         return port
     
+    def _open_run(self, first, last=None):
+        """从块 first 的开头请求到块 last 的末尾（最多 MAX_RUN_CHUNKS 块）
+
+        返回 (上游响应, 响应数据的起始偏移)；请求超出文件末尾（416）时返回 (None, None)。
+        响应会记录文件总长度和类型。请求的块登记为正在下载，其他请求需要时等待而不重复下载。
+        """
+        if last is None or last - first >= MAX_RUN_CHUNKS:
+            last = first + MAX_RUN_CHUNKS - 1
+        start = first * self.cache.chunk_size
+        end = (last + 1) * self.cache.chunk_size - 1
+        if self.content_length is not None:
+            end = min(end, self.content_length - 1)
+        request_headers = dict(self._base_headers, Range=f"bytes={start}-{end}")
+
+        claimed = self._claim(first, last)
+        try:
+            response, start = self._request_run(request_headers, start)
+        except Exception:
+            self._release(claimed)
+            raise
+        if response is None:
+            self._release(claimed)
+        else:
+            with self._pending_lock:
+                self._run_chunks[response] = claimed
+        return response, start
+
+    def _open_suffix(self, count):
+        """文件长度未知时把后缀范围 bytes=-count 原样转发给上游
+
+        返回 (上游响应, 响应数据的起始偏移)，起点和文件长度以上游的响应为准；416 时返回 (None, None)。
+        """
+        request_headers = dict(self._base_headers, Range=f"bytes=-{count}")
+        return self._request_run(request_headers, None)
+
+    def _request_run(self, request_headers, start):
+        _, response = hedged_get(self.current_urls(), headers=request_headers, timeout=30)
+        if response.status_code in (403, 404, 410) and self.url_resolver:
+            # 所有镜像的签名地址都已失效，重新解析后重试一次
+            response.close()
+            logger.info("源地址已失效，重新获取播放地址")
+            _, response = hedged_get(self.current_urls(force=True), headers=request_headers, timeout=30)
+        self.served["upstream_requests"] += 1
+
+        content_range = response.headers.get("Content-Range", "")
+        if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+            self.content_length = int(content_range.rsplit("/", 1)[1])
+        if response.status_code == 416:
+            response.close()
+            return None, None
+        response.raise_for_status()
+        if response.status_code == 200:
+            # 上游不支持范围请求，从头开始
+            start = 0
+            if response.headers.get("Content-Length", "").isdigit():
+                self.content_length = int(response.headers["Content-Length"])
+        elif start is None:
+            # 后缀范围：起点取自 Content-Range（bytes a-b/总长度）
+            first = content_range[6:].partition("-")[0].strip()
+            if not first.isdigit():
+                response.close()
+                raise Exception(f"无法解析上游的 Content-Range: {content_range}")
+            start = int(first)
+        if self.content_length is None:
+            response.close()
+            raise Exception("上游响应中没有文件长度")
+        self.content_type = response.headers.get("Content-Type", self.content_type)
+        with self._transfers_lock:
+            self._transfers.add(response)
+        return response, start
+
+    def _claim(self, first, last):
+        """把还没有人在下载的块登记为正在下载，返回登记的块"""
+        with self._pending_lock:
+            claimed = [index for index in range(first, last + 1) if index not in self._pending]
+            for index in claimed:
+                self._pending[index] = threading.Event()
+        return claimed
+
+    def _release(self, indices):
+        with self._pending_lock:
+            for index in indices:
+                event = self._pending.pop(index, None)
+                if event is not None:
+                    event.set()
+
+    def is_available(self, index):
+        """块已缓存或正在下载"""
+        return index in self._pending or self.cache.contains(self.video_key, index)
+
+    def _missing_run(self, index, last_index):
+        """从块 index 开始、到 last_index 为止连续缺少（未缓存也没有在下载）的最后一块"""
+        last_index = min(last_index, index + MAX_RUN_CHUNKS - 1)
+        last = index
+        while last < last_index and not self.is_available(last + 1):
+            last += 1
+        return last
+
+    def _close_run(self, response):
+        with self._transfers_lock:
+            self._transfers.discard(response)
+        with self._pending_lock:
+            claimed = self._run_chunks.pop(response, [])
+        self._release(claimed)
+        response.close()
+
+    def set_paused(self, paused):
+        """播放器暂停/继续播放，暂停时不再预读"""
+        if self.read_ahead:
+            self.read_ahead.set_paused(paused)
+
+    def _relay(self, response, offset, pos, end, write):
+        """读取从 offset 开始的上游数据：[pos, end] 内的部分交给 write，完整的块存入缓存
+
+        返回下一个要发送的位置。读到包含 end 的块的末尾即停止。
+        没有 write（预读）时不受播放器读取速度限制，传输速度记录为该镜像的吞吐量。
+        """
+        chunk_size = self.cache.chunk_size
+        video = self.video_key
+        buffer = bytearray()
+        started = time.perf_counter()
+        received = 0
+        for data in response.raw.stream(CHUNK_SIZE, decode_content=False):
+            received += len(data)
+            data_start = offset + len(buffer)
+            buffer += data
+            if offset % chunk_size:
+                # 上游从块的中间开始（后缀范围），不完整的第一块不缓存
+                skipped = min(len(buffer), -offset % chunk_size)
+                del buffer[:skipped]
+                offset += skipped
+            self.served["upstream_bytes"] += len(data)
+            low, high = max(pos, data_start), min(end + 1, data_start + len(data))
+            if low < high:
+                write(data[low - data_start:high - data_start])
+                pos = high
+            while len(buffer) >= chunk_size:
+                self.cache.put(video, offset // chunk_size, buffer[:chunk_size])
+                self._release([offset // chunk_size])
+                del buffer[:chunk_size]
+                offset += chunk_size
+            if pos > end and offset > end:
+                break
+        if buffer and offset + len(buffer) == self.content_length:
+            # 文件的最后一块
+            self.cache.put(video, offset // chunk_size, buffer)
+            self._release([offset // chunk_size])
+        if write is None:
+            mirror_stats.record(response.url, num_bytes=received, seconds=time.perf_counter() - started)
+        return pos
+
+    @staticmethod
+    def _parse_range(header):
+        """解析单个范围 bytes=a-b / bytes=a- / bytes=-n，返回 (start, end)；没有或无法解析时返回 None
+
+        后缀范围的 start 为负数（-n），end 为 None。
+        """
+        if not header or not header.startswith("bytes=") or "," in header:
+            return None
+        first, _, last = header[6:].strip().partition("-")
+        try:
+            if not first:
+                return -int(last), None
+            return int(first), int(last) if last else None
+        except ValueError:
+            return None
+
+    def cache_stats(self):
+        """当前视频的缓存命中统计，本代理从缓存和上游发送的字节数，以及预读的字节数"""
+        stats = dict(self.cache.stats(self.video_key), **self.served)
+        stats["read_ahead_bytes"] = self.read_ahead.fetched_bytes if self.read_ahead else 0
+        return stats
+
     def _make_handler(self):
-        """创建HTTP请求处理程序，直接转发MP4流"""
-        mp4_url = self.mp4_url
-        cookies = self.cookies
-        headers = self.headers
-        
+        """创建HTTP请求处理程序：已缓存的块直接发送，其余向上游请求并写入缓存"""
+        server = self
+
         class MP4Handler(BaseHTTPRequestHandler):
             def do_GET(inner_self):
-                if inner_self.path == "/video.mp4":
-                    try:
-                        # 创建请求头
-                        request_headers = {
-                            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                            "Referer": "https://www.bilibili.com/",
-                            "Range": inner_self.headers.get('Range', '')  # 支持范围请求
-                        }
-                        
-                        # 添加Cookie
-                        cookie_str = "; ".join([f"{k}={v}" for k, v in cookies.items()])
-                        if cookie_str:
-                            request_headers["Cookie"] = cookie_str
-                        
-                        # 添加其他头部
-                        for key, value in headers.items():
-                            if key.lower() not in ['user-agent', 'referer', 'cookie']:
-                                request_headers[key] = value
-                        
-                        logger.info(f"代理请求头: {request_headers}")
-                        
-                        # 流式传输MP4数据
-                        response = rq.get(mp4_url, headers=request_headers, stream=True, cookies=cookies, timeout=30)
-                        response.raise_for_status()
-                        
-                        # 设置响应头
-                        inner_self.send_response(200)
-                        inner_self.send_header('Content-type', 'video/mp4')
-                        inner_self.send_header('Content-Length', str(len(response.content)))
-                        inner_self.send_header('Accept-Ranges', 'bytes')
-                        inner_self.send_header('Access-Control-Allow-Origin', '*')
-                        inner_self.send_header('Access-Control-Allow-Headers', '*')
-                        inner_self.end_headers()
-                        
-                        # 传输数据
-                        for chunk in response.iter_content(chunk_size=8192):  # 8KB chunks
-                            if chunk:
-                                try:
-                                    inner_self.wfile.write(chunk)
-                                except (ConnectionResetError, BrokenPipeError):
-                                    # 客户端断开连接
-                                    logger.info("客户端断开连接")
-                                    break
-                                    
-                    except Exception as e:
-                        logger.error(f"MP4流传输错误: {str(e)}")
-                        inner_self.send_response(500)
-                        inner_self.end_headers()
-                else:
+                if inner_self.path != "/video.mp4":
                     inner_self.send_response(404)
                     inner_self.end_headers()
-            
+                    return
+
+                requested = server._parse_range(inner_self.headers.get('Range'))
+                logger.info(f"代理请求: Range={inner_self.headers.get('Range', '')}")
+                chunk_size = server.cache.chunk_size
+                current = {"response": None}
+                headers_sent = False
+                cancelled = threading.Event()
+
+                sent = {"position": 0}
+
+                def on_disconnect():
+                    cancelled.set()
+                    if current["response"] is not None:
+                        abort_upstream(current["response"])
+
+                def send(data):
+                    inner_self.wfile.write(data)
+                    sent["position"] += len(data)
+                    if server.read_ahead:
+                        server.read_ahead.note_position(sent["position"])
+
+                try:
+                    start, end = requested or (0, None)
+                    offset = None
+                    if start < 0 and server.content_length is None:
+                        # 后缀范围需要文件长度，未知时直接用上游对同一范围的响应回答
+                        current["response"], offset = server._open_suffix(-start)
+                    if start < 0:
+                        if server.content_length is None:
+                            raise Exception("上游响应中没有文件长度")
+                        start = max(0, server.content_length + start)
+
+                    # 文件长度未知或第一块未缓存时先打开上游请求（响应中带有文件长度），
+                    # 请求到下一个已缓存的块之前
+                    total = server.content_length
+                    first = start // chunk_size
+                    if current["response"] is not None:
+                        # 已经打开了后缀范围的上游响应
+                        pass
+                    elif total is None:
+                        current["response"], offset = server._open_run(
+                            first, None if end is None else end // chunk_size
+                        )
+                    elif start < total and not server.is_available(first):
+                        last_index = (total - 1 if end is None else min(end, total - 1)) // chunk_size
+                        current["response"], offset = server._open_run(first, server._missing_run(first, last_index))
+
+                    total = server.content_length
+                    if start >= total:
+                        inner_self.send_response(416)
+                        inner_self.send_header('Content-Range', f'bytes */{total}')
+                        inner_self.end_headers()
+                        headers_sent = True
+                        return
+                    end = total - 1 if end is None else min(end, total - 1)
+
+                    inner_self.send_response(206 if requested else 200)
+                    inner_self.send_header('Content-Type', server.content_type)
+                    inner_self.send_header('Content-Length', str(end - start + 1))
+                    if requested:
+                        inner_self.send_header('Content-Range', f'bytes {start}-{end}/{total}')
+                    inner_self.send_header('Accept-Ranges', 'bytes')
+                    inner_self.send_header('Access-Control-Allow-Origin', '*')
+                    inner_self.send_header('Access-Control-Allow-Headers', '*')
+                    inner_self.end_headers()
+                    headers_sent = True
+
+                    # 播放器断开时立即中止上游传输（不必等到下一次写入失败）
+                    server.monitor.watch(inner_self.connection, on_disconnect)
+                    sent["position"] = start
+                    if server.read_ahead:
+                        server.read_ahead.note_request(start)
+
+                    pos = start
+                    while pos <= end and not cancelled.is_set():
+                        index = pos // chunk_size
+                        if current["response"] is None:
+                            data = server.cache.get(server.video_key, index)
+                            if data is not None:
+                                piece = data[pos - index * chunk_size:end - index * chunk_size + 1]
+                                send(piece)
+                                server.served["cache_bytes"] += len(piece)
+                                pos += len(piece)
+                                continue
+                            pending = server._pending.get(index)
+                            if pending is not None:
+                                # 预读或其他请求正在下载这一块，等它完成后从缓存读取
+                                if pending.wait(PENDING_WAIT):
+                                    continue
+                                # 那次下载卡住了：不再等它，自己向上游请求这一块
+                                logger.info(f"等待块 {index} 超时，直接请求上游")
+                                last = index
+                            else:
+                                # 连续的未缓存块合成一个请求
+                                last = server._missing_run(index, end // chunk_size)
+                            current["response"], offset = server._open_run(index, last)
+                            if current["response"] is None:
+                                raise Exception("上游文件长度发生变化")
+                        pos = server._relay(current["response"], offset, pos, end, send)
+                        server._close_run(current["response"])
+                        current["response"] = None
+
+                except (ConnectionResetError, BrokenPipeError):
+                    # 客户端断开连接
+                    logger.info("客户端断开连接")
+                except Exception as e:
+                    if cancelled.is_set():
+                        logger.info("客户端断开连接，已中止上游传输")
+                    else:
+                        logger.error(f"MP4流传输错误: {str(e)}")
+                        if not headers_sent:
+                            inner_self.send_response(502)
+                            inner_self.end_headers()
+                finally:
+                    server.monitor.unwatch(inner_self.connection)
+                    if current["response"] is not None:
+                        server._close_run(current["response"])
+
             def log_message(self, format, *args):
                 """禁用默认日志输出"""
                 pass
-        
+
         return MP4Handler
-    
+
     def stop(self):
         """停止服务器"""
         if self.server:
-            self.server.shutdown()
\ No newline at end of file
+            self.server.shutdown()
+            self.server.server_close()
+        self.monitor.stop()
+        if self.read_ahead:
+            self.read_ahead.stop()
+        # 中止仍在进行的上游传输
+        with self._transfers_lock:
+            transfers = list(self._transfers)
+        for response in transfers:
+            abort_upstream(response)
+        logger.info(f"代理缓存统计: {self.cache_stats()}")
@@ -0,0 +1,256 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+
+# 风控相关的返回：HTTP 412，以及 JSON 中的 code
+RISK_HTTP_STATUS = (412, 429)
+RISK_CODES = (-412, -352, -799, -509)
+
+# 界面发起的请求最多等待的秒数，超过时直接抛出 RateLimitedError
+INTERACTIVE_MAX_WAIT = 1.0
+
+
+def jittered_backoff(attempt, base=0.5, cap=10.0):
+    """第 attempt 次（从 0 开始）重试前的等待秒数：指数增长，取一半加随机抖动"""
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RateLimitedError(Exception):
+    """请求被客户端限流，retry_after 秒后可以重试"""
+
+    def __init__(self, key, retry_after, reason="限流"):
+        super().__init__(f"{key} {reason}，{retry_after:.1f} 秒后重试")
+        self.key = key
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class CircuitOpenError(RateLimitedError):
+    """连续触发风控后熔断，冷却期内直接拒绝请求"""
+
+    def __init__(self, key, retry_after):
+        super().__init__(key, retry_after, reason="已熔断")
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充的令牌数，capacity 为桶容量（允许的突发量）"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount=1):
+        """预留令牌，返回需要等待的秒数（0 表示可立即使用）
+
+        令牌数允许为负，预留后等待返回的时间再发请求即可。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def try_acquire(self, amount=1):
+        """有足够令牌时取走并返回 0，否则不取走并返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def consume(self, amount):
+        """阻塞直到取得 amount 个令牌（用于带宽限制等大额消耗）"""
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+
+class _HostState:
+    def __init__(self):
+        self.failures = 0
+        self.blocked_until = 0.0
+        self.circuit_open_until = 0.0
+        self.half_open = False
+        self.trial_started = 0.0
+
+
+class RateLimiter:
+    """按 (主机, 接口类别) 限流，并根据风控返回做指数退避和熔断
+
+    acquire 默认等待到限流器放行（下载、解析等后台调用方）；界面调用时传入
+    max_wait，需要等待的时间超过 max_wait 时直接抛出 RateLimitedError，并通知
+    所有监听者（例如界面显示 “请求过于频繁”）。熔断期间总是直接抛出 CircuitOpenError。
+    """
+
+    # 接口类别 -> (每秒请求数, 突发量)
+    DEFAULT_LIMITS = {
+        "feed": (1.0, 3),
+        "playurl": (2.0, 5),
+        "view": (3.0, 6),
+        "nav": (1.0, 3),
+        "api": (5.0, 10),
+    }
+
+    def __init__(self, limits=None, backoff_base=2.0, backoff_max=300.0,
+                 circuit_threshold=4, circuit_cooldown=600.0):
+        self.limits = dict(self.DEFAULT_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.circuit_threshold = circuit_threshold
+        self.circuit_cooldown = circuit_cooldown
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._hosts = {}
+        self._listeners = []
+
+    @staticmethod
+    def classify(url):
+        """返回 (主机, 接口类别)"""
+        parsed = urlparse(url)
+        path = parsed.path
+        if "/feed/rcmd" in path:
+            category = "feed"
+        elif path.endswith("/playurl"):
+            category = "playurl"
+        elif path.endswith("/view"):
+            category = "view"
+        elif path.endswith("/nav"):
+            category = "nav"
+        else:
+            category = "api"
+        return parsed.netloc, category
+
+    def add_listener(self, callback):
+        """callback(key, retry_after, reason) 在请求被限流时调用"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, error):
+        for callback in list(self._listeners):
+            try:
+                callback(error.key, error.retry_after, error.reason)
+            except Exception as e:
+                print(f"限流通知失败: {str(e)}")
+
+    def _bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                rate, capacity = self.limits.get(key[1], self.limits["api"])
+                bucket = self._buckets[key] = TokenBucket(rate, capacity)
+            return bucket
+
+    def _host(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState()
+        return state
+
+    def check(self, url):
+        """返回发出该请求前需要等待的秒数，熔断时抛出 CircuitOpenError（不消耗令牌）"""
+        host, category = self.classify(url)
+        now = time.monotonic()
+        with self._lock:
+            state = self._host(host)
+            if state.circuit_open_until > now:
+                raise CircuitOpenError((host, category), state.circuit_open_until - now)
+            if state.circuit_open_until:
+                # 冷却期结束，只放行一个试探请求，其余请求等待试探结果
+                if state.half_open and now - state.trial_started < self.backoff_max:
+                    raise CircuitOpenError((host, category), self.backoff_base)
+                state.half_open = True
+                state.trial_started = now
+            backoff = max(0.0, state.blocked_until - now)
+        return backoff
+
+    def acquire(self, url, max_wait=None):
+        """请求前调用；等待限流器放行，给出 max_wait 且需要等待更久时抛出 RateLimitedError"""
+        wait = self.reserve(url, max_wait)
+        if wait > 0:
+            time.sleep(wait)
+
+    def reserve(self, url, max_wait=None):
+        """预留一次请求并返回需要等待的秒数（供异步调用方自行 sleep）"""
+        key = self.classify(url)
+        try:
+            backoff = self.check(url)
+            if max_wait is not None and backoff > max_wait:
+                raise RateLimitedError(key, backoff, reason="风控退避中")
+            bucket = self._bucket(key)
+            wait = bucket.try_acquire()
+            if max_wait is not None and wait > max_wait:
+                raise RateLimitedError(key, wait)
+            if wait > 0:
+                wait = bucket.reserve()
+            return max(backoff, wait)
+        except RateLimitedError as e:
+            self._notify(e)
+            raise
+
+    def report(self, url, status=None, code=None):
+        """请求完成后调用，status 为 HTTP 状态码，code 为 JSON 中的 code"""
+        host, _ = self.classify(url)
+        risky = status in RISK_HTTP_STATUS or code in RISK_CODES
+        now = time.monotonic()
+        with self._lock:
+            state = self._host(host)
+            if not risky:
+                state.failures = 0
+                state.blocked_until = 0.0
+                state.circuit_open_until = 0.0
+                state.half_open = False
+                return
+
+            state.failures += 1
+            delay = min(self.backoff_max, self.backoff_base * (2 ** (state.failures - 1)))
+            state.blocked_until = now + delay
+            # 连续触发风控或试探请求失败时熔断
+            if state.failures >= self.circuit_threshold or state.half_open:
+                state.circuit_open_until = now + self.circuit_cooldown
+                state.half_open = False
+
+    def report_error(self, url):
+        """请求没有得到响应（网络错误、被取消等）时调用
+
+        不计入风控，但结束进行中的试探请求，下一个请求重新试探，
+        否则该主机要等 backoff_max 秒才会再放行请求。
+        """
+        host, _ = self.classify(url)
+        with self._lock:
+            self._host(host).half_open = False
+
+    def status(self):
+        """各主机的退避/熔断状态"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                host: {
+                    "failures": state.failures,
+                    "backoff": max(0.0, state.blocked_until - now),
+                    "circuit_open": state.circuit_open_until > now,
+                }
+                for host, state in self._hosts.items()
+            }
+
+
+# 进程内共享的限流器
+rate_limiter = RateLimiter()
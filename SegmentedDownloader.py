@@ -0,0 +1,563 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import HttpClient as http
+from DownloadManifest import url_deadline
+from MirrorStats import HEDGE_AFTER, hedged_get, mirror_stats
+
+
+CHUNK_SIZE = 256 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadCancelled(DownloadError):
+    pass
+
+
+class Segment:
+    """一个字节区间 [start, end]（含两端）"""
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.written = 0
+        self.attempts = 0
+        self.state = "pending"  # pending / downloading / done / failed
+
+    @property
+    def size(self):
+        return self.end - self.start + 1
+
+    def __repr__(self):
+        return f"<Segment {self.start}-{self.end} {self.state} {self.written}/{self.size}>"
+
+
+def _write_at(fd, offset, data, lock):
+    """定位写入：POSIX 上用 os.pwrite，其他平台退回 lseek+write（加锁）"""
+    if hasattr(os, "pwrite"):
+        while data:
+            n = os.pwrite(fd, data, offset)
+            data = data[n:]
+            offset += n
+        return
+    with lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        while data:
+            n = os.write(fd, data)
+            data = data[n:]
+
+
+class OrderedWriter:
+    """把乱序到达的分段数据按偏移顺序写入不可定位的输出（例如管道）"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.position = 0
+        self._buffer = {}  # 偏移 -> 数据，等待前面的数据到达
+        self._lock = threading.Lock()
+
+    def write_at(self, offset, data):
+        with self._lock:
+            if offset != self.position:
+                self._buffer[offset] = data
+                return
+            self.stream.write(data)
+            self.position += len(data)
+            while self.position in self._buffer:
+                data = self._buffer.pop(self.position)
+                self.stream.write(data)
+                self.position += len(data)
+
+    def buffered(self):
+        with self._lock:
+            return sum(len(data) for data in self._buffer.values())
+
+    def close(self):
+        self.stream.close()
+
+
+# _take_segment 的返回值：有待下载的数据，但超出了顺序输出的缓冲窗口
+_WAIT = object()
+
+
+def _parse_content_range(value):
+    """解析 "bytes 0-0/12345"，返回总大小（未知时为 None）"""
+    match = re.match(r"bytes\s+\d+-\d+/(\d+)", value or "")
+    return int(match.group(1)) if match else None
+
+
+class SegmentedDownloader:
+    """分段并发下载一个文件
+
+    先用 Range: bytes=0-0 探测大小和是否支持断点，再把文件预分配到目标大小，
+    多个线程各自请求一个字节区间并定位写入。段大小按单连接速度取约
+    target_seconds 秒的数据量；连接数从 initial_workers 开始，每增加一个连接
+    总速度仍明显提升时继续增加，直到 max_workers。
+    服务器不支持 Range 时退回单连接顺序下载。
+
+    urls: 候选地址（主地址和备用地址），按 stats 中各镜像测得的速度排序，分段失败时轮换；
+          每个分段完成后换到测得最快的镜像
+    hedge_after: 请求的首字节超过这个时间（秒）时同时请求下一个镜像，None 为只在出错时换镜像
+    stats: 镜像测速记录，默认为共享的 mirror_stats
+    throttle(n): 每写入 n 字节前调用，可用于全局限速
+    on_progress(downloaded, total): 进度回调（总大小未知时 total 为 None）
+    progress / progress_key: ProgressReporter 及本次下载的标识，上报字节数和分段状态
+    cancel_event: threading.Event，置位后尽快停止
+    manifest: DownloadManifest，传入时只下载清单中缺失的区间，并随时记录进度，
+              完成后删除清单；失败或取消时保留文件和清单，下次继续
+    url_resolver(): 签名地址过期或被拒绝（403/410）时调用，返回新的候选地址
+    sink: OrderedWriter，传入时不写文件而是按顺序输出（边下边混流），
+          只下载写入位置之后 window 字节以内的分段，内存占用有上限；此模式不支持续传
+    """
+
+    def __init__(self, urls, save_path, cookies=None, headers=None,
+                 initial_workers=4, max_workers=8,
+                 min_segment=512 * 1024, max_segment=16 * 1024 * 1024,
+                 target_seconds=2.0, max_retries=3, timeout=(5, 30),
+                 throttle=None, on_progress=None, cancel_event=None,
+                 progress=None, progress_key=None,
+                 manifest=None, url_resolver=None, sink=None, window=32 * 1024 * 1024,
+                 hedge_after=HEDGE_AFTER, stats=None):
+        if isinstance(urls, str):
+            urls = [urls]
+        self.stats = stats or mirror_stats
+        self.hedge_after = hedge_after
+        self.urls = self.stats.order(urls)
+        if not self.urls:
+            raise DownloadError("没有可用的下载地址")
+        self.save_path = save_path
+        self.cookies = cookies
+        self.headers = headers or {}
+        self.initial_workers = max(1, min(initial_workers, max_workers))
+        self.max_workers = max_workers
+        self.min_segment = min_segment
+        self.max_segment = max_segment
+        self.target_seconds = target_seconds
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.throttle = throttle
+        self.on_progress = on_progress
+        self.progress = progress
+        self.progress_key = progress_key
+        self.cancel_event = cancel_event or threading.Event()
+        self.manifest = manifest
+        self.url_resolver = url_resolver
+        self.sink = sink
+        self.window = window
+
+        self.total_size = None
+        self.etag = None
+        self.last_modified = None
+        self.accept_ranges = False
+        self.segments = []
+        self.downloaded = 0
+        self.elapsed = 0.0
+
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = deque()  # 尚未分配的区间 (start, end)
+        self._retry = deque()  # 失败后待重试的分段
+        self._workers = []
+        self._error = None
+        self._url_index = 0
+        self._dead_urls = set()  # 返回 4xx 的地址不再使用
+        self._segment_rate = None  # 单连接速度（字节/秒）的滑动平均
+        self._refresh_lock = threading.Lock()
+        self._refreshed_at = 0.0
+        self._manifest_saved_at = 0.0
+
+    # 地址刷新
+    def _urls_expired(self, margin=60):
+        deadlines = [d for d in (url_deadline(url) for url in self.urls) if d is not None]
+        return bool(deadlines) and min(deadlines) - margin <= time.time()
+
+    def _refresh_urls(self):
+        """通过 url_resolver 重新获取地址，30 秒内最多刷新一次"""
+        if self.url_resolver is None:
+            return False
+        with self._refresh_lock:
+            if time.time() - self._refreshed_at < 30:
+                return True
+            try:
+                urls = [url for url in self.url_resolver() or [] if url]
+            except Exception as e:
+                print(f"重新获取下载地址失败: {str(e)}")
+                return False
+            finally:
+                self._refreshed_at = time.time()
+            if not urls:
+                return False
+            with self._lock:
+                self.urls = self.stats.order(urls)
+                self._url_index = 0
+                self._dead_urls.clear()
+            if self.manifest is not None:
+                self.manifest.urls = list(urls)
+            return True
+
+    # 探测
+    def probe(self):
+        """探测文件大小、校验信息和是否支持 Range"""
+        if self._urls_expired():
+            self._refresh_urls()
+        try:
+            return self._probe()
+        except DownloadError:
+            if not self._refresh_urls():
+                raise
+        return self._probe()
+
+    def _probe(self):
+        # 首字节慢或出错时同时请求下一个镜像，最先响应的镜像放到最前
+        try:
+            headers = dict(self.headers, Range="bytes=0-0")
+            url, r = hedged_get(self.urls, hedge_after=self.hedge_after, stats=self.stats,
+                                headers=headers, cookies=self.cookies, timeout=self.timeout)
+            with r:
+                r.raise_for_status()
+                self.etag = r.headers.get("ETag")
+                self.last_modified = r.headers.get("Last-Modified")
+                if r.status_code == 206:
+                    self.total_size = _parse_content_range(r.headers.get("Content-Range"))
+                    self.accept_ranges = self.total_size is not None
+                else:
+                    length = r.headers.get("Content-Length")
+                    self.total_size = int(length) if length and length.isdigit() else None
+                    self.accept_ranges = False
+        except Exception as e:
+            print(f"探测失败: {str(e)}")
+            raise DownloadError(f"无法连接下载地址: {e}")
+        self.urls.insert(0, self.urls.pop(self.urls.index(url)))
+        return self.total_size
+
+    def run(self):
+        """下载到 save_path，返回下载的字节数"""
+        start_time = time.time()
+        if self.total_size is None:
+            self.probe()
+
+        if not self.accept_ranges or not self.total_size:
+            self._run_single()
+        elif self.sink is not None:
+            self._pending.append((0, self.total_size - 1))
+            self._run_segmented()
+        else:
+            self._preallocate()
+            if self.manifest is not None:
+                if self.manifest.validate(self.total_size, self.etag, self.last_modified):
+                    print(f"继续下载: 已完成 {self.manifest.completed_bytes()}/{self.total_size} 字节")
+                self.manifest.urls = list(self.urls)
+                self._pending.extend(self.manifest.missing_ranges())
+                self.downloaded = self.manifest.completed_bytes()
+                self.manifest.save()
+            else:
+                self._pending.append((0, self.total_size - 1))
+            self._run_segmented()
+
+        if self.manifest is not None:
+            self.manifest.remove()
+
+        self.elapsed = time.time() - start_time
+        return self.downloaded
+
+    def _preallocate(self):
+        mode = "r+b" if os.path.exists(self.save_path) else "wb"
+        with open(self.save_path, mode) as f:
+            f.truncate(self.total_size)
+
+    def _save_manifest(self, fd, force=False):
+        """记录已写入的区间；先 fsync 数据再写清单，保证清单不会超前于文件内容"""
+        if self.manifest is None:
+            return
+        now = time.time()
+        if not force and now - self._manifest_saved_at < 1.0:
+            return
+        self._manifest_saved_at = now
+        with self._lock:
+            segments = list(self.segments)
+        for segment in segments:
+            if segment.written > 0:
+                self.manifest.add_range(segment.start, segment.start + segment.written - 1)
+        try:
+            os.fsync(fd)
+            self.manifest.save()
+        except OSError as e:
+            print(f"保存下载进度失败: {str(e)}")
+
+    # 分段下载
+    def _next_url(self, failed=None, dead=False):
+        with self._lock:
+            if failed is not None:
+                if dead and len(self._dead_urls) + 1 < len(self.urls):
+                    self._dead_urls.add(failed)
+                if self.urls[self._url_index % len(self.urls)] == failed:
+                    self._url_index += 1
+            for _ in range(len(self.urls)):
+                url = self.urls[self._url_index % len(self.urls)]
+                if url not in self._dead_urls:
+                    return url
+                self._url_index += 1
+            return self.urls[self._url_index % len(self.urls)]
+
+    def _prefer_fastest(self, url):
+        """分段完成后换到测得最快的可用镜像；对冲请求由其他镜像胜出时也随之切换"""
+        with self._lock:
+            usable = [u for u in self.urls if u not in self._dead_urls] or [url]
+            best = self.stats.order(usable)[0]
+            if best in self.urls:
+                self._url_index = self.urls.index(best)
+
+    def _segment_size(self):
+        if self._segment_rate is None:
+            size = self.min_segment * 4
+        else:
+            size = int(self._segment_rate * self.target_seconds)
+        # 剩余数据不多时缩小分段，让最后几段也能并行
+        remaining = sum(end - start + 1 for start, end in self._pending)
+        size = min(size, max(self.min_segment, remaining // max(1, len(self._workers))))
+        return max(self.min_segment, min(self.max_segment, size))
+
+    def _take_segment(self):
+        with self._lock:
+            if self._retry:
+                # 顺序输出时最靠前的分段最先重试，避免阻塞输出
+                segment = min(self._retry, key=lambda s: s.start)
+                self._retry.remove(segment)
+                return segment
+            if not self._pending:
+                return None
+            start, end = self._pending[0]
+            if self.sink is not None and start >= self.sink.position + self.window:
+                return _WAIT
+            self._pending.popleft()
+            size = self._segment_size()
+            if end - start + 1 > size:
+                self._pending.appendleft((start + size, end))
+                end = start + size - 1
+            segment = Segment(start, end)
+            self.segments.append(segment)
+            return segment
+
+    def _report_progress(self, num_bytes):
+        with self._lock:
+            self.downloaded += num_bytes
+            downloaded = self.downloaded
+        if self.on_progress:
+            self.on_progress(downloaded, self.total_size)
+        if self.progress is not None:
+            self.progress.update(self.progress_key, downloaded, self.total_size, segments=self.segment_states)
+
+    def segment_states(self):
+        """各分段的状态快照"""
+        with self._lock:
+            segments = list(self.segments)
+        return [
+            {"start": s.start, "end": s.end, "written": s.written, "state": s.state}
+            for s in segments
+        ]
+
+    def _update_rate(self, num_bytes, seconds):
+        if seconds <= 0 or num_bytes <= 0:
+            return
+        sample = num_bytes / seconds
+        with self._lock:
+            if self._segment_rate is None:
+                self._segment_rate = sample
+            else:
+                self._segment_rate = 0.3 * sample + 0.7 * self._segment_rate
+
+    def _fetch_segment(self, fd, segment):
+        url = self._next_url()
+        segment.state = "downloading"
+        offset = segment.start + segment.written
+        headers = dict(self.headers, Range=f"bytes={offset}-{segment.end}")
+        started = time.time()
+        received = 0
+        blocked = 0.0  # 等待限速和输出的时间，不计入镜像的吞吐量
+        local_error = False  # 写入本地文件或输出管道失败，不是镜像的问题
+        try:
+            # 首字节慢或出错时同时向其他可用镜像请求同一段
+            candidates = [url] + [u for u in self.urls if u != url and u not in self._dead_urls]
+            url, r = hedged_get(candidates, hedge_after=self.hedge_after, stats=self.stats,
+                                headers=headers, cookies=self.cookies, timeout=self.timeout)
+            responded = time.time()
+            with r:
+                if r.status_code != 206:
+                    # 签名过期时重新解析地址，其他 4xx 的地址不再使用
+                    refreshed = r.status_code in (403, 410) and self._refresh_urls()
+                    if not refreshed and 400 <= r.status_code < 500:
+                        self._next_url(failed=url, dead=True)
+                    raise DownloadError(f"服务器未返回分段内容: HTTP {r.status_code}")
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                    if self.cancel_event.is_set():
+                        raise DownloadCancelled("下载已取消")
+                    if not chunk:
+                        continue
+                    chunk = chunk[:segment.size - segment.written]
+                    waited = time.time()
+                    if self.throttle:
+                        self.throttle(len(chunk))
+                    try:
+                        self._write(fd, segment.start + segment.written, chunk)
+                    except OSError:
+                        local_error = True
+                        raise
+                    blocked += time.time() - waited
+                    segment.written += len(chunk)
+                    received += len(chunk)
+                    self._report_progress(len(chunk))
+                    if segment.written >= segment.size:
+                        break
+            if segment.written < segment.size:
+                raise DownloadError(f"分段数据不完整 {segment.written}/{segment.size}")
+            segment.state = "done"
+            self._update_rate(received, time.time() - started)
+            self.stats.record(url, num_bytes=received, seconds=time.time() - responded - blocked)
+            self._prefer_fastest(url)
+            self._save_manifest(fd)
+        except DownloadCancelled:
+            segment.state = "pending"
+            raise
+        except Exception:
+            if not local_error:
+                self.stats.record_failure(url)
+                self._next_url(failed=url)
+            raise
+
+    def _write(self, fd, offset, data):
+        if self.sink is not None:
+            self.sink.write_at(offset, data)
+        else:
+            _write_at(fd, offset, data, self._write_lock)
+
+    def _worker(self, fd):
+        while not self.cancel_event.is_set() and self._error is None:
+            segment = self._take_segment()
+            if segment is None:
+                return
+            if segment is _WAIT:
+                time.sleep(0.05)
+                continue
+            try:
+                self._fetch_segment(fd, segment)
+            except DownloadCancelled:
+                return
+            except BrokenPipeError as e:
+                # 输出端（ffmpeg）已退出，重试没有意义
+                self._error = DownloadError(f"输出管道已关闭: {str(e)}")
+                return
+            except Exception as e:
+                segment.attempts += 1
+                print(f"分段 {segment.start}-{segment.end} 第 {segment.attempts} 次失败: {str(e)}")
+                if segment.attempts >= self.max_retries:
+                    segment.state = "failed"
+                    self._error = DownloadError(f"分段 {segment.start}-{segment.end} 下载失败: {str(e)}")
+                    return
+                # 已写入的部分保留，重试时只请求剩余数据
+                segment.state = "pending"
+                with self._lock:
+                    self._retry.append(segment)
+                time.sleep(0.5 * segment.attempts)
+
+    def _start_worker(self, fd):
+        thread = threading.Thread(target=self._worker, args=(fd,), daemon=True)
+        self._workers.append(thread)
+        thread.start()
+
+    def _has_work(self):
+        with self._lock:
+            return bool(self._pending or self._retry)
+
+    def _run_segmented(self):
+        fd = None
+        if self.sink is None:
+            fd = os.open(self.save_path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        try:
+            for _ in range(self.initial_workers):
+                self._start_worker(fd)
+
+            # 每隔一段时间测量总速度，增加连接后仍有提升就继续增加
+            interval = 1.0
+            last_bytes = self.downloaded
+            last_rate = None
+            growing = True
+            while any(t.is_alive() for t in self._workers):
+                time.sleep(interval)
+                rate = (self.downloaded - last_bytes) / interval
+                last_bytes = self.downloaded
+                if growing and self._has_work() and len(self._workers) < self.max_workers:
+                    if last_rate is None or rate > last_rate * 1.15:
+                        self._start_worker(fd)
+                    else:
+                        growing = False
+                last_rate = rate
+                # 有线程因为暂时没有分段而退出、但之后又出现重试分段时补一个线程
+                if self._has_work() and not any(t.is_alive() for t in self._workers):
+                    if self._error is None and not self.cancel_event.is_set():
+                        self._start_worker(fd)
+        finally:
+            for thread in self._workers:
+                thread.join()
+            if fd is not None:
+                self._save_manifest(fd, force=True)
+                os.close(fd)
+
+        if self.cancel_event.is_set():
+            raise DownloadCancelled("下载已取消")
+        if self._error is not None:
+            raise self._error
+        if self._has_work():
+            raise DownloadError("下载未完成")
+
+    # 不支持 Range 时的单连接下载
+    def _run_single(self):
+        last_error = None
+        for attempt in range(max(self.max_retries, len(self.urls))):
+            url = self.urls[attempt % len(self.urls)]
+            # 管道无法回退，重试时跳过已经输出的部分；写文件时从头开始
+            skip = self.downloaded if self.sink is not None else 0
+            if self.sink is None:
+                self.downloaded = 0
+            started = time.time()
+            try:
+                with http.get(url, headers=self.headers, cookies=self.cookies,
+                              stream=True, timeout=self.timeout) as r:
+                    r.raise_for_status()
+                    f = open(self.save_path, "wb") if self.sink is None else None
+                    try:
+                        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                            if self.cancel_event.is_set():
+                                raise DownloadCancelled("下载已取消")
+                            if skip:
+                                dropped = min(skip, len(chunk))
+                                chunk = chunk[dropped:]
+                                skip -= dropped
+                            if chunk:
+                                if self.throttle:
+                                    self.throttle(len(chunk))
+                                if f is not None:
+                                    f.write(chunk)
+                                else:
+                                    self.sink.write_at(self.sink.position, chunk)
+                                self._report_progress(len(chunk))
+                    finally:
+                        if f is not None:
+                            f.close()
+                self._update_rate(self.downloaded, time.time() - started)
+                return
+            except DownloadCancelled:
+                raise
+            except BrokenPipeError as e:
+                raise DownloadError(f"输出管道已关闭: {str(e)}")
+            except Exception as e:
+                last_error = e
+                print(f"第 {attempt+1} 次下载失败: {str(e)}")
+                if attempt + 1 >= len(self.urls):
+                    time.sleep(2)
+        raise DownloadError(f"下载失败，已达最大重试次数: {last_error}")
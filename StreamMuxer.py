@@ -0,0 +1,118 @@
+import os
+import shutil
+import subprocess
+
+import ffmpeg
+
+from MirrorStats import hedged_get, mirror_stats
+from SegmentedDownloader import OrderedWriter
+
+
+HEAD_SIZE = 64 * 1024
+
+
+def needs_seeking(head):
+    """根据文件开头的 box 判断是否必须定位读取
+
+    moov 在 mdat 之前（B 站的 m4s 均为分片 MP4）时 ffmpeg 可以直接从管道解析；
+    mdat 在前，或者开头的数据里找不到 moov 时，保守起见认为需要定位。
+    """
+    offset = 0
+    while offset + 8 <= len(head):
+        size = int.from_bytes(head[offset:offset + 4], "big")
+        box = head[offset + 4:offset + 8]
+        if box == b"moov":
+            return False
+        if box == b"mdat":
+            return True
+        if size == 1 and offset + 16 <= len(head):
+            size = int.from_bytes(head[offset + 8:offset + 16], "big")
+        if size < 8:
+            break
+        offset += size
+    return True
+
+
+def fetch_head(urls, cookies=None, size=HEAD_SIZE):
+    """读取文件开头 size 字节，用于判断容器结构（首字节慢或出错时同时请求下一个镜像）"""
+    try:
+        _, response = hedged_get(mirror_stats.order(urls), headers={"Range": f"bytes=0-{size - 1}"},
+                                 cookies=cookies, timeout=10)
+        with response:
+            response.raise_for_status()
+            return response.content[:size]
+    except Exception as e:
+        raise Exception(f"无法读取文件头: {e}")
+
+
+class StreamMuxer:
+    """边下载边混流
+
+    视频和音频分别写入两个匿名管道，以 pipe:<fd> 作为 ffmpeg 的两个输入，
+    ffmpeg 在数据到达时即开始复制混流，不需要完整的临时文件。
+    command(video_fd, audio_fd) 返回要执行的命令行，默认为 ffmpeg 复制混流。
+    """
+
+    @staticmethod
+    def supported():
+        # 需要把两个管道描述符传给子进程（pass_fds），Windows 上不可用
+        return os.name == "posix" and shutil.which("ffmpeg") is not None
+
+    def __init__(self, save_path, command=None):
+        self.save_path = save_path
+        command = command or self._ffmpeg_command
+        video_read, video_write = os.pipe()
+        audio_read, audio_write = os.pipe()
+        try:
+            self.process = subprocess.Popen(
+                command(video_read, audio_read),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                pass_fds=(video_read, audio_read),
+            )
+        except OSError:
+            os.close(video_write)
+            os.close(audio_write)
+            raise
+        finally:
+            # 读端已经交给 ffmpeg（或启动失败），父进程不再需要
+            os.close(video_read)
+            os.close(audio_read)
+        self.video = OrderedWriter(os.fdopen(video_write, "wb"))
+        self.audio = OrderedWriter(os.fdopen(audio_write, "wb"))
+
+    def _ffmpeg_command(self, video_fd, audio_fd):
+        return ffmpeg.output(
+            ffmpeg.input(f"pipe:{video_fd}"),
+            ffmpeg.input(f"pipe:{audio_fd}"),
+            self.save_path,
+            vcodec='copy',
+            acodec='copy',
+            loglevel='error'
+        ).overwrite_output().compile()
+
+    @staticmethod
+    def close_input(writer):
+        """关闭一路输入，ffmpeg 读到结束；ffmpeg 已退出时忽略"""
+        try:
+            writer.close()
+        except BrokenPipeError:
+            pass
+
+    def finish(self):
+        """输入写完后调用，等待 ffmpeg 结束"""
+        self.close_input(self.video)
+        self.close_input(self.audio)
+        _, stderr = self.process.communicate()
+        if self.process.returncode != 0:
+            raise Exception(f"混流失败: {stderr.decode(errors='replace')}")
+
+    def abort(self):
+        """下载失败时结束 ffmpeg 并删除不完整的输出"""
+        self.close_input(self.video)
+        self.close_input(self.audio)
+        self.process.kill()
+        self.process.communicate()
+        if os.path.exists(self.save_path):
+            os.remove(self.save_path)
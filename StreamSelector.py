@@ -0,0 +1,180 @@
+import json
+import threading
+
+# 清晰度代码（qn）
+QN_360P = 16
+QN_480P = 32
+QN_720P = 64
+QN_1080P = 80
+QN_1080P_PLUS = 112
+QN_4K = 120
+
+# SettingWidget 中 default_quality 选项对应的清晰度，"自动" 表示不限制
+QUALITY_BY_LABEL = {
+    "360P": QN_360P,
+    "480P": QN_480P,
+    "720P": QN_720P,
+    "1080P": QN_1080P,
+    "自动": None,
+}
+
+# 视频编码
+CODEC_AVC = 7
+CODEC_HEVC = 12
+CODEC_AV1 = 13
+
+# 默认可解码的编码及偏好顺序（兼容性优先）
+DEFAULT_CODECS = (CODEC_AVC, CODEC_HEVC, CODEC_AV1)
+
+
+def load_default_quality(settings_path="settings.json"):
+    """读取设置中的默认清晰度，返回 qn 或 None（自动）"""
+    try:
+        with open(settings_path, "r", encoding="utf-8") as f:
+            label = json.load(f).get("default_quality", "自动")
+    except (OSError, ValueError):
+        return None
+    return QUALITY_BY_LABEL.get(label)
+
+
+class ThroughputEstimator:
+    """下载吞吐量的指数滑动平均（比特/秒）"""
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._estimate = None
+
+    def update(self, num_bytes, seconds):
+        if seconds <= 0 or num_bytes <= 0:
+            return
+        sample = num_bytes * 8 / seconds
+        with self._lock:
+            if self._estimate is None:
+                self._estimate = sample
+            else:
+                self._estimate = self.alpha * sample + (1 - self.alpha) * self._estimate
+
+    def estimate(self):
+        with self._lock:
+            return self._estimate
+
+
+# 进程内共享的吞吐量估计，由下载任务更新
+throughput_estimator = ThroughputEstimator()
+
+
+class Representation:
+    """DASH 中的一路视频或音频流"""
+
+    def __init__(self, raw, kind="video"):
+        self.raw = raw
+        self.kind = kind
+        self.id = raw.get("id", 0)
+        self.codecid = raw.get("codecid", 0)
+        self.codecs = raw.get("codecs", "")
+        self.bandwidth = raw.get("bandwidth", 0)
+        self.width = raw.get("width", 0)
+        self.height = raw.get("height", 0)
+        self.frame_rate = raw.get("frameRate") or raw.get("frame_rate", "")
+        base_url = raw.get("baseUrl") or raw.get("base_url", "")
+        backup_urls = raw.get("backupUrl") or raw.get("backup_url") or []
+        # 主地址在前，备用地址在后
+        self.urls = [url for url in [base_url] + list(backup_urls) if url]
+
+    @property
+    def url(self):
+        return self.urls[0] if self.urls else ""
+
+    def __repr__(self):
+        return f"<Representation {self.kind} id={self.id} codecid={self.codecid} bandwidth={self.bandwidth}>"
+
+
+class StreamSelector:
+    """索引 playurl DASH 数据中的所有流，按清晰度、吞吐量和可解码编码排序
+
+    select_video / select_audio 返回按优先级排序的候选列表，第一项为首选，
+    其余为失败时的备选，调用方无需重新请求 playurl 即可切换。
+    """
+
+    def __init__(self, dash_data):
+        self.duration = dash_data.get("duration", 0)
+        self.videos = [Representation(v, "video") for v in dash_data.get("video") or []]
+        self.audios = [Representation(a, "audio") for a in dash_data.get("audio") or []]
+
+        # 杜比全景声和 Hi-Res 无损音轨
+        dolby = dash_data.get("dolby") or {}
+        self.dolby_audios = [Representation(a, "dolby") for a in dolby.get("audio") or []]
+        flac = dash_data.get("flac") or {}
+        self.flac_audios = [Representation(flac["audio"], "flac")] if flac.get("audio") else []
+
+    def qualities(self):
+        """可用的清晰度（降序）"""
+        return sorted({v.id for v in self.videos}, reverse=True)
+
+    def select_video(self, target_qn=None, throughput=None, codecs=DEFAULT_CODECS, headroom=0.8):
+        """选择视频流
+
+        target_qn: 目标清晰度上限，None 为不限
+        throughput: 测得的吞吐量（比特/秒），码率超过 throughput*headroom 的流降级到备选
+        codecs: 可解码的编码，按偏好排序
+        """
+        candidates = [v for v in self.videos if v.codecid in codecs and v.urls]
+        if not candidates:
+            # 没有匹配的编码时退回所有流
+            candidates = [v for v in self.videos if v.urls]
+        if not candidates:
+            return []
+
+        codec_rank = {codec: i for i, codec in enumerate(codecs)}
+        budget = throughput * headroom if throughput is not None else None
+
+        def fits(v):
+            if target_qn is not None and v.id > target_qn:
+                return False
+            if budget is not None and v.bandwidth > budget:
+                return False
+            return True
+
+        def order(v):
+            return (-v.id, codec_rank.get(v.codecid, len(codec_rank)), v.bandwidth)
+
+        preferred = sorted([v for v in candidates if fits(v)], key=order)
+        # 不满足条件的流按清晰度从低到高作为最后的备选，先尝试更容易成功的
+        rest = sorted(
+            [v for v in candidates if not fits(v)],
+            key=lambda v: (v.id, codec_rank.get(v.codecid, len(codec_rank)), v.bandwidth)
+        )
+        return preferred + rest
+
+    def select_audio(self, throughput=None, prefer_lossless=False, headroom=0.8):
+        """选择音频流，prefer_lossless 时优先 Hi-Res/杜比音轨"""
+        standard = sorted([a for a in self.audios if a.urls], key=lambda a: -a.bandwidth)
+        special = [a for a in self.flac_audios + self.dolby_audios if a.urls]
+
+        if throughput is not None:
+            budget = throughput * headroom
+            fitting = [a for a in standard if a.bandwidth <= budget]
+            too_big = sorted([a for a in standard if a.bandwidth > budget], key=lambda a: a.bandwidth)
+            standard = fitting + too_big
+
+        if prefer_lossless:
+            return special + standard
+        return standard + special
+
+    def select(self, target_qn=None, throughput=None, codecs=DEFAULT_CODECS, prefer_lossless=False, adaptive=True):
+        """返回 (视频候选列表, 音频候选列表)
+
+        adaptive=False 时不按吞吐量降级（下载），只按清晰度和编码选流。
+        """
+        if not adaptive:
+            throughput = None
+        elif throughput is None:
+            throughput = throughput_estimator.estimate()
+        # 视频与音频共用带宽，视频预算扣除首选音频码率
+        audios = self.select_audio(throughput, prefer_lossless)
+        video_throughput = throughput
+        if throughput is not None and audios:
+            video_throughput = max(throughput - audios[0].bandwidth, 0)
+        videos = self.select_video(target_qn, video_throughput, codecs)
+        return videos, audios
@@ -0,0 +1,43 @@
+import math
+from urllib.parse import urlsplit, urlunsplit
+
+
+# 支持 @参数 缩放的图片服务器（B 站图片 CDN）
+RESIZE_HOSTS = ("hdslb.com", "biliimg.com")
+
+# 缩略图尺寸向上取整到 THUMB_STEP 的倍数，窗口微调大小时不必重新下载
+THUMB_STEP = 20
+
+# 原图一般不超过 1920 宽，更大的尺寸没有意义
+MAX_WIDTH = 1920
+
+
+def supports_resize(url):
+    host = urlsplit(url).hostname or ""
+    return any(host == suffix or host.endswith("." + suffix) for suffix in RESIZE_HOSTS)
+
+
+def thumbnail_size(width, height, ratio=1.0, step=THUMB_STEP):
+    """把控件的逻辑尺寸换算为要请求的像素尺寸（乘以设备像素比，向上取整到 step）"""
+    pixel_width = max(1, math.ceil(width * ratio))
+    pixel_height = max(1, math.ceil(height * ratio))
+    if pixel_width > MAX_WIDTH:
+        pixel_height = math.ceil(pixel_height * MAX_WIDTH / pixel_width)
+        pixel_width = MAX_WIDTH
+    return math.ceil(pixel_width / step) * step, math.ceil(pixel_height / step) * step
+
+
+def thumbnail_url(url, width, height, fmt="webp"):
+    """返回按 width x height 居中裁剪、fmt 格式的缩略图地址
+
+    在原图地址后加 @{w}w_{h}h_1c.{fmt}（已有的 @参数 会被替换），由图片 CDN 缩放和转码。
+    不支持缩放的地址原样返回。每个尺寸的地址不同，在存储中各自缓存。
+    """
+    if not url or not supports_resize(url):
+        return url
+    if url.startswith("//"):
+        url = "https:" + url
+    parts = urlsplit(url)
+    path = parts.path.split("@", 1)[0]
+    path = f"{path}@{int(width)}w_{int(height)}h_1c.{fmt}"
+    return urlunsplit((parts.scheme, parts.netloc, path, parts.query, ""))
@@ -1,50 +1,21 @@
 # VideoController.py
-from PyQt5.QtCore import QObject, pyqtSignal, Qt, QTimer, QRect
+from PyQt5.QtCore import pyqtSignal, Qt, QTimer, QRect
 from PyQt5.QtWidgets import (QWidget, QGridLayout, QLabel, QApplication, 
                              QSizePolicy, QScrollArea, QVBoxLayout, QSpacerItem)
 from PyQt5.QtGui import QWheelEvent
 from VideoWidget import VideoWidget
-from BilibiliApi import *
+from AsyncBilibiliApi import async_client
+from AsyncBridge import get_bridge
+from RateLimiter import RateLimitedError
+from Thumbnail import thumbnail_size, thumbnail_url
 import os
-import threading
 
-class DataLoaderSignals(QObject):
-    data_ready = pyqtSignal(list)
-    data_failed = pyqtSignal()
-
-class DataLoader(threading.Thread):
-    def __init__(self, page, pagesize):
-        super().__init__()
-        self.page = page
-        self.pagesize = pagesize
-        self.signals = DataLoaderSignals()
-
-    def run(self):
-        try:
-            data = GetRecommendVideos(page=self.page, pagesize=self.pagesize).get_recommend_videos()
-            if data:
-                self.signals.data_ready.emit(data)
-            else:
-                raise ValueError("推荐数据为空")
-        except Exception as e:
-            print(f"数据加载失败: {str(e)}")
-            self.signals.data_failed.emit()
-
-class CoverDownloader(threading.Thread):
-    def __init__(self, pic_url, bvid, index, controller):
-        super().__init__()
-        self.pic_url = pic_url
-        self.bvid = bvid
-        self.index = index
-        self.controller = controller
-
-    def run(self):
-        try:
-            save_path = f"./temp/{self.bvid}.jpg"
-            if Download().download_cover(self.pic_url, save_path):
-                self.controller.cover_loaded.emit(self.index, save_path)
-        except Exception as e:
-            print(f"封面下载失败: {str(e)}")
+async def load_recommend_page(page, pagesize):
+    """获取一页推荐数据，空数据视为失败"""
+    data = await async_client.feed_rcmd(page=page, pagesize=pagesize)
+    if not data:
+        raise ValueError("推荐数据为空")
+    return data
 
 class VideoController(QScrollArea):
     cover_loaded = pyqtSignal(int, str)
@@ -53,7 +24,8 @@ class VideoController(QScrollArea):
     def __init__(self, parent=None):
         super().__init__(parent)
         self._is_alive = True
-        self.download_threads = []
+        self.bridge = get_bridge()
+        self.pending_requests = []
         self.video_widgets = []
         self.video_info = []
         
@@ -65,6 +37,8 @@ class VideoController(QScrollArea):
         self.loaded_indices = set()
         self.visible_range = (0, 0)
         self.pending_loads = set()
+        self.cover_urls = {}  # 索引 -> 正在使用的封面缩略图地址
+        self.thumb_size = None
         self.load_timer = QTimer()
         self.load_timer.setSingleShot(True)
         self.load_timer.timeout.connect(self.process_pending_loads)
@@ -162,10 +136,30 @@ class VideoController(QScrollArea):
 
     def load_data_page(self, page):
         """加载指定页面的数据"""
-        loader = DataLoader(page=page, pagesize=12)
-        loader.signals.data_ready.connect(self.on_data_loaded)
-        loader.signals.data_failed.connect(self.on_data_failed)
-        loader.start()
+        self.submit_request(
+            load_recommend_page(page, 12),
+            on_result=self.on_data_loaded,
+            on_error=self.on_data_failed
+        )
+
+    def submit_request(self, coro, on_result=None, on_error=None):
+        """通过异步桥提交请求，结果在主线程回调"""
+        future = self.bridge.submit(coro, on_result, on_error)
+        self.pending_requests.append(future)
+        # 完成回调在事件循环线程中调用，列表只在主线程修改
+        future.add_done_callback(lambda fut: self.bridge.call_in_main(lambda: self._forget_request(fut)))
+        return future
+
+    def _forget_request(self, future):
+        if future in self.pending_requests:
+            self.pending_requests.remove(future)
+
+    def cancel_requests(self):
+        """取消所有进行中的请求（不再触发回调）"""
+        self._is_alive = False
+        self.load_timer.stop()
+        for future in list(self.pending_requests):
+            future.cancel()
 
     def on_data_loaded(self, data):
         if not self._is_alive:
@@ -189,9 +183,19 @@ class VideoController(QScrollArea):
         # 初始加载前几个视频的封面
         QTimer.singleShot(100, lambda: self.schedule_lazy_load(0))
 
-    def on_data_failed(self):
+    def on_data_failed(self, error=None):
         if not self._is_alive:
             return
+        if error is not None:
+            print(f"数据加载失败: {str(error)}")
+
+        if isinstance(error, RateLimitedError):
+            # 被限流时不再立即重试，提示用户并在冷却后自动重新加载当前页
+            retry_after = max(1, int(error.retry_after + 0.5))
+            label = self.loading_label if self.current_page == 1 else self.load_more_label
+            label.setText(f"请求过于频繁，{retry_after} 秒后自动重试")
+            QTimer.singleShot(retry_after * 1000, lambda: self._is_alive and self.load_data_page(self.current_page))
+            return
             
         if self.current_page == 1:
             self.loading_label.setText("加载失败，点击重试")
@@ -277,6 +281,11 @@ class VideoController(QScrollArea):
             
         return card_width, card_height
 
+    def calculate_thumb_size(self):
+        """封面缩略图要请求的像素尺寸（封面区域占卡片的 0.9 x 0.714，乘以设备像素比）"""
+        card_width, card_height = self.calculate_widget_size()
+        return thumbnail_size(int(card_width * 0.9), int(card_height * 0.714), self.devicePixelRatioF())
+
     def schedule_lazy_load(self, start_index):
         """调度懒加载"""
         self.load_timer.stop()
@@ -297,17 +306,19 @@ class VideoController(QScrollArea):
         if not self.pending_loads:
             return
             
+        thumb_width, thumb_height = self.thumb_size = self.calculate_thumb_size()
         for index in list(self.pending_loads):
             if index < len(self.video_info):
                 info = self.video_info[index]
-                thread = CoverDownloader(
-                    pic_url=info["pic"],
-                    bvid=info["bvid"],
-                    index=index,
-                    controller=self
+                # 按封面区域的像素尺寸请求缩略图；每个尺寸分别保存在内容寻址存储中，
+                # 已下载过的直接返回存储路径
+                url = thumbnail_url(info["pic"], thumb_width, thumb_height)
+                self.cover_urls[index] = url
+                self.submit_request(
+                    async_client.download_cover(url),
+                    on_result=lambda path, i=index, u=url: path and self.cover_urls.get(i) == u and self.cover_loaded.emit(i, path),
+                    on_error=lambda e: print(f"封面下载失败: {str(e)}")
                 )
-                self.download_threads.append(thread)
-                thread.start()
                 self.loaded_indices.add(index)
                 self.pending_loads.remove(index)
 
@@ -377,6 +388,10 @@ class VideoController(QScrollArea):
             for widget in self.video_widgets:
                 widget.setFixedSize(card_width, card_height)
                 widget.update_layout()
+
+            # 缩略图尺寸变化后，可见的封面按新尺寸重新请求
+            if self.thumb_size is not None and self.calculate_thumb_size() != self.thumb_size:
+                self.loaded_indices.clear()
         
         # 重新触发懒加载检查
         QTimer.singleShot(100, self.handle_scroll)
@@ -388,10 +403,7 @@ class VideoController(QScrollArea):
 
     def closeEvent(self, event):
         """关闭事件处理"""
-        self._is_alive = False
-        self.load_timer.stop()
-        for t in self.download_threads:
-            t.join(timeout=1)
+        self.cancel_requests()
         super().closeEvent(event)
 
 if __name__ == "__main__":
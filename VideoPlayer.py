@@ -4,13 +4,15 @@ from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
 from PyQt5.QtMultimediaWidgets import QVideoWidget
 from PyQt5.QtCore import QUrl, Qt, QTimer, QSize
 from PyQt5.QtGui import QIcon, QFont, QPalette, QColor
-import os
 import time
 import logging
 import sys
 from NetworkManager import CustomNetworkAccessManager
 from ProxyServer import MP4ProxyServer
 from BilibiliApi import GetVideoInfo
+from CookieStore import cookie_store
+from DownloadManager import download_manager
+from HttpClient import DEFAULT_HEADERS
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -25,51 +27,51 @@ class VideoPlayer(QWidget):
         self.media_player = None
         self.timer = None
         self.proxy_server = None
+        self.playback_registered = False
         self.is_fullscreen = False
         self.last_mouse_move_time = 0
         self.api_duration = 0  # 存储从API获取的时长（毫秒）
         
-        # 加载Cookie
-        self.cookies = self.load_cookies()
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Referer": "https://www.bilibili.com/"
-        }
+        # 加载Cookie（预先渲染好的请求头）
+        self.cookie_header = self.load_cookies()
+        self.headers = dict(DEFAULT_HEADERS)
         
         # 设置自定义网络访问管理器
-        self.network_manager = CustomNetworkAccessManager(self.cookies, self.headers)
+        self.network_manager = CustomNetworkAccessManager(self.cookie_header, self.headers)
         
         self.setup_ui()
         self.start_stream_loading()
     
     def load_cookies(self):
-        """从文件加载Cookie"""
-        cookies = {}
-        if os.path.exists("Cookie"):
-            with open("Cookie", "r") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line or line.startswith('#'):
-                        continue
-                    parts = line.split('\t')
-                    if len(parts) >= 7:
-                        cookies[parts[5]] = parts[6]
-        return cookies
+        """从共享Cookie存储获取Cookie请求头"""
+        return cookie_store.header()
     
     def start_stream_loading(self):
         """开始MP4流媒体加载过程"""
         try:
             # 获取视频流信息 - 使用MP4格式
             video_info = GetVideoInfo(self.bvid, self.cid)
-            mp4_url = video_info.get_video_streaming_info_mp4()
+            # 主地址和备用镜像，代理按测得的速度选择并在首字节慢或出错时切换
+            mp4_urls = video_info.get_video_streaming_urls_mp4()
             
-            # 获取API返回的视频时长（秒）并转换为毫秒
+            # 获取API返回的视频时长（秒）并转换为毫秒（通常直接命中元数据缓存）
             self.api_duration = video_info.get_video_duration() * 1000
+            info = video_info.get_video_info()
+            if info and info["title"]:
+                self.setWindowTitle(f"视频播放器 - {info['title']}")
             
             # 启动MP4代理服务器
-            self.proxy_server = MP4ProxyServer(mp4_url, self.cookies, self.headers)
+            self.proxy_server = MP4ProxyServer(
+                mp4_urls, self.cookie_header, self.headers,
+                url_resolver=lambda force=False: video_info.get_video_streaming_urls_mp4(force_refresh=force),
+                duration=self.api_duration / 1000 or None  # 按码率把预读秒数换算为字节数
+            )
             self.proxy_server.start()
             
+            # 播放期间后台下载让出带宽
+            download_manager.playback_started()
+            self.playback_registered = True
+            
             # 等待服务器准备就绪
             self.proxy_server.ready.wait(timeout=30)
             
@@ -226,6 +228,8 @@ class VideoPlayer(QWidget):
         self.media_player.positionChanged.connect(self.update_time_display)
         self.media_player.durationChanged.connect(self.update_duration_display)
         self.media_player.volumeChanged.connect(self.update_volume_display)
+        # 暂停时代理停止预读
+        self.media_player.stateChanged.connect(self.update_read_ahead)
         
         # 设置初始音量
         self.media_player.setVolume(self.volume_slider.value())
@@ -249,6 +253,11 @@ class VideoPlayer(QWidget):
             # 鼠标移动时显示控制栏
             self.last_mouse_move_time = time.time()
 
+    def update_read_ahead(self, state):
+        """播放状态变化时通知代理是否继续预读"""
+        if self.proxy_server:
+            self.proxy_server.set_paused(state != QMediaPlayer.PlayingState)
+
     def update_progress(self):
         """更新播放进度 - 使用API返回的时长"""
         # 使用API返回的时长而不是播放器的时长
@@ -381,6 +390,9 @@ class VideoPlayer(QWidget):
         # 停止代理服务器
         if self.proxy_server:
             self.proxy_server.stop()
+        if self.playback_registered:
+            download_manager.playback_stopped()
+            self.playback_registered = False
             
         # 停止定时器
         if self.timer and self.timer.isActive():
@@ -0,0 +1,110 @@
+"""三个本地镜像：A 首字节 1.5 秒且只有 2MB/s，B 返回 503，C 正常（20MB/s）。
+对比只在出错时换镜像与对冲请求下分段下载 16MB 的用时，再用保存的测量值模拟下次启动
+
+运行：python benchmarks/bench_mirrors.py
+"""
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 模块都在仓库根目录，按顶层模块导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from MirrorStats import HEDGE_AFTER, MirrorStats, hedged_get, mirror_host
+from SegmentedDownloader import SegmentedDownloader
+
+
+def main():
+    size = 16 * 1024 * 1024
+    payload = os.urandom(size)
+    profiles = {"A": (1.5, 2 * 1024 * 1024, 200), "B": (0.05, 0, 503), "C": (0.05, 20 * 1024 * 1024, 200)}
+
+    def make_handler(name):
+        delay, rate, status = profiles[name]
+
+        class MirrorHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                time.sleep(delay)
+                if status != 200:
+                    self.send_response(status)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+                start = int(match.group(1)) if match else 0
+                end = min(int(match.group(2) or size - 1), size - 1) if match else size - 1
+                self.send_response(206 if match else 200)
+                if match:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+                step = 64 * 1024
+                try:
+                    for offset in range(start, end + 1, step):
+                        piece = payload[offset:min(offset + step, end + 1)]
+                        self.wfile.write(piece)
+                        time.sleep(len(piece) / rate)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return MirrorHandler
+
+    ThreadingHTTPServer.handle_error = lambda *args: None  # 落选的连接被关闭时不输出异常
+    servers = {}
+    for name in profiles:
+        servers[name] = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(name))
+        threading.Thread(target=servers[name].serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{servers[name].server_port}/video.m4s" for name in "ABC"]
+    names = {mirror_host(url): name for url, name in zip(urls, "ABC")}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "mirrors.db")
+        print(f"{'方式':<20}{'首个响应(s)':>12}{'下载 16MB(s)':>14}  胜出的镜像")
+        for label, hedge in (("出错时换镜像", None), ("对冲请求", HEDGE_AFTER)):
+            stats = MirrorStats(db_path=os.path.join(tmp, f"{label}.db"))
+            started = time.perf_counter()
+            url, response = hedged_get(urls, hedge_after=hedge, stats=stats, headers={"Range": "bytes=0-0"}, timeout=30)
+            response.close()
+            first = time.perf_counter() - started
+            path = os.path.join(tmp, "out.m4s")
+            downloader = SegmentedDownloader(urls, path, initial_workers=4, max_workers=4,
+                                             hedge_after=hedge, stats=stats)
+            downloader.run()
+            with open(path, "rb") as f:
+                assert f.read() == payload
+            print(f"{label:<20}{first:>12.2f}{downloader.elapsed:>14.2f}  {names[mirror_host(url)]}")
+            if hedge is not None:
+                stats.flush()
+                os.replace(stats.db_path, db_path)
+
+        # 下次启动：从保存的测量值读取，直接从最快的镜像开始
+        stats = MirrorStats(db_path=db_path)
+        ordered = stats.order(urls)
+        print("下次启动的镜像顺序:", " ".join(names[mirror_host(url)] for url in ordered))
+        for url in ordered:
+            entry = stats.get(url) or {"latency": None, "throughput": None, "failures": 0}
+            latency = f"{entry['latency'] * 1000:.0f}ms" if entry["latency"] is not None else "-"
+            throughput = f"{entry['throughput'] / 1024 / 1024:.1f}MB/s" if entry["throughput"] else "-"
+            print(f"  {names[mirror_host(url)]}: 首字节 {latency}, 吞吐量 {throughput}, 连续失败 {entry['failures']}")
+        assert names[mirror_host(ordered[0])] == "C"
+        started = time.perf_counter()
+        url, response = hedged_get(stats.order(urls), stats=stats, headers={"Range": "bytes=0-0"}, timeout=30)
+        response.close()
+        print(f"下次启动的首个响应: {time.perf_counter() - started:.2f}s（镜像 {names[mirror_host(url)]}）")
+        stats._conn().close()
+    for server in servers.values():
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
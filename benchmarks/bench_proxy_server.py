@@ -0,0 +1,309 @@
+"""首字节时间基准：本地范围请求服务器按需生成数据（每个连接限速 100MB/s），
+对比"先读完整个响应"（原来 len(response.content) 的做法）与经过代理的首字节时间；
+然后检查播放器断开时上游传输及时中止、读过的范围由缓存提供（并行范围请求见 tests/test_proxy_server.py）；
+最后在带宽忽高忽低、周期性卡顿的上游上模拟播放，对比开关预读时的卡顿次数
+
+运行：python benchmarks/bench_proxy_server.py
+"""
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 模块都在仓库根目录，按顶层模块导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import HttpClient as http
+from ChunkCache import ChunkCache
+from MirrorStats import mirror_stats
+from ProxyServer import CHUNK_SIZE, MP4ProxyServer
+
+
+def main():
+    RATE = 100 * 1024 * 1024
+    PATTERN = bytes(i % 251 for i in range(CHUNK_SIZE + 251))
+    sizes = {"/4m": 4 * 1024 * 1024, "/64m": 64 * 1024 * 1024, "/256m": 256 * 1024 * 1024}
+    stalled = threading.Event()
+    upstream_requests = []
+    bench_cache = ChunkCache(spill_path=os.path.join(tempfile.mkdtemp(), "chunks.bin"))
+    mirror_stats.db_path = os.path.join(tempfile.mkdtemp(), "mirrors.db")
+
+    def fresh_cache():
+        return ChunkCache(spill_path=os.path.join(tempfile.mkdtemp(), "chunks.bin"))
+
+    class Throttle:
+        """所有连接共享的带宽：rate_at(t) 字节/秒，令牌最多积累 burst 字节"""
+
+        def __init__(self, rate_at, burst=256 * 1024):
+            self.rate_at = rate_at
+            self.burst = burst
+            self.tokens = 0
+            self.started = self.last = time.perf_counter()
+            self.lock = threading.Lock()
+
+        def take(self, count):
+            while True:
+                with self.lock:
+                    now = time.perf_counter()
+                    rate = self.rate_at(now - self.started)
+                    self.tokens = min(self.burst, self.tokens + rate * (now - self.last))
+                    self.last = now
+                    if self.tokens >= count:
+                        self.tokens -= count
+                        return
+                time.sleep(0.005)
+
+    # 不稳定的 CDN：每 8 秒中 4 秒按 10MB/s 上下浮动 50%（每 0.25 秒变化一次），4 秒完全卡住
+    jitter = random.Random(7)
+    slots = [jitter.uniform(0.5, 1.5) for _ in range(4096)]
+
+    def jittery_rate(t):
+        return 0 if t % 8 >= 4 else 10 * 1024 * 1024 * slots[int(t / 0.25) % len(slots)]
+
+    paced = {"/jitter": Throttle(jittery_rate), "/slow": Throttle(lambda t: 8 * 1024 * 1024)}
+    PACED_SIZE = 64 * 1024 * 1024
+
+    def expected(start, end):
+        count = end - start + 1
+        return (bytes(range(251)) * (count // 251 + 2))[start % 251:start % 251 + count]
+
+    class RangeHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            upstream_requests.append((self.path, self.headers.get("Range")))
+            if self.path == "/stall":
+                # 发送第一块数据后卡住，模拟上游无响应
+                self.send_response(200)
+                self.send_header("Content-Length", str(sizes["/64m"]))
+                self.end_headers()
+                self.wfile.write(PATTERN[:CHUNK_SIZE])
+                self.wfile.flush()
+                stalled.wait(30)
+                return
+            path = self.path.split("?", 1)[0]
+            pace = paced[path].take if path in paced else None
+            size = sizes.get(path, PACED_SIZE)
+            start, end = 0, size - 1
+            if self.headers.get("Range"):
+                first, last = self.headers["Range"].split("=", 1)[1].split("-")
+                start, end = int(first), min(int(last) if last else size - 1, size - 1)
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            started = time.perf_counter()
+            offset = start
+            try:
+                while offset <= end:
+                    count = min(CHUNK_SIZE, end - offset + 1)
+                    if pace:
+                        pace(count)
+                    self.wfile.write(PATTERN[offset % 251:offset % 251 + count])
+                    offset += count
+                    delay = (offset - start) / RATE - (time.perf_counter() - started)
+                    if delay > 0 and not pace:
+                        time.sleep(delay)
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+
+    upstream = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{upstream.server_address[1]}"
+
+    def first_byte(url, headers=None):
+        started = time.perf_counter()
+        with http.get(url, headers=headers, stream=True, timeout=30) as response:
+            next(response.iter_content(1))
+            return time.perf_counter() - started
+
+    print(f"{'文件':<8}{'读完整个响应(s)':>16}{'代理首字节(ms)':>16}")
+    for path, size in sizes.items():
+        started = time.perf_counter()
+        http.get(base + path, timeout=60).content
+        buffered = time.perf_counter() - started
+
+        proxy = MP4ProxyServer(base + path, None, {}, cache=bench_cache, read_ahead=False)
+        proxy.start()
+        proxy.ready.wait()
+        ttfb = first_byte(proxy.output_url)
+        print(f"{path[1:]:<8}{buffered:>16.2f}{ttfb * 1000:>16.1f}")
+
+        # 范围请求：转发 206、Content-Range 和 Content-Length，数据与源一致
+        with http.get(proxy.output_url, headers={"Range": "bytes=1000000-1099999"}, timeout=30) as response:
+            assert response.status_code == 206, response.status_code
+            assert response.headers["Content-Range"] == f"bytes 1000000-1099999/{size}"
+            assert response.headers["Content-Length"] == "100000"
+            assert response.content == expected(1000000, 1099999)
+        proxy.stop()
+    print("范围请求转发正确")
+
+    # 主地址无法连接时换到备用镜像
+    unused = socket.socket()
+    unused.bind(("127.0.0.1", 0))
+    dead = f"http://127.0.0.1:{unused.getsockname()[1]}"
+    unused.close()
+    del upstream_requests[:]
+    proxy = MP4ProxyServer([dead + "/4m", base + "/4m"], None, {}, cache=fresh_cache(), read_ahead=False)
+    proxy.start()
+    proxy.ready.wait()
+    with http.get(proxy.output_url, headers={"Range": "bytes=0-99999"}, timeout=30) as response:
+        assert response.status_code == 206 and response.content == expected(0, 99999)
+    assert upstream_requests and mirror_stats.order(proxy.mp4_urls)[0].startswith(base)
+    print(f"主地址无法连接: 由备用镜像提供，镜像顺序 {mirror_stats.order(proxy.mp4_urls)}")
+    proxy.stop()
+
+    # 读过的范围（包括签名参数变化后的同一文件）不再请求上游；部分重叠时只请求缺少的块
+    proxy = MP4ProxyServer(base + "/256m?sign=1", None, {}, cache=bench_cache, read_ahead=False)
+    proxy.start()
+    proxy.ready.wait()
+    for first, last, label in ((50000000, 59999999, "首次读取"), (50000000, 59999999, "再次读取"),
+                               (45000000, 52000000, "向前拖动")):
+        del upstream_requests[:]
+        with http.get(proxy.output_url, headers={"Range": f"bytes={first}-{last}"}, timeout=30) as response:
+            assert response.status_code == 206
+            assert response.content == expected(first, last)
+        print(f"{label} {first}-{last}: 上游请求 {upstream_requests}")
+        if label == "再次读取":
+            assert not upstream_requests
+    proxy.stop()
+    proxy = MP4ProxyServer(base + "/256m?sign=2", None, {}, cache=bench_cache, read_ahead=False)
+    proxy.start()
+    proxy.ready.wait()
+    del upstream_requests[:]
+    with http.get(proxy.output_url, headers={"Range": "bytes=46000000-58000000"}, timeout=30) as response:
+        assert response.content == expected(46000000, 58000000)
+    assert not upstream_requests, upstream_requests
+    print(f"刷新签名后读取已缓存范围: 无上游请求，统计 {proxy.cache_stats()}")
+    proxy.stop()
+
+    # 播放器断开后，卡住的上游传输也应立即中止
+    proxy = MP4ProxyServer(base + "/stall", None, {}, cache=bench_cache, read_ahead=False)
+    proxy.start()
+    proxy.ready.wait()
+    with http.get(proxy.output_url, stream=True, timeout=30) as response:
+        next(response.iter_content(1))
+        assert proxy.active_transfers == 1
+    closed = time.perf_counter()
+    while proxy.active_transfers and time.perf_counter() - closed < 5:
+        time.sleep(0.01)
+    assert proxy.active_transfers == 0
+    print(f"播放器断开后 {(time.perf_counter() - closed) * 1000:.0f}ms 中止上游传输")
+    proxy.stop()
+    stalled.set()
+    bench_cache.close()
+
+    # 暂停时不预读；继续播放后预读窗口内的数据；拖动后中止旧的预读、从新位置开始
+    cache = fresh_cache()
+    proxy = MP4ProxyServer(base + "/slow", None, {}, cache=cache, read_ahead_bytes=16 * 1024 * 1024)
+    proxy.start()
+    proxy.ready.wait()
+    proxy.set_paused(True)
+    del upstream_requests[:]
+    with http.get(proxy.output_url, headers={"Range": "bytes=0-1048575"}, timeout=30) as response:
+        assert response.content == expected(0, 1048575)
+    time.sleep(1)
+    assert upstream_requests == [("/slow", "bytes=0-1048575")], upstream_requests
+    print("暂停时: 只有播放器自己的请求")
+    proxy.set_paused(False)
+    time.sleep(0.5)
+    assert proxy.read_ahead._current is not None and len(upstream_requests) > 1
+    del upstream_requests[:]
+    seek = 40 * 1024 * 1024
+    with http.get(proxy.output_url, headers={"Range": f"bytes={seek}-{seek + 1048575}"}, timeout=30) as response:
+        assert response.content == expected(seek, seek + 1048575)
+    time.sleep(1)
+    starts = [int(r.split("=")[1].split("-")[0]) for _, r in upstream_requests]
+    assert starts and all(start >= seek for start in starts), upstream_requests
+    print(f"拖动到 {seek}: 之后的上游请求 {[r for _, r in upstream_requests]}")
+    proxy.stop()
+    cache.close()
+
+    def play(read_ahead):
+        """模拟播放器：按 2MB/s 码率播放 32 秒的视频，自己最多缓冲 1 秒，缓冲够 0.5 秒开始/继续播放
+
+        返回 (起播时间, 卡顿次数, 卡顿总时长, 预读的字节数)
+        """
+        bitrate, duration = 2 * 1024 * 1024, 32
+        cache = fresh_cache()
+        # 两次播放都从带宽周期的开头开始
+        throttle = paced["/jitter"]
+        with throttle.lock:
+            throttle.started = throttle.last = time.perf_counter()
+            throttle.tokens = 0
+        proxy = MP4ProxyServer(base + "/jitter", None, {}, cache=cache, duration=duration, read_ahead=read_ahead)
+        proxy.start()
+        proxy.ready.wait()
+        state = {"buffered": 0, "received": 0}
+        lock = threading.Lock()
+
+        def receive():
+            # 限制接收缓冲区，播放器之外的缓冲（内核套接字缓冲）不超过几百 KB
+            client = socket.socket()
+            client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 128 * 1024)
+            client.connect(("127.0.0.1", proxy.port))
+            client.sendall(b"GET /video.mp4 HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n")
+            head = b""
+            while b"\r\n\r\n" not in head:
+                head += client.recv(4096)
+            data = head.split(b"\r\n\r\n", 1)[1]
+            while True:
+                with lock:
+                    state["buffered"] += len(data)
+                    state["received"] += len(data)
+                while state["buffered"] >= bitrate:
+                    time.sleep(0.005)
+                data = client.recv(CHUNK_SIZE)
+                if not data:
+                    break
+            client.close()
+
+        threading.Thread(target=receive, daemon=True).start()
+        started = last = time.perf_counter()
+        playing, played, startup, rebuffers, stalled_for = False, 0, None, 0, 0.0
+        while played < PACED_SIZE:
+            time.sleep(0.01)
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            with lock:
+                if playing:
+                    need = int(bitrate * elapsed)
+                    if state["buffered"] < min(need, PACED_SIZE - played):
+                        playing = False
+                        rebuffers += 1
+                    else:
+                        state["buffered"] -= need
+                        played += need
+                        continue
+                else:
+                    if startup is not None:
+                        stalled_for += elapsed
+                    if state["buffered"] >= min(bitrate // 2, PACED_SIZE - played):
+                        playing = True
+                        if startup is None:
+                            startup = now - started
+        fetched = proxy.read_ahead.fetched_bytes if proxy.read_ahead else 0
+        proxy.stop()
+        cache.close()
+        return startup, rebuffers, stalled_for, fetched
+
+    print(f"{'预读':<8}{'起播(s)':>10}{'卡顿次数':>10}{'卡顿时长(s)':>12}{'预读(MB)':>10}")
+    for read_ahead in (False, True):
+        startup, rebuffers, stalled_for, fetched = play(read_ahead)
+        label = "开启" if read_ahead else "关闭"
+        print(f"{label:<8}{startup:>10.2f}{rebuffers:>10}{stalled_for:>12.2f}{fetched / 1024 / 1024:>10.1f}")
+    upstream.shutdown()
+
+
+if __name__ == "__main__":
+    main()
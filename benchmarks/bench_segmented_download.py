@@ -0,0 +1,72 @@
+"""对比单连接与分段下载：本地服务器对每个连接限速，模拟 CDN 的单连接限流
+
+运行：python benchmarks/bench_segmented_download.py
+"""
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 模块都在仓库根目录，按顶层模块导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SegmentedDownloader import SegmentedDownloader
+
+
+def main():
+    size = 8 * 1024 * 1024
+    per_connection = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 1024 * 1024
+    payload = os.urandom(size)
+
+    class RangeHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            start, end = 0, size - 1
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2) or size - 1), size - 1)
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", '"bench"')
+            self.end_headers()
+            step = 64 * 1024
+            try:
+                for offset in range(start, end + 1, step):
+                    piece = payload[offset:min(offset + step, end + 1)]
+                    self.wfile.write(piece)
+                    time.sleep(len(piece) / per_connection)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/video.m4s"
+    expected = hashlib.md5(payload).hexdigest()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, workers in (("单连接", 1), ("分段并发", 8)):
+            path = os.path.join(tmp, f"{workers}.m4s")
+            downloader = SegmentedDownloader(url, path, initial_workers=min(workers, 4), max_workers=workers)
+            downloader.run()
+            with open(path, "rb") as f:
+                ok = hashlib.md5(f.read()).hexdigest() == expected
+            print(f"{name}: {downloader.elapsed:.2f}s, {size / downloader.elapsed / 1024 / 1024:.2f} MB/s, "
+                  f"{len(downloader.segments)} 段, {len(downloader._workers)} 个连接, 校验{'通过' if ok else '失败'}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""对比原图和缩略图的传输字节数：本地图片服务器按 @参数 用 Qt 缩放、转码一张 1920x1080 的图片
+
+运行：python benchmarks/bench_thumbnail.py
+"""
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 模块都在仓库根目录，按顶层模块导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, QPointF, Qt
+from PyQt5.QtGui import QColor, QGuiApplication, QImage, QLinearGradient, QPainter
+
+import HttpClient as http
+import Thumbnail
+from Thumbnail import thumbnail_size, thumbnail_url
+
+
+def main():
+    app = QGuiApplication(sys.argv)
+
+    # 近似视频截图的原图：渐变背景、色块和细节噪点
+    source = QImage(1920, 1080, QImage.Format_RGB32)
+    painter = QPainter(source)
+    gradient = QLinearGradient(QPointF(0, 0), QPointF(1920, 1080))
+    gradient.setColorAt(0, QColor(30, 60, 120))
+    gradient.setColorAt(1, QColor(220, 140, 60))
+    painter.fillRect(source.rect(), gradient)
+    seed = 1
+    for _ in range(3000):
+        seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+        x, y = seed % 1920, (seed >> 11) % 1080
+        painter.fillRect(x, y, 6 + seed % 40, 6 + (seed >> 5) % 40, QColor(seed & 0xFFFFFF))
+    painter.end()
+
+    def encode(image, fmt, quality=85):
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.WriteOnly)
+        image.save(buffer, fmt.upper(), quality)
+        return bytes(data)
+
+    original = encode(source, "jpg")
+
+    class ImageHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            body, content_type = original, "image/jpeg"
+            if "@" in self.path:
+                spec, fmt = self.path.split("@", 1)[1].rsplit(".", 1)
+                w, h = (int(part[:-1]) for part in spec.split("_")[:2])
+                scaled = source.scaled(w, h, Qt.KeepAspectRatioByExpanding, Qt.SmoothTransformation)
+                cropped = scaled.copy((scaled.width() - w) // 2, (scaled.height() - h) // 2, w, h)
+                body, content_type = encode(cropped, fmt), f"image/{fmt}"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # 本地服务器冒充图片 CDN 的域名
+    Thumbnail.RESIZE_HOSTS = Thumbnail.RESIZE_HOSTS + ("127.0.0.1",)
+    pic = f"http://127.0.0.1:{server.server_port}/bfs/archive/cover.jpg"
+
+    def fetch(url):
+        return len(http.get(url, timeout=10).content)
+
+    full = fetch(pic)
+    print(f"{'请求':<28}{'字节':>10}{'占原图':>8}")
+    print(f"{'原图 1920x1080 jpg':<28}{full:>10}{'100%':>8}")
+    # 270x150 的卡片封面，设备像素比 1 和 2
+    for ratio in (1.0, 2.0):
+        for fmt in ("jpg", "webp"):
+            w, h = thumbnail_size(270, 150, ratio)
+            size = fetch(thumbnail_url(pic, w, h, fmt))
+            print(f"{f'{w}x{h} {fmt} (x{ratio:g})':<28}{size:>10}{size / full:>8.1%}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# 模块都在仓库根目录，按顶层模块导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def isolated_cwd(tmp_path, monkeypatch):
+    """缓存、数据库等相对路径写到临时目录，不污染仓库"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,320 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import AsyncBilibiliApi
+from AsyncBilibiliApi import AsyncBilibiliClient
+from CookieStore import CookieStore
+from MediaStore import MediaStore
+from MetadataCache import MetadataCache
+from PlayurlCache import PlayurlCache
+from RateLimiter import RateLimiter
+from wbiSigned import WbiKeyManager
+
+COVER = b"\x89PNG fake cover" * 64
+
+
+@pytest.fixture(autouse=True)
+def isolated_singletons(monkeypatch):
+    """每个测试使用新的缓存、Cookie、限流器和已知的 wbi 密钥，不访问真实接口"""
+    keys = WbiKeyManager()
+    keys._set_keys("7cd084941338484aae1ad9425b84077c", "4932caff0ff746eab6f01bf08b70ac45", time.time())
+    monkeypatch.setattr(AsyncBilibiliApi, "wbi_keys", keys)
+    monkeypatch.setattr(AsyncBilibiliApi, "cookie_store", CookieStore())
+    monkeypatch.setattr(AsyncBilibiliApi, "media_store", MediaStore())
+    monkeypatch.setattr(AsyncBilibiliApi, "metadata_cache", MetadataCache())
+    monkeypatch.setattr(AsyncBilibiliApi, "playurl_cache", PlayurlCache(lambda *args: None))
+    monkeypatch.setattr(AsyncBilibiliApi, "rate_limiter", RateLimiter())
+
+
+class StandIn:
+    """本地替身服务器：/slow 慢慢返回 JSON（记录客户端是否中途断开），/error 返回 500，
+    其余路由模拟界面用到的 Bilibili 接口"""
+
+    def __init__(self, delay=0.3):
+        self.delay = delay
+        self.hits = {}
+        self.queries = {}
+        self.active = 0
+        self.max_active = 0
+        self.aborted = asyncio.Event()
+        self.finished = asyncio.Event()
+
+    async def slow(self, request):
+        self.hits["slow"] = self.hits.get("slow", 0) + 1
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        try:
+            await response.write(b'{"code": 0, "data": {"value": 1}')
+            steps = int(self.delay / 0.05)
+            for _ in range(steps):
+                await asyncio.sleep(0.05)
+                await response.write(b" ")
+            await response.write(b"}")
+            await response.write_eof()
+            self.finished.set()
+        except (ConnectionResetError, asyncio.CancelledError):
+            self.aborted.set()
+            raise
+        return response
+
+    async def error(self, request):
+        self.hits["error"] = self.hits.get("error", 0) + 1
+        await asyncio.sleep(0.1)
+        return web.Response(status=500, text="boom")
+
+    def _record(self, name, request):
+        self.hits[name] = self.hits.get(name, 0) + 1
+        self.queries[name] = dict(request.query)
+
+    async def view(self, request):
+        self._record("view", request)
+        return web.json_response({"code": 0, "data": {
+            "bvid": request.query["bvid"], "aid": 170001, "cid": 279786, "title": "替身视频", "duration": 61,
+        }})
+
+    async def playurl(self, request):
+        self._record("playurl", request)
+        deadline = int(time.time()) + 3600
+        return web.json_response({"code": 0, "data": {
+            "quality": int(request.query["qn"]),
+            "durl": [{"url": f"{request.scheme}://{request.host}/video.mp4?deadline={deadline}", "size": 1024}],
+        }})
+
+    async def feed(self, request):
+        self._record("feed", request)
+        return web.json_response({"code": 0, "data": {"item": [
+            {"bvid": "BV1feed000001", "id": 1, "cid": 11, "title": "推荐一", "duration": 10},
+            {"bvid": "BV1feed000002", "id": 2, "cid": 22, "title": "推荐二", "duration": 20},
+            {"goto": "ad"},
+        ]}})
+
+    async def nav(self, request):
+        self._record("nav", request)
+        return web.json_response({"code": 0, "data": {"isLogin": True, "uname": "替身用户", "mid": 42}})
+
+    async def qrcode_poll(self, request):
+        self._record("qrcode_poll", request)
+        response = web.json_response({"code": 0, "data": {"code": 0, "message": ""}})
+        response.set_cookie("SESSDATA", "sess-token", secure=True)
+        response.set_cookie("bili_jct", "csrf-token")
+        return response
+
+    async def cover(self, request):
+        self._record("cover", request)
+        if request.headers.get("If-None-Match") == '"cover-v1"':
+            return web.Response(status=304)
+        return web.Response(body=COVER, headers={"ETag": '"cover-v1"', "Content-Type": "image/png"})
+
+    async def not_modified(self, request):
+        # 不管请求头如何都返回 304
+        self._record("not_modified", request)
+        return web.Response(status=304)
+
+    async def gate(self, request):
+        self.hits["gate"] = self.hits.get("gate", 0) + 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.1)
+        finally:
+            self.active -= 1
+        return web.json_response({"code": 0, "data": {"n": int(request.query["n"])}})
+
+
+async def start(stand_in):
+    app = web.Application()
+    app.router.add_get("/slow", stand_in.slow)
+    app.router.add_get("/error", stand_in.error)
+    app.router.add_get("/x/web-interface/view", stand_in.view)
+    app.router.add_get("/x/player/wbi/playurl", stand_in.playurl)
+    app.router.add_get("/x/web-interface/wbi/index/top/feed/rcmd", stand_in.feed)
+    app.router.add_get("/x/web-interface/nav", stand_in.nav)
+    app.router.add_get("/x/passport-login/web/qrcode/poll", stand_in.qrcode_poll)
+    app.router.add_get("/cover.jpg", stand_in.cover)
+    app.router.add_get("/not-modified.jpg", stand_in.not_modified)
+    app.router.add_get("/gate", stand_in.gate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def run(scenario, delay=0.3, max_concurrency=8):
+    async def main():
+        stand_in = StandIn(delay)
+        runner, base = await start(stand_in)
+        client = AsyncBilibiliClient(max_concurrency=max_concurrency, api_base=base, passport_base=base)
+        try:
+            return await scenario(client, base, stand_in)
+        finally:
+            await client.close()
+            await runner.cleanup()
+    return asyncio.run(main())
+
+
+def test_concurrent_identical_calls_share_one_request():
+    async def scenario(client, base, stand_in):
+        results = await asyncio.gather(*(client.get_json(f"{base}/slow", {"a": 1}) for _ in range(5)))
+        assert all(result == {"code": 0, "data": {"value": 1}} for result in results)
+        assert stand_in.hits["slow"] == 1
+        assert not client._inflight
+
+    run(scenario)
+
+
+def test_different_params_are_not_coalesced():
+    async def scenario(client, base, stand_in):
+        await asyncio.gather(client.get_json(f"{base}/slow", {"a": 1}), client.get_json(f"{base}/slow", {"a": 2}))
+        assert stand_in.hits["slow"] == 2
+
+    run(scenario)
+
+
+def test_cancelling_last_waiter_aborts_the_request():
+    async def scenario(client, base, stand_in):
+        caller = asyncio.ensure_future(client.get_json(f"{base}/slow"))
+        await asyncio.sleep(0.2)
+        inner = next(iter(client._inflight.values()))
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.wait_for(stand_in.aborted.wait(), 2)
+        assert inner.cancelled()
+        assert not client._inflight
+        assert not stand_in.finished.is_set()
+
+    run(scenario, delay=3)
+
+
+def test_cancelling_one_waiter_keeps_the_shared_request():
+    async def scenario(client, base, stand_in):
+        first = asyncio.ensure_future(client.get_json(f"{base}/slow"))
+        second = asyncio.ensure_future(client.get_json(f"{base}/slow"))
+        await asyncio.sleep(0.1)
+        first.cancel()
+        assert (await second)["code"] == 0
+        assert first.cancelled()
+        assert stand_in.hits["slow"] == 1
+        assert not stand_in.aborted.is_set()
+
+    run(scenario)
+
+
+def test_cancel_all_cancels_the_underlying_request():
+    async def scenario(client, base, stand_in):
+        callers = [asyncio.ensure_future(client.get_json(f"{base}/slow")) for _ in range(3)]
+        await asyncio.sleep(0.2)
+        inner = next(iter(client._inflight.values()))
+        client.cancel_all()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert all(isinstance(result, asyncio.CancelledError) for result in results)
+        await asyncio.wait_for(stand_in.aborted.wait(), 2)
+        assert inner.cancelled()
+
+    run(scenario, delay=3)
+
+
+def test_errors_propagate_to_every_waiter():
+    async def scenario(client, base, stand_in):
+        results = await asyncio.gather(*(client.get_json(f"{base}/error") for _ in range(3)),
+                                       return_exceptions=True)
+        assert all(isinstance(result, aiohttp.ClientResponseError) and result.status == 500 for result in results)
+        assert stand_in.hits["error"] == 1
+        assert not client._inflight
+
+    run(scenario)
+
+
+def test_view_parses_data_and_serves_repeats_from_cache():
+    async def scenario(client, base, stand_in):
+        data = await client.view("BV1xx411c7mD")
+        assert data["cid"] == 279786 and data["title"] == "替身视频"
+        assert stand_in.queries["view"] == {"bvid": "BV1xx411c7mD"}
+        assert (await client.view("BV1xx411c7mD"))["cid"] == 279786
+        assert stand_in.hits["view"] == 1
+
+    run(scenario)
+
+
+def test_playurl_is_signed_and_cached():
+    async def scenario(client, base, stand_in):
+        data = await client.playurl("BV1xx411c7mD", 279786, qn=80)
+        assert data["quality"] == 80
+        assert data["durl"][0]["size"] == 1024
+        query = stand_in.queries["playurl"]
+        assert query["cid"] == "279786" and query["qn"] == "80"
+        assert "w_rid" in query and "wts" in query
+        assert (await client.playurl("BV1xx411c7mD", 279786, qn=80)) == data
+        assert stand_in.hits["playurl"] == 1
+
+    run(scenario)
+
+
+def test_feed_rcmd_returns_items_and_seeds_metadata():
+    async def scenario(client, base, stand_in):
+        items = await client.feed_rcmd(page=2, pagesize=3)
+        assert [item.get("bvid") for item in items] == ["BV1feed000001", "BV1feed000002", None]
+        assert stand_in.queries["feed"]["page"] == "2" and "w_rid" in stand_in.queries["feed"]
+        seeded = AsyncBilibiliApi.metadata_cache.get("BV1feed000002")
+        assert seeded["cid"] == 22 and seeded["title"] == "推荐二"
+        assert AsyncBilibiliApi.metadata_cache.get("BV1feed000002", require_full=True) is None
+
+    run(scenario)
+
+
+def test_nav_returns_user_data():
+    async def scenario(client, base, stand_in):
+        assert await client.nav() == {"isLogin": True, "uname": "替身用户", "mid": 42}
+
+    run(scenario)
+
+
+def test_qrcode_poll_saves_login_cookies():
+    async def scenario(client, base, stand_in):
+        assert await client.qrcode_poll("qr-key") == 0
+        assert stand_in.queries["qrcode_poll"] == {"qrcode_key": "qr-key"}
+        assert AsyncBilibiliApi.cookie_store.get() == {"SESSDATA": "sess-token", "bili_jct": "csrf-token"}
+        # 之后的请求带上保存的 Cookie
+        assert "SESSDATA=sess-token" in client._request_headers()["Cookie"]
+
+    run(scenario)
+
+
+def test_download_cover_stores_and_revalidates(monkeypatch):
+    async def scenario(client, base, stand_in):
+        path = await client.download_cover(f"{base}/cover.jpg")
+        with open(path, "rb") as f:
+            assert f.read() == COVER
+        # 未到确认时间时直接使用存储中的文件
+        assert await client.download_cover(f"{base}/cover.jpg") == path
+        assert stand_in.hits["cover"] == 1
+        # 到期后发条件请求，304 时继续使用原文件
+        monkeypatch.setattr(AsyncBilibiliApi, "REVALIDATE_AFTER", 0)
+        assert await client.download_cover(f"{base}/cover.jpg") == path
+        assert stand_in.hits["cover"] == 2
+
+    run(scenario)
+
+
+def test_not_modified_without_stored_entry_is_a_miss():
+    async def scenario(client, base, stand_in):
+        assert await client.download_cover(f"{base}/not-modified.jpg") is None
+        assert stand_in.hits["not_modified"] == 1
+
+    run(scenario)
+
+
+def test_semaphore_bounds_concurrent_requests():
+    async def scenario(client, base, stand_in):
+        results = await asyncio.gather(*(client.get_json(f"{base}/gate", {"n": n}) for n in range(6)))
+        assert [result["data"]["n"] for result in results] == list(range(6))
+        assert stand_in.hits["gate"] == 6
+        assert stand_in.max_active == 2
+
+    run(scenario, max_concurrency=2)
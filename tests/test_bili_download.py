@@ -0,0 +1,107 @@
+import BatchDownloader
+import BiliDownload
+import DownloadManager
+from RateLimiter import RateLimitedError
+
+GOOD = "BV1GJ411x7h7"
+BAD = "BV1xx411c7mD"
+
+
+class FakeInfo:
+    def __init__(self, bvid):
+        self.info = {"data": {"bvid": bvid, "title": "标题", "owner": {"name": "UP"}}}
+
+    def get_pages(self):
+        return [{"cid": 1001, "part": "第一集", "page": 1}]
+
+
+def fake_video_info(bvid):
+    if bvid == BAD:
+        raise Exception(f"获取视频信息失败 {bvid}: 啥都木有")
+    return FakeInfo(bvid)
+
+
+class FakeDownload:
+    def download_video(self, bvid, cid, save_path, **kwargs):
+        with open(save_path, "wb") as f:
+            f.write(b"mp4")
+
+
+def run(monkeypatch, tmp_path, *bvids, video_info=fake_video_info):
+    monkeypatch.setattr(BatchDownloader.BatchDownloader, "_video_info", staticmethod(video_info))
+    monkeypatch.setattr(BatchDownloader, "resolve_playurl", lambda *args, **kwargs: None)
+    monkeypatch.setattr(DownloadManager, "Download", FakeDownload)
+    return BiliDownload.main([*bvids, "-o", str(tmp_path / "out"), "--db", str(tmp_path / "queue.db"), "--quiet"])
+
+
+def test_expand_many_returns_failures(monkeypatch):
+    monkeypatch.setattr(BatchDownloader.BatchDownloader, "_video_info", staticmethod(fake_video_info))
+    failures = []
+    items = BatchDownloader.BatchDownloader(manager=object()).expand_many([GOOD, BAD], failures=failures)
+    assert [item["bvid"] for item in items] == [GOOD]
+    assert failures == [(BAD, f"获取视频信息失败 {BAD}: 啥都木有")]
+
+
+def test_expand_many_retries_throttled_videos(monkeypatch):
+    calls = []
+
+    def throttled_once(bvid):
+        calls.append(bvid)
+        if calls.count(bvid) == 1:
+            raise RateLimitedError(("api.bilibili.com", "view"), 0.01)
+        return FakeInfo(bvid)
+
+    monkeypatch.setattr(BatchDownloader.BatchDownloader, "_video_info", staticmethod(throttled_once))
+    failures = []
+    items = BatchDownloader.BatchDownloader(manager=object()).expand_many([GOOD], failures=failures)
+    assert [item["bvid"] for item in items] == [GOOD]
+    assert failures == []
+    assert calls == [GOOD, GOOD]
+
+
+def test_expand_many_gives_up_after_throttle_retries(monkeypatch):
+    def always_throttled(bvid):
+        raise RateLimitedError(("api.bilibili.com", "view"), 0.01)
+
+    monkeypatch.setattr(BatchDownloader.BatchDownloader, "_video_info", staticmethod(always_throttled))
+    failures = []
+    batch = BatchDownloader.BatchDownloader(manager=object(), throttle_retries=2)
+    assert batch.expand_many([GOOD], failures=failures) == []
+    assert [bvid for bvid, _ in failures] == [GOOD]
+
+
+def test_cli_exits_with_error_when_any_expansion_fails(monkeypatch, tmp_path, capsys):
+    assert run(monkeypatch, tmp_path, GOOD, BAD) == 1
+    assert (tmp_path / "out" / "标题" / "P01 第一集.mp4").read_bytes() == b"mp4"
+    assert BAD in capsys.readouterr().err
+
+
+def test_cli_succeeds_when_everything_expands(monkeypatch, tmp_path):
+    assert run(monkeypatch, tmp_path, GOOD) == 0
+
+
+def test_cli_retries_throttled_resolutions(monkeypatch, tmp_path):
+    throttled = []
+
+    def video_info(bvid):
+        if len(throttled) < 3:
+            throttled.append(bvid)
+            raise RateLimitedError(("api.bilibili.com", "view"), 0.01)
+        return FakeInfo(bvid)
+
+    assert run(monkeypatch, tmp_path, GOOD, video_info=video_info) == 0
+    assert throttled == [GOOD] * 3
+    assert (tmp_path / "out" / "标题" / "P01 第一集.mp4").read_bytes() == b"mp4"
+
+
+def test_cli_keeps_resolvers_within_the_view_burst(monkeypatch, tmp_path):
+    created = []
+
+    class RecordingBatch(BatchDownloader.BatchDownloader):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self)
+
+    monkeypatch.setattr(BiliDownload, "BatchDownloader", RecordingBatch)
+    assert run(monkeypatch, tmp_path, GOOD, "-j", "16") == 0
+    assert created[0].max_resolvers == BiliDownload.rate_limiter.limits["view"][1]
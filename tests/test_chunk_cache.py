@@ -0,0 +1,50 @@
+import os
+
+from ChunkCache import ChunkCache
+
+CHUNK = 1024
+
+
+def filled_cache(tmp_path):
+    # 内存只能放 2 块，其余溢出到映射文件
+    cache = ChunkCache(chunk_size=CHUNK, memory_limit=2 * CHUNK, disk_limit=8 * CHUNK,
+                       per_video_limit=16 * CHUNK, spill_path=str(tmp_path / "chunks.bin"))
+    for index in range(6):
+        cache.put("a", index, bytes([index]) * CHUNK)
+    cache.set_length("a", 6 * CHUNK)
+    assert cache.get("a", 0) == bytes([0]) * CHUNK
+    assert cache.get("a", 9) is None
+    return cache
+
+
+def assert_empty(cache):
+    stats = cache.stats("a")
+    assert stats["memory_bytes"] == stats["disk_bytes"] == stats["video_bytes"] == 0
+    assert stats["memory_hits"] == stats["disk_hits"] == stats["misses"] == stats["evictions"] == 0
+    assert cache.length("a") is None
+    assert not cache.contains("a", 0) and not cache.contains("a", 5)
+
+
+def test_clear_drops_chunks_and_resets_stats(tmp_path):
+    cache = filled_cache(tmp_path)
+    cache.clear()
+    assert_empty(cache)
+    # 映射文件保留，清空后可以继续溢出
+    for index in range(6):
+        cache.put("a", index, bytes([index]) * CHUNK)
+    assert cache.get("a", 0) == bytes([0]) * CHUNK
+    cache.close()
+
+
+def test_close_forgets_spilled_chunks_and_stays_usable(tmp_path):
+    cache = filled_cache(tmp_path)
+    cache.close()
+    assert not os.path.exists(cache.spill_path)
+    assert_empty(cache)
+    assert cache.get("a", 0) is None
+
+    for index in range(6):
+        cache.put("a", index, bytes([index + 1]) * CHUNK)
+    assert cache.get("a", 0) == bytes([1]) * CHUNK
+    assert cache.stats("a")["video_bytes"] == 6 * CHUNK
+    cache.close()
@@ -0,0 +1,65 @@
+import time
+
+import DownloadManager
+from DownloadManager import DONE, QUEUED
+from RateLimiter import CircuitOpenError, RateLimitedError
+
+
+class ThrottledDownload:
+    """前几次调用抛出给定的限流错误，之后写出文件"""
+
+    errors = []
+    started = []
+
+    def download_video(self, bvid, cid, save_path, **kwargs):
+        ThrottledDownload.started.append(time.monotonic())
+        if ThrottledDownload.errors:
+            raise ThrottledDownload.errors.pop(0)
+        with open(save_path, "wb") as f:
+            f.write(b"mp4")
+
+
+def wait_for(manager, job_id, state, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job["state"] == state:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"任务停在 {manager.get(job_id)['state']}")
+
+
+def run_throttled(monkeypatch, tmp_path, *errors):
+    ThrottledDownload.errors = list(errors)
+    ThrottledDownload.started = []
+    monkeypatch.setattr(DownloadManager, "Download", ThrottledDownload)
+    manager = DownloadManager.DownloadManager(db_path=str(tmp_path / "queue.db"), output_dir=str(tmp_path))
+    states = []
+    manager.add_listener(lambda event, job: event == "state" and states.append(job["state"]))
+    job_id = manager.enqueue("BV1GJ411x7h7", cid="1001", save_path=str(tmp_path / "out.mp4"))
+    return manager, job_id, states
+
+
+def test_rate_limited_job_is_requeued_after_retry_after(monkeypatch, tmp_path):
+    manager, job_id, states = run_throttled(
+        monkeypatch, tmp_path, RateLimitedError(("api.bilibili.com", "playurl"), 0.3))
+    job = wait_for(manager, job_id, DONE)
+    assert job["error"] is None
+    assert (tmp_path / "out.mp4").read_bytes() == b"mp4"
+    first, second = ThrottledDownload.started
+    assert second - first >= 0.3
+    assert QUEUED in states and "failed" not in states
+
+
+def test_circuit_open_job_waits_for_the_breaker(monkeypatch, tmp_path):
+    manager, job_id, _ = run_throttled(
+        monkeypatch, tmp_path, CircuitOpenError(("api.bilibili.com", "playurl"), 60))
+    time.sleep(0.3)
+    job = manager.get(job_id)
+    assert job["state"] == QUEUED and "熔断" in job["error"]
+    assert len(ThrottledDownload.started) == 1
+    # 暂停后恢复的任务不再等待
+    manager.pause(job_id)
+    manager.resume(job_id)
+    wait_for(manager, job_id, DONE)
+    assert len(ThrottledDownload.started) == 2
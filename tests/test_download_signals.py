@@ -0,0 +1,60 @@
+import os
+import threading
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtCore = pytest.importorskip("PyQt5.QtCore")
+
+from DownloadSignals import DownloadSignals
+
+
+class Manager:
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def notify(self, event, job):
+        for callback in list(self.listeners):
+            callback(event, job)
+
+
+def test_events_from_download_threads_arrive_on_the_main_thread():
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    manager = Manager()
+    signals = DownloadSignals(manager)
+    received = []
+
+    def slot(name):
+        return lambda value: received.append((name, value, threading.current_thread() is threading.main_thread()))
+
+    signals.job_added.connect(slot("added"))
+    signals.job_state_changed.connect(slot("state"))
+    signals.job_progress.connect(slot("progress"))
+    signals.job_removed.connect(slot("removed"))
+
+    def worker():
+        manager.notify("added", {"id": 1})
+        manager.notify("state", {"id": 1, "state": "running"})
+        manager.notify("progress", {"id": 1, "rate": 1024})
+        manager.notify("removed", {"id": 1})
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    assert received == []  # 排队到主线程，处理事件前不会调用
+    app.processEvents()
+    assert received == [
+        ("added", {"id": 1}, True),
+        ("state", {"id": 1, "state": "running"}, True),
+        ("progress", {"id": 1, "rate": 1024}, True),
+        ("removed", 1, True),
+    ]
+
+    signals.detach()
+    assert manager.listeners == []
@@ -0,0 +1,66 @@
+import os
+
+import BilibiliApi
+from MediaStore import MediaStore
+
+
+def test_collect_releases_videos_the_user_deleted(tmp_path):
+    store = MediaStore(str(tmp_path / "store"))
+    for name in ("kept", "deleted"):
+        source = tmp_path / f"{name}.mp4"
+        source.write_bytes(name.encode() * 1000)
+        store.put_file(str(source), "media", name)
+        store.materialize("media", name, str(tmp_path / "out" / f"{name}.mp4"))
+
+    assert store.collect() == (0, 0)
+    os.remove(tmp_path / "out" / "deleted.mp4")
+
+    removed, freed = store.collect()
+    assert (removed, freed) == (1, len(b"deleted") * 1000)
+    assert store.lookup("media", "deleted") is None
+    assert store.lookup("media", "kept") is not None
+    assert (tmp_path / "out" / "kept.mp4").read_bytes() == b"kept" * 1000
+
+
+def test_redownload_does_not_truncate_the_stored_blob(tmp_path, monkeypatch):
+    store = MediaStore(str(tmp_path / "store"))
+    monkeypatch.setattr(BilibiliApi, "media_store", store)
+    download = BilibiliApi.Download()
+    save_path = str(tmp_path / "out" / "video.mp4")
+    os.makedirs(tmp_path / "out")
+
+    for key, content in (("old", b"old" * 1000), ("new", b"new" * 10)):
+        mux_path = download._mux_path(save_path)
+        with open(mux_path, "wb") as f:
+            f.write(content)
+        download._finish_video(key, mux_path, save_path, None)
+
+    assert not os.path.exists(download._mux_path(save_path))
+    with open(save_path, "rb") as f:
+        assert f.read() == b"new" * 10
+    with open(store.lookup("media", "old")["path"], "rb") as f:
+        assert f.read() == b"old" * 1000
+
+
+def test_collect_keeps_videos_materialized_as_copies(tmp_path, monkeypatch):
+    store = MediaStore(str(tmp_path / "store"))
+    source = tmp_path / "copied.mp4"
+    source.write_bytes(b"copied" * 1000)
+    store.put_file(str(source), "media", "copied")
+
+    # 不支持硬链接（例如跨分区）时退回复制
+    def no_link(src, dst):
+        raise OSError("cross-device link")
+
+    out = tmp_path / "out" / "copied.mp4"
+    with monkeypatch.context() as patch:
+        patch.setattr(os, "link", no_link)
+        store.materialize("media", "copied", str(out))
+    assert os.stat(out).st_nlink == 1
+
+    assert store.collect() == (0, 0)
+    assert store.lookup("media", "copied") is not None
+
+    os.remove(out)
+    assert store.collect() == (1, len(b"copied") * 1000)
+    assert store.lookup("media", "copied") is None
@@ -0,0 +1,130 @@
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import MirrorStats as mirror_module
+from MirrorStats import HEDGE_WORKERS, MirrorStats, hedged_get
+
+A = "http://a.example/video.m4s"
+B = "http://b.example/video.m4s"
+
+
+def saved_hosts(db_path):
+    with sqlite3.connect(db_path) as db:
+        return {row[0] for row in db.execute("SELECT host FROM mirrors")}
+
+
+def test_records_stay_in_memory_until_flush(tmp_path):
+    db_path = str(tmp_path / "mirrors.db")
+    stats = MirrorStats(db_path=db_path, flush_interval=60)
+    stats.record(A, latency=0.2)
+    stats.record_failure(B)
+    assert stats.get(A)["latency"] == 0.2
+    assert saved_hosts(db_path) == set()
+
+    stats.flush()
+    assert saved_hosts(db_path) == {"a.example", "b.example"}
+    reloaded = MirrorStats(db_path=db_path)
+    assert reloaded.get(A)["latency"] == 0.2
+    assert reloaded.get(B)["failures"] == 1
+    assert reloaded.order([B, A]) == [A, B]
+
+
+def test_updates_are_written_after_the_flush_interval(tmp_path):
+    db_path = str(tmp_path / "mirrors.db")
+    stats = MirrorStats(db_path=db_path, flush_interval=0.2)
+    for _ in range(50):
+        stats.record(A, latency=0.1)
+    assert saved_hosts(db_path) == set()
+    time.sleep(0.5)
+    assert saved_hosts(db_path) == {"a.example"}
+    assert stats._timer is None
+
+
+class Mirror(BaseHTTPRequestHandler):
+    """响应头前等待 delay 秒，然后在 2 秒内慢慢发送响应体，记录客户端断开的时间"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.hits += 1
+        time.sleep(self.server.delay)
+        self.send_response(200)
+        self.send_header("Content-Length", str(40 * 64 * 1024))
+        self.end_headers()
+        try:
+            for _ in range(40):
+                self.wfile.write(b"x" * 64 * 1024)
+                time.sleep(0.05)
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.disconnected.append(time.perf_counter())
+
+
+@pytest.fixture
+def mirrors():
+    servers = []
+    for delay in (0.6, 0.0):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Mirror)
+        server.delay, server.disconnected, server.hits = delay, [], 0
+        server.handle_error = lambda *args: None
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_hedged_get_closes_the_loser_when_it_arrives(mirrors, tmp_path):
+    slow, fast = (f"http://127.0.0.1:{server.server_port}/video.m4s" for server in mirrors)
+    stats = MirrorStats(db_path=str(tmp_path / "mirrors.db"))
+    started = time.perf_counter()
+    url, response = hedged_get([slow, fast], hedge_after=0.1, stats=stats, timeout=10)
+    assert url == fast
+    time.sleep(1.0)
+    response.close()
+    # 慢镜像的响应头在 0.6 秒时到达，随即被关闭，而不是等到响应体发完（2 秒）
+    assert len(mirrors[0].disconnected) == 1
+    assert mirrors[0].disconnected[0] - started < 1.2
+    assert stats.get(slow)["latency"] >= 0.6
+
+
+def test_hedged_get_reuses_a_shared_pool(mirrors, tmp_path):
+    fast = f"http://127.0.0.1:{mirrors[1].server_port}/video.m4s"
+    stats = MirrorStats(db_path=str(tmp_path / "mirrors.db"))
+    before = client_threads()
+    for _ in range(3 * HEDGE_WORKERS):
+        hedged_get([fast], stats=stats, timeout=10)[1].close()
+    assert client_threads() - before <= HEDGE_WORKERS
+
+
+def test_time_queued_in_the_pool_does_not_count_toward_the_hedge(mirrors, tmp_path):
+    slow, fast = (f"http://127.0.0.1:{server.server_port}/video.m4s" for server in mirrors)
+    stats = MirrorStats(db_path=str(tmp_path / "mirrors.db"))
+    # 其他下载占满共享线程池 0.5 秒
+    gate = threading.Event()
+    busy = [mirror_module._executor.submit(gate.wait) for _ in range(HEDGE_WORKERS)]
+    release = threading.Timer(0.5, gate.set)
+    release.start()
+    try:
+        url, response = hedged_get([fast, slow], hedge_after=0.2, stats=stats, timeout=10)
+        response.close()
+    finally:
+        gate.set()
+        release.cancel()
+    for future in busy:
+        future.result()
+    # 首选镜像一开始执行就立即响应，不需要对冲
+    assert url == fast
+    assert mirrors[0].hits == 0
+
+
+def client_threads():
+    # 不计替身服务器处理连接的线程
+    return sum("process_request" not in thread.name for thread in threading.enumerate())
@@ -0,0 +1,46 @@
+import time
+
+from PlayurlCache import PlayurlCache
+
+KEY = ("BV1GJ411x7h7", "1001", 80, 4048)
+
+
+def make_cache():
+    calls = []
+
+    def resolver(*key):
+        calls.append(key)
+        return {"durl": [{"url": f"https://upos/video.mp4?deadline={int(time.time()) + 3600}"}]}
+
+    return PlayurlCache(resolver), calls
+
+
+def age(cache, seconds):
+    cache._entries[KEY]["last_used"] -= seconds
+    return cache._entries[KEY]["last_used"]
+
+
+def test_forced_resolution_counts_as_a_use():
+    cache, calls = make_cache()
+    cache.get(*KEY)
+    age(cache, 3600)
+    cache.get(*KEY, force=True)
+    assert len(calls) == 2
+    assert time.time() - cache._entries[KEY]["last_used"] < 1
+
+
+def test_put_counts_as_a_use():
+    cache, _ = make_cache()
+    cache.get(*KEY)
+    age(cache, 3600)
+    cache.put(*KEY, {"durl": []})
+    assert time.time() - cache._entries[KEY]["last_used"] < 1
+
+
+def test_background_refresh_keeps_last_used():
+    cache, calls = make_cache()
+    cache.get(*KEY)
+    last_used = age(cache, 3600)
+    cache._refresh(KEY)
+    assert len(calls) == 2
+    assert cache._entries[KEY]["last_used"] == last_used
@@ -0,0 +1,146 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import HttpClient as http
+import ProxyServer
+from ChunkCache import ChunkCache
+from ProxyServer import MP4ProxyServer
+
+SIZE = 16 * 1024 * 1024
+RATE = 16 * 1024 * 1024  # 每个连接的限速（字节/秒）
+
+
+def expected(start, end):
+    count = end - start + 1
+    return (bytes(range(251)) * (count // 251 + 2))[start % 251:start % 251 + count]
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """按需生成数据的范围请求服务器，每个连接限速 RATE"""
+
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append(self.headers.get("Range"))
+        start, end = 0, SIZE - 1
+        if self.headers.get("Range"):
+            first, last = self.headers["Range"].split("=", 1)[1].split("-")
+            if not first:
+                start = SIZE - int(last)
+            else:
+                start, end = int(first), min(int(last) if last else SIZE - 1, SIZE - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{SIZE}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        started = time.perf_counter()
+        offset = start
+        try:
+            while offset <= end:
+                count = min(64 * 1024, end - offset + 1)
+                self.wfile.write(expected(offset, offset + count - 1))
+                offset += count
+                delay = (offset - start) / RATE - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+
+
+@pytest.fixture
+def upstream():
+    RangeHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/video.mp4"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def proxy(upstream, tmp_path):
+    cache = ChunkCache(spill_path=str(tmp_path / "chunks.bin"))
+    server = MP4ProxyServer(upstream, None, {}, cache=cache, read_ahead=False)
+    server.start()
+    server.ready.wait(5)
+    yield server
+    server.stop()
+    cache.close()
+
+
+def test_parallel_ranged_reads_overlap(proxy):
+    part = SIZE // 4
+    spans = [None] * 4
+    bodies = [None] * 4
+
+    def read(index):
+        started = time.perf_counter()
+        headers = {"Range": f"bytes={index * part}-{(index + 1) * part - 1}"}
+        with http.get(proxy.output_url, headers=headers, timeout=30) as response:
+            assert response.status_code == 206
+            bodies[index] = response.content
+        spans[index] = (started, time.perf_counter())
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(4)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    for index in range(4):
+        assert bodies[index] == expected(index * part, (index + 1) * part - 1)
+    # 每个读取单独约需 0.25 秒；逐个处理时总共约 1 秒，最后一个读取在第一个结束后才完成
+    single = part / RATE
+    assert max(start for start, _ in spans) < min(end for _, end in spans)
+    assert max(end for _, end in spans) - min(end for _, end in spans) < single
+    assert elapsed < 2 * single
+
+
+def test_suffix_range_with_unknown_length_is_answered_from_upstream(proxy):
+    assert proxy.content_length is None
+    count = 300 * 1024 + 17  # 起点不在块边界上
+    with http.get(proxy.output_url, headers={"Range": f"bytes=-{count}"}, timeout=30) as response:
+        assert response.status_code == 206
+        assert response.headers["Content-Range"] == f"bytes {SIZE - count}-{SIZE - 1}/{SIZE}"
+        assert response.content == expected(SIZE - count, SIZE - 1)
+    assert RangeHandler.requests == [f"bytes=-{count}"]
+    assert proxy.content_length == SIZE
+
+    # 只缓存完整的块：再读同一范围只请求起点所在的那一块
+    with http.get(proxy.output_url, headers={"Range": f"bytes=-{count}"}, timeout=30) as response:
+        assert response.content == expected(SIZE - count, SIZE - 1)
+    chunk_size = proxy.cache.chunk_size
+    first = (SIZE - count) // chunk_size * chunk_size
+    assert RangeHandler.requests[1:] == [f"bytes={first}-{first + chunk_size - 1}"]
+
+
+def test_stalled_pending_chunk_is_fetched_by_the_waiting_request(proxy, monkeypatch):
+    monkeypatch.setattr(ProxyServer, "PENDING_WAIT", 0.2)
+    chunk_size = proxy.cache.chunk_size
+    # 先读第一块，得到文件长度
+    with http.get(proxy.output_url, headers={"Range": f"bytes=0-{chunk_size - 1}"}, timeout=5) as response:
+        assert response.content == expected(0, chunk_size - 1)
+
+    # 第二块登记为正在下载，但那次下载永远不会完成
+    stalled = proxy._claim(1, 1)
+    assert stalled == [1]
+    started = time.perf_counter()
+    headers = {"Range": f"bytes={chunk_size}-{2 * chunk_size - 1}"}
+    with http.get(proxy.output_url, headers=headers, timeout=5) as response:
+        assert response.status_code == 206
+        assert response.content == expected(chunk_size, 2 * chunk_size - 1)
+    assert time.perf_counter() - started < 2
+    assert RangeHandler.requests[-1] == f"bytes={chunk_size}-{2 * chunk_size - 1}"
+    proxy._release(stalled)
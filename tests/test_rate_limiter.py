@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import BilibiliApi
+from RateLimiter import CircuitOpenError, RateLimitedError, RateLimiter
+
+
+class Stub(BaseHTTPRequestHandler):
+    """风控替身：risky 时返回 HTTP 412，否则延迟 delay 秒后返回 code 0"""
+
+    risky = True
+    delay = 0.0
+    drop = False
+    hits = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        type(self).hits += 1
+        if type(self).drop:
+            # 不返回响应直接断开
+            self.close_connection = True
+            return
+        if type(self).risky:
+            self.send_response(412)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        time.sleep(type(self).delay)
+        body = json.dumps({"code": 0, "data": {}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def stub():
+    Stub.risky, Stub.delay, Stub.drop, Stub.hits = True, 0.0, False, 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/x/web-interface/card"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = RateLimiter(backoff_base=0.2, backoff_max=1.0, circuit_threshold=3, circuit_cooldown=0.5)
+    monkeypatch.setattr(BilibiliApi, "rate_limiter", limiter)
+    return limiter
+
+
+def timed_get(url):
+    started = time.perf_counter()
+    response = BilibiliApi._limited_get(url, None)
+    return response, time.perf_counter() - started
+
+
+def test_412_backs_off_opens_breaker_and_recovers_through_probe(stub, limiter):
+    # 连续 412：每次重试前等待的时间按 0.2、0.4 秒递增
+    response, _ = timed_get(stub)
+    assert response.status_code == 412
+    response, waited = timed_get(stub)
+    assert response.status_code == 412 and waited >= 0.15
+    response, waited = timed_get(stub)
+    assert response.status_code == 412 and waited >= 0.35
+
+    # 第三次失败后熔断：请求不再发出
+    hits = Stub.hits
+    with pytest.raises(CircuitOpenError):
+        BilibiliApi._limited_get(stub, None)
+    assert Stub.hits == hits
+    host = stub.split("/")[2]
+    assert limiter.status()[host]["circuit_open"]
+
+    # 冷却期结束后只放行一个试探请求，试探进行中其他请求被拒绝
+    Stub.risky, Stub.delay = False, 0.3
+    time.sleep(0.55)
+    probe = {}
+    thread = threading.Thread(target=lambda: probe.update(response=timed_get(stub)[0]))
+    thread.start()
+    time.sleep(0.4)
+    with pytest.raises(CircuitOpenError):
+        BilibiliApi._limited_get(stub, None)
+    thread.join()
+    assert probe["response"].status_code == 200
+
+    # 试探成功后恢复正常
+    Stub.delay = 0.0
+    response, waited = timed_get(stub)
+    assert response.status_code == 200 and waited < 0.1
+    assert limiter.status()[host] == {"failures": 0, "backoff": 0.0, "circuit_open": False}
+
+
+def test_background_threads_wait_for_the_bucket(stub, limiter):
+    Stub.risky = False
+    limiter.limits["api"] = (0.8, 1)
+    BilibiliApi._limited_get(stub, None)
+
+    # 主线程（界面）不等待超过 1 秒
+    with pytest.raises(RateLimitedError):
+        BilibiliApi._limited_get(stub, None)
+
+    result = {}
+
+    def worker():
+        started = time.perf_counter()
+        result["response"] = BilibiliApi._limited_get(stub, None)
+        result["waited"] = time.perf_counter() - started
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    assert result["response"].status_code == 200
+    assert result["waited"] >= 1.0
+
+
+def test_probe_without_response_does_not_block_the_host(stub, limiter):
+    for _ in range(3):
+        BilibiliApi._limited_get(stub, None)
+    with pytest.raises(CircuitOpenError):
+        BilibiliApi._limited_get(stub, None)
+
+    # 冷却期结束后的试探请求没有得到响应
+    Stub.drop = True
+    time.sleep(0.55)
+    with pytest.raises(Exception) as error:
+        BilibiliApi._limited_get(stub, None)
+    assert not isinstance(error.value, CircuitOpenError)
+
+    # 下一个请求立即重新试探，而不是等到 backoff_max
+    Stub.drop, Stub.risky = False, False
+    assert BilibiliApi._limited_get(stub, None).status_code == 200
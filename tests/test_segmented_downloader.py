@@ -0,0 +1,147 @@
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from DownloadManifest import DownloadManifest
+from MirrorStats import MirrorStats
+from SegmentedDownloader import DownloadError, SegmentedDownloader
+
+SIZE = 2 * 1024 * 1024 + 12345
+PAYLOAD = os.urandom(SIZE)
+SEGMENT = 64 * 1024
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """范围请求服务器；token 不在 valid 中时返回 403（模拟签名地址过期）
+
+    expire_after: 旧 token 在服务了这么多个分段请求后失效，然后 renewed 成为有效的 token
+    """
+
+    protocol_version = "HTTP/1.1"
+    valid = {"old"}
+    expire_after = None
+    renewed = "new"
+    requests = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        token = parse_qs(urlparse(self.path).query).get("token", [""])[0]
+        range_header = self.headers.get("Range", "")
+        cls = type(self)
+        with cls.lock:
+            cls.requests.append((token, range_header))
+            served = sum(1 for t, r in cls.requests if t == "old" and r != "bytes=0-0")
+            if cls.expire_after is not None and served > cls.expire_after:
+                cls.valid = {cls.renewed}
+            allowed = token in cls.valid
+        if not allowed:
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        match = re.match(r"bytes=(\d+)-(\d*)", range_header)
+        start, end = int(match.group(1)), min(int(match.group(2) or SIZE - 1), SIZE - 1)
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{SIZE}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        try:
+            self.wfile.write(PAYLOAD[start:end + 1])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+@pytest.fixture
+def base():
+    RangeHandler.valid, RangeHandler.expire_after, RangeHandler.requests = {"old"}, None, []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/video.m4s"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stats(tmp_path):
+    return MirrorStats(db_path=str(tmp_path / "mirrors.db"))
+
+
+def segment_requests():
+    return [r for _, r in RangeHandler.requests if r != "bytes=0-0"]
+
+
+def test_segments_are_reassembled_in_place(base, stats, tmp_path):
+    path = str(tmp_path / "video.m4s")
+    downloader = SegmentedDownloader(f"{base}?token=old", path, min_segment=SEGMENT, stats=stats)
+    assert downloader.run() == SIZE
+    with open(path, "rb") as f:
+        assert f.read() == PAYLOAD
+    assert len(downloader.segments) > 4
+    assert len(segment_requests()) == len(downloader.segments)
+    assert all(segment.state == "done" for segment in downloader.segments)
+
+
+def test_resume_downloads_only_missing_ranges(base, stats, tmp_path):
+    path = str(tmp_path / "video.m4s")
+    half = SIZE // 2
+    # 上次中断时写完了前一半
+    with open(path, "wb") as f:
+        f.write(PAYLOAD[:half] + b"\0" * (SIZE - half))
+    manifest = DownloadManifest(path)
+    manifest.size, manifest.etag = SIZE, '"v1"'
+    manifest.add_range(0, half - 1)
+    manifest.save()
+
+    manifest = DownloadManifest.load(path)
+    downloader = SegmentedDownloader(f"{base}?token=old", path, min_segment=SEGMENT,
+                                     manifest=manifest, stats=stats)
+    assert downloader.run() == SIZE
+    with open(path, "rb") as f:
+        assert f.read() == PAYLOAD
+    starts = [int(r[6:].split("-")[0]) for r in segment_requests()]
+    assert starts and min(starts) == half
+    assert not os.path.exists(manifest.path)
+
+
+def test_expired_url_is_resolved_again_mid_download(base, stats, tmp_path):
+    RangeHandler.expire_after = 3
+    resolved = []
+
+    def url_resolver():
+        resolved.append(True)
+        return [f"{base}?token=new"]
+
+    path = str(tmp_path / "video.m4s")
+    downloader = SegmentedDownloader(f"{base}?token=old", path, min_segment=SEGMENT, initial_workers=1,
+                                     url_resolver=url_resolver, stats=stats)
+    downloader.run()
+    with open(path, "rb") as f:
+        assert f.read() == PAYLOAD
+    assert resolved == [True]
+    assert downloader.urls == [f"{base}?token=new"]
+    assert any(token == "new" for token, _ in RangeHandler.requests)
+
+
+class ClosedPipe:
+    """输出端已经退出的管道"""
+
+    position = 0
+
+    def write_at(self, offset, data):
+        raise BrokenPipeError("ffmpeg 已退出")
+
+
+def test_closed_output_pipe_is_not_a_mirror_failure(base, stats):
+    url = f"{base}?token=old"
+    downloader = SegmentedDownloader(url, None, min_segment=SEGMENT, sink=ClosedPipe(), stats=stats)
+    with pytest.raises(DownloadError, match="输出管道已关闭"):
+        downloader.run()
+    assert stats.get(url)["failures"] == 0
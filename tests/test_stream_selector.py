@@ -0,0 +1,31 @@
+import BilibiliApi
+import StreamSelector
+from StreamSelector import QN_1080P, QN_480P, ThroughputEstimator
+
+DASH = {
+    "video": [
+        {"id": QN_1080P, "codecid": 7, "bandwidth": 3_000_000, "baseUrl": "https://cdn/1080.m4s"},
+        {"id": QN_480P, "codecid": 7, "bandwidth": 600_000, "baseUrl": "https://cdn/480.m4s"},
+    ],
+    "audio": [{"id": 30280, "codecid": 0, "bandwidth": 128_000, "baseUrl": "https://cdn/audio.m4s"}],
+}
+
+
+def slow_estimator(monkeypatch):
+    estimator = ThroughputEstimator()
+    estimator.update(125_000, 1.0)  # 1 Mbps
+    monkeypatch.setattr(StreamSelector, "throughput_estimator", estimator)
+
+
+def test_playback_selection_follows_throughput(monkeypatch):
+    slow_estimator(monkeypatch)
+    videos, _ = StreamSelector.StreamSelector(DASH).select(QN_1080P)
+    assert videos[0].id == QN_480P
+
+
+def test_download_keeps_the_requested_quality(monkeypatch):
+    slow_estimator(monkeypatch)
+    monkeypatch.setattr(BilibiliApi, "resolve_playurl", lambda *args, **kwargs: {"dash": DASH})
+    videos, audios = BilibiliApi.Download()._select_streams("BV1GJ411x7h7", 1001, QN_1080P, StreamSelector.DEFAULT_CODECS)
+    assert videos[0].id == QN_1080P
+    assert audios[0].bandwidth == 128_000
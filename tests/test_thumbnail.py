@@ -0,0 +1,118 @@
+import os
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import Thumbnail
+from Thumbnail import MAX_WIDTH, thumbnail_size, thumbnail_url
+
+PIC = "https://i0.hdslb.com/bfs/archive/cover.jpg"
+
+
+def test_size_rounds_up_to_the_step():
+    assert thumbnail_size(270, 150) == (280, 160)
+    assert thumbnail_size(280, 160) == (280, 160)
+    assert thumbnail_size(270, 150, ratio=2.0) == (540, 300)
+    # 337.5 x 187.5 像素先向上取整，再取整到 20 的倍数
+    assert thumbnail_size(270, 150, ratio=1.25) == (340, 200)
+    assert thumbnail_size(0, 0) == (20, 20)
+
+
+def test_size_is_capped_at_max_width():
+    assert thumbnail_size(1500, 900, ratio=2.0) == (MAX_WIDTH, 1160)
+    assert thumbnail_size(4000, 100) == (MAX_WIDTH, 60)
+
+
+def test_url_appends_size_and_format():
+    assert thumbnail_url(PIC, 280, 160) == PIC + "@280w_160h_1c.webp"
+    assert thumbnail_url(PIC, 280, 160, fmt="jpg") == PIC + "@280w_160h_1c.jpg"
+    assert thumbnail_url("https://i1.biliimg.com/bfs/a.png?x=1", 40, 40) == "https://i1.biliimg.com/bfs/a.png@40w_40h_1c.webp?x=1"
+
+
+def test_url_replaces_an_existing_suffix():
+    assert thumbnail_url(PIC + "@100w_100h_1c.jpg", 280, 160) == PIC + "@280w_160h_1c.webp"
+    assert thumbnail_url(PIC + "@.webp", 280, 160) == PIC + "@280w_160h_1c.webp"
+
+
+def test_url_passes_other_hosts_through():
+    for url in ("https://example.com/cover.jpg", "https://nothdslb.com/cover.jpg", "./img/none.png", "", None):
+        assert thumbnail_url(url, 280, 160) == url
+
+
+def test_url_accepts_scheme_relative_urls():
+    assert thumbnail_url("//i2.hdslb.com/bfs/face/me.png", 60, 60) == "https://i2.hdslb.com/bfs/face/me.png@60w_60h_1c.webp"
+
+
+class CoverHandler(BaseHTTPRequestHandler):
+    """封面替身：记录请求的地址，返回一张 PNG"""
+
+    paths = []
+    body = b""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+
+def test_video_controller_requests_covers_at_the_card_size(monkeypatch, tmp_path):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
+    from PyQt5.QtGui import QColor, QImage
+    from PyQt5.QtWidgets import QApplication
+
+    # 界面模块导入时就会创建 Qt 对象，先创建 QApplication
+    app = QApplication.instance() or QApplication([])
+    # VideoController 经 VideoWidget 导入 VideoPlayer（QtMultimedia），缺少多媒体库时跳过
+    VideoController = pytest.importorskip("VideoController", exc_type=ImportError)
+    import AsyncBilibiliApi
+    from MediaStore import MediaStore
+
+    image = QImage(16, 9, QImage.Format_RGB32)
+    image.fill(QColor(30, 60, 120))
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, "PNG")
+    CoverHandler.body, CoverHandler.paths = bytes(data), []
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CoverHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    pic = f"http://127.0.0.1:{server.server_port}/bfs/archive/cover.jpg"
+
+    async def load_recommend_page(page, pagesize):
+        return [{"title": "标题", "pic": pic, "owner": {"name": "UP"}, "bvid": "BV1GJ411x7h7", "cid": 1}]
+
+    # 本地服务器冒充图片 CDN
+    monkeypatch.setattr(Thumbnail, "RESIZE_HOSTS", Thumbnail.RESIZE_HOSTS + ("127.0.0.1",))
+    monkeypatch.setattr(VideoController, "load_recommend_page", load_recommend_page)
+    monkeypatch.setattr(AsyncBilibiliApi, "media_store", MediaStore(root=str(tmp_path / "store")))
+    # 卡片用相对路径 ./img/ 下的图标
+    shutil.copytree(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "img"), tmp_path / "img")
+
+    controller = VideoController.VideoController()
+    controller.resize(1150, 650)
+    loaded = []
+    controller.cover_loaded.connect(lambda index, path: loaded.append((index, path)))
+    deadline = time.monotonic() + 10
+    while not loaded and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.02)
+    controller._is_alive = False
+    server.shutdown()
+    server.server_close()
+
+    card_width, card_height = controller.calculate_widget_size()
+    width, height = thumbnail_size(int(card_width * 0.9), int(card_height * 0.714), controller.devicePixelRatioF())
+    assert CoverHandler.paths == [f"/bfs/archive/cover.jpg@{width}w_{height}h_1c.webp"]
+    assert controller.thumb_size == (width, height)
+    assert loaded and loaded[0][0] == 0 and os.path.exists(loaded[0][1])
@@ -0,0 +1,43 @@
+from wbiSigned import WbiSigner, _mixin_key, encWbi, getMixinKey
+
+IMG_KEY, SUB_KEY = '7cd084941338484aae1ad9425b84077c', '4932caff0ff746eab6f01bf08b70ac45'
+
+
+def test_signer_matches_encwbi():
+    signer = WbiSigner(IMG_KEY, SUB_KEY)
+    for i in range(20):
+        params = {'bvid': f'BV1aAhPzdE{i:02d}', 'cid': 31374511005 + i, 'qn': 112, 'fnval': 4048,
+                  'fourk': 1, 'keyword': "中文 (test)!*"}
+        expected = encWbi(dict(params), IMG_KEY, SUB_KEY)
+        assert signer.sign(params, wts=expected['wts']) == {k: str(v) for k, v in expected.items()}
+
+
+def test_existing_wts_is_replaced():
+    signer = WbiSigner(IMG_KEY, SUB_KEY)
+    params = {'bvid': 'BV1aAhPzdEJ8', 'wts': 1700000000}
+    expected = encWbi(dict(params), IMG_KEY, SUB_KEY)
+    signed = signer.sign(params, wts=expected['wts'])
+    assert signed == {k: str(v) for k, v in expected.items()}
+    assert params['wts'] == 1700000000
+    # 重新签名（例如刷新过期的签名）与从原始参数签名的结果相同
+    assert signer.sign(signed, wts=1800000000) == signer.sign(params, wts=1800000000)
+    assert [s['wts'] for s in signer.sign_many([params, signed], wts=1800000001)] == ['1800000001'] * 2
+
+
+def test_sign_many_matches_individual_signing():
+    signer = WbiSigner(IMG_KEY, SUB_KEY)
+    batch = [{'bvid': f'BV1aAhPzdE{i:02d}', 'cid': 100 + i, 'keyword': "a b(c)"} for i in range(10)]
+    signed = signer.sign_many(batch, wts=1700000000)
+    assert signed == [signer.sign(params, wts=1700000000) for params in batch]
+    # 不指定 wts 时同一批共用一个时间戳
+    assert len({s['wts'] for s in signer.sign_many(batch)}) == 1
+
+
+def test_mixin_key_is_computed_once_per_key_pair():
+    _mixin_key.cache_clear()
+    signers = [WbiSigner(IMG_KEY, SUB_KEY) for _ in range(5)]
+    info = _mixin_key.cache_info()
+    assert (info.misses, info.hits) == (1, 4)
+    assert all(signer.mixin_key == getMixinKey(IMG_KEY + SUB_KEY) for signer in signers)
+    WbiSigner(SUB_KEY, IMG_KEY)
+    assert _mixin_key.cache_info().misses == 2
@@ -1,8 +1,12 @@
-from functools import reduce
+from functools import lru_cache, reduce
 from hashlib import md5
+import json
+import os
+import threading
 import urllib.parse
 import time
-import requests
+
+import HttpClient as http
 
 mixinKeyEncTab = [
     46, 47, 18, 2, 53, 8, 23, 32, 15, 50, 10, 31, 58, 3, 45, 35, 27, 43, 5, 49,
@@ -32,13 +36,54 @@ def encWbi(params: dict, img_key: str, sub_key: str):
     params['w_rid'] = wbi_sign
     return params
 
+# 过滤 value 中 "!'()*" 字符的转换表
+_STRIP_TABLE = str.maketrans('', '', "!'()*")
+
+@lru_cache(maxsize=16)
+def _mixin_key(img_key: str, sub_key: str):
+    '按 (img_key, sub_key) 缓存的 mixin key'
+    orig = img_key + sub_key
+    return ''.join([orig[i] for i in mixinKeyEncTab])[:32]
+
+@lru_cache(maxsize=256)
+def _quote_key(key: str):
+    return urllib.parse.quote_plus(key)
+
+class WbiSigner:
+    '''固定 img_key/sub_key 的 wbi 签名器，结果与 encWbi 一致'''
+
+    def __init__(self, img_key: str, sub_key: str):
+        self.img_key = img_key
+        self.sub_key = sub_key
+        self.mixin_key = _mixin_key(img_key, sub_key)
+
+    def _sign(self, params: dict, wts: int):
+        # 已签名的参数重新签名时，旧的 wts 和 w_rid 不参与计算（wts 被本次的时间戳覆盖）
+        items = [(k, str(v).translate(_STRIP_TABLE)) for k, v in params.items() if k not in ('wts', 'w_rid')]
+        items.append(('wts', str(wts)))
+        items.sort()
+        # 纯字母数字的值无需转义，跳过 quote_plus
+        query = '&'.join([
+            _quote_key(k) + '=' + (v if v.isascii() and v.isalnum() else urllib.parse.quote_plus(v))
+            for k, v in items
+        ])
+        signed = dict(items)
+        signed['w_rid'] = md5((query + self.mixin_key).encode()).hexdigest()
+        return signed
+
+    def sign(self, params: dict, wts: int = None):
+        '''返回签名后的新参数字典（不修改传入的字典）'''
+        return self._sign(params, round(time.time()) if wts is None else wts)
+
+    def sign_many(self, params_list, wts: int = None):
+        '''批量签名，同一批请求共用一个 wts'''
+        wts = round(time.time()) if wts is None else wts
+        sign = self._sign
+        return [sign(params, wts) for params in params_list]
+
 def getWbiKeys():
     '获取最新的 img_key 和 sub_key'
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3',
-        'Referer': 'https://www.bilibili.com/'
-    }
-    resp = requests.get('https://api.bilibili.com/x/web-interface/nav', headers=headers)
+    resp = http.get('https://api.bilibili.com/x/web-interface/nav')
     resp.raise_for_status()
     json_content = resp.json()
     img_url: str = json_content['data']['wbi_img']['img_url']
@@ -47,6 +92,84 @@ def getWbiKeys():
     sub_key = sub_url.rsplit('/', 1)[1].split('.')[0]
     return img_key, sub_key
 
+class WbiKeyManager:
+    '''缓存 img_key/sub_key：每天刷新一次（或签名被拒时刷新），并持久化到磁盘'''
+
+    def __init__(self, cache_path='./cache/wbi_keys.json', max_age=24 * 3600):
+        self.cache_path = cache_path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._img_key = None
+        self._sub_key = None
+        self._signer = None
+        self._fetched_at = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            self._set_keys(saved['img_key'], saved['sub_key'], saved['fetched_at'])
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _save(self):
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'img_key': self._img_key,
+                'sub_key': self._sub_key,
+                'fetched_at': self._fetched_at,
+            }, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _set_keys(self, img_key, sub_key, fetched_at):
+        self._img_key = img_key
+        self._sub_key = sub_key
+        self._fetched_at = fetched_at
+        # mixin key 只在密钥变化时计算一次
+        self._signer = WbiSigner(img_key, sub_key)
+
+    def is_fresh(self):
+        return self._signer is not None and time.time() - self._fetched_at < self.max_age
+
+    def get_keys(self, force=False):
+        '''返回 (img_key, sub_key)，过期或 force=True 时重新获取'''
+        with self._lock:
+            if force or not self.is_fresh():
+                img_key, sub_key = getWbiKeys()
+                self._set_keys(img_key, sub_key, time.time())
+                try:
+                    self._save()
+                except OSError as e:
+                    print(f'保存 wbi 密钥失败: {str(e)}')
+            return self._img_key, self._sub_key
+
+    def signer(self):
+        self.get_keys()
+        return self._signer
+
+    def mixin_key(self):
+        return self.signer().mixin_key
+
+    def invalidate(self):
+        '''签名被服务器拒绝时调用，下次签名会重新获取密钥'''
+        with self._lock:
+            self._fetched_at = 0
+
+    def sign(self, params: dict):
+        '''返回签名后的新参数字典（不修改传入的字典）'''
+        return self.signer().sign(params)
+
+    def sign_many(self, params_list):
+        return self.signer().sign_many(params_list)
+
+# 进程内共享的密钥管理器
+wbi_keys = WbiKeyManager()
+
 # img_key, sub_key = getWbiKeys()
 
 # signed_params = encWbi(